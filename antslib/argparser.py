@@ -11,7 +11,8 @@ import os
 import subprocess
 import sys
 
-from antslib import configer
+from antslib import configer, daemon, logrotate, profiler, schedule, status
+from antslib.inventory import helper
 
 
 class InitializeAntsAction(argparse.Action):
@@ -31,28 +32,80 @@ class InitializeAntsAction(argparse.Action):
 
 
 class GetStatusAction(argparse.Action):
-    """Print ants status to stdout and exit."""
+    """Print ants status to stdout and exit.
 
-    def __init__(self, option_strings, logfile, dest, nargs=None, **kwargs):
+    The status is taken from the ants daemon, if one is running, or else
+    from the status snapshot of the last run. If there is no snapshot,
+    the recap log is parsed instead. With history, the recaps of all runs
+    in the recap log and its rotated files are printed.
+    """
+
+    def __init__(
+        self,
+        option_strings,
+        logfile,
+        statusfile,
+        socket_path,
+        dest,
+        nargs=None,
+        **kwargs,
+    ):
         self.logfile = logfile
+        self.statusfile = statusfile
+        self.socket_path = socket_path
         super(GetStatusAction, self).__init__(
             option_strings, dest, nargs=nargs, **kwargs
         )
 
     def __call__(self, parser, namespace, values, option_string=None):
-        status = "failed"
-        logfile = self.logfile
-        if os.path.isfile(logfile):
-            with open(logfile, "r") as f:
-                status = "Last Run: \n"
+        if values in ("history", "h"):
+            sys.stdout.write(self.read_recap_history())
+            parser.exit()
+        reply = daemon.query(self.socket_path, "status")
+        snapshot = reply.get("snapshot") if reply else None
+        if snapshot is None:
+            snapshot = status.read_status(self.statusfile)
+        if snapshot is None:
+            output = self.parse_recap_log(values)
+        elif values:
+            output = "Last Run: \n"
+            for line in snapshot["recap"]:
+                if "*" not in line:
+                    output += "%s\n" % line
+        else:
+            output = snapshot["status"]
+        sys.stdout.write("%s\n" % output)
+        parser.exit()
+
+    def parse_recap_log(self, values):
+        """Return status from the recap log file."""
+        client_status = "failed"
+        # The recap log of the last run or its latest rotated file
+        logfiles = logrotate.history(self.logfile)
+        if logfiles:
+            with logrotate.open_log(logfiles[0]) as f:
+                client_status = "Last Run: \n"
                 for line in f:
                     if values and "*" not in line:
                         date, line = line.split("\t")
-                        status += "{line}".format(line=line)
+                        client_status += "{line}".format(line=line)
                     if not values and "Client status:" in line:
-                        status = line.rstrip().split("Client status:")[1].split()[0]
-        sys.stdout.write("%s\n" % status)
-        parser.exit()
+                        client_status = (
+                            line.rstrip().split("Client status:")[1].split()[0]
+                        )
+        return client_status
+
+    def read_recap_history(self):
+        """Return the recaps of all logged runs, latest first."""
+        output = ""
+        for logfile in logrotate.history(self.logfile):
+            output += "Run logged in %s:\n" % os.path.basename(logfile)
+            with logrotate.open_log(logfile) as f:
+                for line in f:
+                    if "*" not in line:
+                        output += line.split("\t", 1)[-1]
+            output += "\n"
+        return output
 
 
 class ShowConfigAction(argparse.Action):
@@ -74,14 +127,55 @@ class ShowConfigAction(argparse.Action):
         parser.exit()
 
 
+class GetProfileAction(argparse.Action):
+    """Print the slowest tasks and roles of the last run and exit."""
+
+    def __init__(self, option_strings, profile_dir, dest, nargs=None, **kwargs):
+        self.profile_dir = profile_dir
+        super(GetProfileAction, self).__init__(
+            option_strings, dest, nargs=nargs, **kwargs
+        )
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        profiles = profiler.read_profiles(self.profile_dir)
+        sys.stdout.write("%s\n" % profiler.report(profiles, top=values))
+        parser.exit()
+
+
+class SimulateSplayAction(argparse.Action):
+    """Print when N hosts would start their runs and exit."""
+
+    def __init__(self, option_strings, interval, dest, nargs=None, **kwargs):
+        self.interval = interval
+        super(SimulateSplayAction, self).__init__(
+            option_strings, dest, nargs=nargs, **kwargs
+        )
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        hostnames = ["host%d.example.com" % i for i in range(values)]
+        for title, randomize in (("Host offset", False), ("Random splay", True)):
+            counts = schedule.simulate(hostnames, self.interval, randomize=randomize)
+            sys.stdout.write(
+                "%s, %s hosts:\n%s\n\n"
+                % (title, values, schedule.histogram(counts, self.interval))
+            )
+        parser.exit()
+
+
 class GetGroupsAction(argparse.Action):
-    """Execute inventory script and exit."""
+    """Print the inventory and exit.
+
+    Known inventory scripts are resolved in-process, others are executed."""
 
     def __init__(self, option_strings, inventory_script, dest, nargs=None, **kwargs):
         self.inventory_script = inventory_script
         super(GetGroupsAction, self).__init__(option_strings, dest, nargs=0, **kwargs)
 
     def __call__(self, parser, namespace, values, option_string=None):
+        inventory = helper.resolve_inventory(self.inventory_script)
+        if inventory is not None:
+            sys.stdout.write("%s\n" % helper.format_output(inventory))
+            parser.exit()
         cmd = [self.inventory_script]
         proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         (out, err) = proc.communicate()
@@ -170,11 +264,32 @@ def parse_args(version, LOG_RECAP, DESTINATION, CFG):
     parser.add_argument(
         "-s",
         "--status",
-        help="Print status of last run and exit. With verbose specified, more information is gathered and returned.",
+        help="Print status of last run and exit. With verbose specified, more information is gathered and returned. "
+        "With history specified, the recaps of previous runs are returned as well.",
         action=GetStatusAction,
         logfile=LOG_RECAP,
+        statusfile=os.path.join(CFG["log_dir"], "status.json"),
+        socket_path=CFG["control_socket"],
+        nargs="?",
+        choices=["verbose", "v", "history", "h"],
+    )
+    parser.add_argument(
+        "--profile",
+        help="Print the N slowest tasks and roles of the last run and exit. Default: 10",
+        action=GetProfileAction,
+        profile_dir=os.path.join(CFG["log_dir"], "profiles"),
         nargs="?",
-        choices=["verbose", "v"],
+        type=int,
+        const=10,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--simulate-splay",
+        help="Print when N hosts would start their runs within wait_interval and exit",
+        action=SimulateSplayAction,
+        interval=int(CFG["wait_interval"]),
+        type=int,
+        metavar="N",
     )
     parser.add_argument(
         "-g",
@@ -219,9 +334,23 @@ def parse_args(version, LOG_RECAP, DESTINATION, CFG):
         ),
         action=InitializeAntsAction,
     )
+    parser.add_argument(
+        "--daemon",
+        help="Stay resident and run ants every wait_interval seconds.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--run-now",
+        help="Ask the ants daemon to run now. Run directly if no daemon is running.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--source",
+        help="Run only the playbook source of the config section [source:SOURCE].",
+    )
     parser.add_argument(
         "--refresh",
-        help="Delete the local git repo to force a git clone by ansible-pull.",
+        help="Reset the local git repo to the remote branch, discarding local changes.",
         action="store_true",
     )
 
@@ -259,7 +388,7 @@ def parse_args(version, LOG_RECAP, DESTINATION, CFG):
     parser.add_argument(
         "-w",
         "--wait",
-        help="Wait a random interval before starting ansible-pull",
+        help="Wait for the run slot of this host within wait_interval",
         action="store_true",
     )
     parser.add_argument(
@@ -289,6 +418,18 @@ def parse_args(version, LOG_RECAP, DESTINATION, CFG):
         type=str2bool,
         default=CFG["ssh_stricthostkeychecking"],
     )
+    parser.add_argument(
+        "--prerender_inventory",
+        help="Enable/Disable resolving known inventory scripts before ansible-pull.",
+        type=str2bool,
+        default=CFG["prerender_inventory"],
+    )
+    parser.add_argument(
+        "--skip_unchanged",
+        help="Enable/Disable skipping runs if nothing changed since the last run.",
+        type=str2bool,
+        default=CFG["skip_unchanged"],
+    )
     parser.add_argument(
         "--ansible_pull_exe",
         help="Path to the ansible-pull executable",
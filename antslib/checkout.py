@@ -0,0 +1,123 @@
+"""checkout
+================
+
+Prepare the local checkout of the playbook repository.
+
+ansible-pull can only clone the repository as a whole. ants clones it
+beforehand, so clone depth, a sparse checkout and a local reference
+mirror can be used. ansible-pull then only updates the existing
+checkout.
+
+A reference mirror is a bare clone shared by several checkouts. Objects
+found in the mirror are borrowed from it instead of being downloaded and
+stored again. The checkouts keep using the objects of the mirror, so the
+mirror must not be deleted, and it is configured to never prune
+unreachable objects.
+"""
+
+
+import os
+import subprocess
+
+
+class CheckoutError(Exception):
+    """Raised if a git command fails."""
+
+
+def git(cmd, env=None, timeout=600):
+    """Run git with the arguments in cmd and return its output.
+
+    Raise CheckoutError if git fails."""
+    try:
+        proc = subprocess.run(
+            ["git"] + cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            timeout=timeout,
+        )
+    except (OSError, subprocess.TimeoutExpired) as error:
+        raise CheckoutError("git %s: %s" % (" ".join(cmd), error))
+    if proc.returncode != 0:
+        raise CheckoutError(
+            "git %s: %s" % (" ".join(cmd), proc.stderr.decode("utf-8").strip())
+        )
+    return proc.stdout.decode("utf-8")
+
+
+def is_checkout(destination):
+    return os.path.isdir(os.path.join(destination, ".git"))
+
+
+def update_mirror(mirror, git_repo, env=None):
+    """Create the bare reference mirror or fetch into it.
+
+    Checkouts borrow objects from the mirror, so gc must never prune
+    objects that are no longer reachable from its own refs.
+    """
+    if os.path.isdir(mirror):
+        git(["-C", mirror, "fetch", "--prune", "origin"], env)
+    else:
+        git(["clone", "--mirror", git_repo, mirror], env)
+    git(["-C", mirror, "config", "gc.pruneExpire", "never"], env)
+
+
+def set_sparse_paths(destination, sparse_paths, env=None):
+    """Limit the working tree of destination to sparse_paths.
+
+    Files in the top directory, like the playbook, are always checked out.
+    An empty list disables the sparse checkout.
+    """
+    if sparse_paths:
+        git(["-C", destination, "sparse-checkout", "set"] + sparse_paths, env)
+    else:
+        git(["-C", destination, "sparse-checkout", "disable"], env)
+
+
+def clone(
+    destination, git_repo, branch, depth=1, sparse_paths=None, mirror=None, env=None
+):
+    """Clone branch of git_repo to destination.
+
+    depth limits the history to the given number of commits, 0 clones the
+    full history. Objects of the reference mirror are borrowed if possible.
+    """
+    cmd = ["clone", "--branch", branch]
+    if depth > 0:
+        cmd += ["--depth", str(depth)]
+    if mirror:
+        cmd += ["--reference-if-able", mirror]
+    if sparse_paths:
+        cmd += ["--filter=blob:none", "--no-checkout"]
+    git(cmd + [git_repo, destination], env)
+    if sparse_paths:
+        set_sparse_paths(destination, sparse_paths, env)
+        git(["-C", destination, "checkout", branch], env)
+
+
+def is_sparse(destination, env=None):
+    try:
+        value = git(["-C", destination, "config", "--get", "core.sparseCheckout"], env)
+    except CheckoutError:
+        return False
+    return value.strip() == "true"
+
+
+def resync(destination, branch, depth=1, sparse_paths=None, env=None):
+    """Reset an existing checkout to the head of the remote branch.
+
+    Local changes and untracked files are removed. Only missing objects
+    are fetched.
+    """
+    cmd = ["-C", destination, "fetch", "--prune"]
+    if depth > 0:
+        cmd += ["--depth", str(depth)]
+    git(cmd + ["origin", branch], env)
+    if sparse_paths or is_sparse(destination, env):
+        set_sparse_paths(destination, sparse_paths, env)
+    git(["-C", destination, "checkout", "--force", "-B", branch, "FETCH_HEAD"], env)
+    git(["-C", destination, "clean", "-ffdx"], env)
+
+
+if __name__ == "__main__":
+    pass
@@ -3,16 +3,14 @@
 
 Handle parsing of configuraiton file options.
 """
-from __future__ import print_function
 
 
-from future import standard_library
-
-standard_library.install_aliases()
-from builtins import input
 import configparser
+import json
 import os
 import re
+import tempfile
+from types import MappingProxyType
 
 try:
     from antslib import macos_prefs
@@ -23,6 +21,13 @@ except ImportError:
 
 _ROOT = os.path.abspath(os.path.dirname(__file__))
 
+CONFIG_PATH = "/etc/ants/"
+CONFIG_DROP_IN_PATH = os.path.join(CONFIG_PATH, "conf.d")
+CONFIG_CACHE_VERSION = 1
+
+# Config snapshots of this process by config file name
+_SNAPSHOTS = {}
+
 
 def is_root():
     """Check if user is root and return True or False."""
@@ -39,35 +44,168 @@ def create_dir(dir_name):
     os.chown(dir_name, uid, gid)
 
 
-def read_config(config_section, config_file="ants.cfg"):
-    """Read indicated configuraton section and return a dict.
+def config_sources(config_file="ants.cfg"):
+    """Return the config files to read, from lowest to highest precedence.
 
-    Uses config.optionxform to preserver upper/lower case letters
-    in config file.
+    These are the packaged defaults, the system config and all drop-in
+    files in the conf.d directory, sorted by name.
     """
-
     default_config = os.path.join(_ROOT, "etc", config_file)
-    config_path = "/etc/ants/"
-    system_config = os.path.join(config_path, config_file)
-
     if not os.path.isfile(default_config):
         raise OSError("Default config file not found at %s" % default_config)
-
+    sources = [default_config, os.path.join(CONFIG_PATH, config_file)]
+    try:
+        drop_ins = sorted(os.listdir(CONFIG_DROP_IN_PATH))
+    except OSError:
+        drop_ins = []
+    sources += [
+        os.path.join(CONFIG_DROP_IN_PATH, name)
+        for name in drop_ins
+        if name.endswith(".cfg") and not name.startswith(".")
+    ]
+    return sources
+
+
+def _fingerprint(sources):
+    """Return modification time and size of all sources and the conf.d dir."""
+    fingerprint = []
+    for source in sources + [CONFIG_DROP_IN_PATH]:
+        try:
+            stat = os.stat(source)
+            fingerprint.append([source, stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            fingerprint.append([source, None, None])
+    return fingerprint
+
+
+def _parse_sources(sources):
+    """Parse all config files and return a dict of sections.
+
+    Uses config.optionxform to preserve upper/lower case letters
+    in config files. A file that can not be parsed is ignored.
+    """
     config = configparser.ConfigParser(strict=False)
     config.optionxform = str
+    for source in sources:
+        try:
+            with open(source, "r") as f:
+                content = f.read()
+        except OSError:
+            continue
+        # Parse every file on its own first, so a broken file can not
+        # leave half of its content in the config
+        check = configparser.ConfigParser(strict=False)
+        try:
+            check.read_string(content, source=source)
+        except configparser.Error:
+            print("Error while reading configuration from %s." % source)
+            print("Ignoring this configuration file")
+            continue
+        config.read_string(content, source=source)
+    return {section: dict(config.items(section)) for section in config.sections()}
+
+
+def _read_compiled(cache_file, fingerprint):
+    """Return the sections stored in cache_file if it matches fingerprint."""
+    try:
+        with open(cache_file, "r") as f:
+            compiled = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (
+        not isinstance(compiled, dict)
+        or compiled.get("version") != CONFIG_CACHE_VERSION
+        or compiled.get("sources") != fingerprint
+    ):
+        return None
+    return compiled.get("config")
+
+
+def _write_compiled(cache_file, fingerprint, sections):
+    """Store the parsed sections along with the fingerprint of the sources."""
+    compiled = {
+        "version": CONFIG_CACHE_VERSION,
+        "sources": fingerprint,
+        "config": sections,
+    }
+    # The file is only readable by its owner, as the config holds secrets
+    try:
+        fd, tmp_file = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(cache_file)), prefix=".config."
+        )
+    except OSError:
+        return
     try:
-        config.read([default_config, system_config])
-    except configparser.MissingSectionHeaderError as missing_section_error:
-        configparser.ParsingError = missing_section_error
-        print("Error while reading configuration from %s." % system_config)
-        print("Ignoring system configuraiton")
-        config.read([default_config])
+        with os.fdopen(fd, "w") as f:
+            json.dump(compiled, f)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        os.remove(tmp_file)
 
-    config_dict = dict(config.items(config_section))
 
-    if use_macos_prefs:
-        macos_dict = macos_prefs.read_prefs(config_section)
-        config_dict = macos_prefs.merge_dicts(config_dict, macos_dict)
+def _apply_overrides(sections):
+    """Apply macOS preferences and environment variables to sections.
+
+    An option is overwritten by the environment variable
+    ANTS_<SECTION>_<OPTION>, e.g. ANTS_MAIN_LOG_DIR.
+    """
+    for section, options in sections.items():
+        if use_macos_prefs:
+            macos_dict = macos_prefs.read_prefs(section)
+            options = macos_prefs.merge_dicts(options, macos_dict)
+        for key in options:
+            env_key = ("ANTS_%s_%s" % (section, key)).upper()
+            if env_key in os.environ:
+                options[key] = os.environ[env_key]
+        sections[section] = options
+    return sections
+
+
+def load_config(config_file="ants.cfg"):
+    """Return a read-only snapshot of all config sections.
+
+    All layers are read only once per process. The layers are, from
+    lowest to highest precedence: packaged defaults, the system config,
+    conf.d drop-ins, macOS preferences and environment variables.
+
+    If the environment variable ANTS_CONFIG_CACHE names a file, the parsed
+    config files are stored there and reused as long as none of them
+    changed.
+    """
+    if config_file in _SNAPSHOTS:
+        return _SNAPSHOTS[config_file]
+
+    sources = config_sources(config_file)
+    cache_file = os.environ.get("ANTS_CONFIG_CACHE")
+    sections = None
+    if cache_file:
+        fingerprint = _fingerprint(sources)
+        sections = _read_compiled(cache_file, fingerprint)
+    if sections is None:
+        sections = _parse_sources(sources)
+        if cache_file:
+            _write_compiled(cache_file, fingerprint, sections)
+
+    sections = _apply_overrides(sections)
+    snapshot = MappingProxyType(
+        {name: MappingProxyType(options) for name, options in sections.items()}
+    )
+    _SNAPSHOTS[config_file] = snapshot
+    return snapshot
+
+
+def clear_config_cache():
+    """Forget all snapshots, so the next read parses the config again."""
+    _SNAPSHOTS.clear()
+
+
+def read_config(config_section, config_file="ants.cfg"):
+    """Read indicated configuraton section and return a dict.
+
+    The dict is a copy of the section in the snapshot of load_config and
+    may be changed by the caller.
+    """
+    config_dict = dict(load_config(config_file)[config_section])
 
     # Add base search path to config
     # This is done to allow for easy append of custom paths while keeping the
@@ -128,12 +266,12 @@ def get_config():
 def write_config(config, config_file="ants.cfg"):
     """Writing ConfigParser object to local configuration.
     Existing files will be overwritten."""
-    config_path = "/etc/ants/"
-    system_config = os.path.join(config_path, config_file)
-    if not os.path.isdir(config_path):
-        create_dir(config_path)
+    system_config = os.path.join(CONFIG_PATH, config_file)
+    if not os.path.isdir(CONFIG_PATH):
+        create_dir(CONFIG_PATH)
     with open(system_config, "w") as cfg:
         config.write(cfg)
+    clear_config_cache()
 
 
 if __name__ == "__main__":
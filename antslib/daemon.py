@@ -0,0 +1,258 @@
+"""daemon
+==============
+
+Keep ants resident and run it on a schedule.
+
+The daemon runs ants every wait_interval seconds, at the offset of the
+host within the interval. Every run happens in a worker process forked
+from the daemon, so the modules of ants are imported only once, while
+each run still starts with a clean state.
+After failed runs, the next run is delayed further, up to max_backoff
+seconds. See antslib.schedule. The failed runs in a row are taken from
+the status snapshot at startup, so restarting the daemon does not reset
+the backoff.
+
+The daemon answers queries on a local Unix socket. A client sends one
+command per connection and receives one JSON object:
+
+* status: state of the daemon and the status snapshot of the last run
+* recap: the recap of the last run
+* run-now: start a run as soon as possible
+"""
+
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+from antslib import schedule, status
+
+# Shorter intervals would run ants back to back
+MIN_WAIT_INTERVAL = 60
+
+
+def query(socket_path, command, timeout=5):
+    """Send command to the daemon and return its reply as dict.
+
+    Return None if no daemon is listening on socket_path.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            client.sendall(("%s\n" % command).encode("utf-8"))
+            client.shutdown(socket.SHUT_WR)
+            data = b""
+            while True:
+                chunk = client.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        return json.loads(data.decode("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        command = self.rfile.readline(256).decode("utf-8", "replace").strip()
+        reply = self.server.daemon.handle(command)
+        self.wfile.write(("%s\n" % json.dumps(reply)).encode("utf-8"))
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def exit_status(code):
+    """Return the exit status for the code of SystemExit, like Python does."""
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+class Daemon(object):
+    """Run ants on a schedule and serve queries on socket_path.
+
+    run is called without arguments in a forked worker for every run and
+    returns the exit status of the run or raises SystemExit. status_file
+    is the status snapshot written by that run.
+
+    Raise ValueError if wait_interval is shorter than MIN_WAIT_INTERVAL.
+    """
+
+    def __init__(
+        self,
+        run,
+        status_file,
+        socket_path,
+        hostname,
+        wait_interval=900,
+        max_backoff=14400,
+        logger=None,
+    ):
+        if wait_interval < MIN_WAIT_INTERVAL:
+            raise ValueError(
+                "wait_interval must be at least %d seconds" % MIN_WAIT_INTERVAL
+            )
+        self.run = run
+        self.status_file = status_file
+        self.socket_path = socket_path
+        self.hostname = hostname
+        self.wait_interval = wait_interval
+        self.max_backoff = max_backoff
+        self.logger = logger
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.running = False
+        self.next_run = None
+        self.last_rc = None
+        self.snapshot = status.read_status(status_file)
+        self.failures = (self.snapshot or {}).get("consecutive_failures", 0)
+
+    def log(self, msg):
+        if self.logger is not None:
+            self.logger.info(msg)
+
+    def handle(self, command):
+        """Return the reply to a command from the control socket."""
+        if command == "status":
+            return {
+                "running": self.running,
+                "next_run": self.next_run,
+                "failures": self.failures,
+                "last_rc": self.last_rc,
+                "snapshot": self.snapshot,
+            }
+        if command == "recap":
+            return {"recap": (self.snapshot or {}).get("recap", [])}
+        if command == "run-now":
+            self.log("ants daemon: Run requested")
+            self.wakeup.set()
+            return {"scheduled": True, "running": self.running}
+        return {"error": "Unknown command %r" % command}
+
+    def worker(self):
+        """Run self.run in the forked worker and exit with its status.
+
+        Like at the exit of the interpreter, non-daemon threads are joined
+        first. The worker never returns into the code of the daemon.
+        """
+        rc = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            rc = exit_status(self.run())
+        except SystemExit as error:
+            rc = exit_status(error.code)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                for thread in threading.enumerate():
+                    if thread is not threading.current_thread() and not thread.daemon:
+                        thread.join()
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(rc)
+
+    def run_worker(self):
+        """Fork a worker for one run and return its rc.
+
+        Like subprocess, a worker killed by a signal has a negative rc.
+        """
+        pid = os.fork()
+        if pid == 0:
+            self.worker()
+        _, wait_status = os.waitpid(pid, 0)
+        if os.WIFSIGNALED(wait_status):
+            return -os.WTERMSIG(wait_status)
+        return os.WEXITSTATUS(wait_status)
+
+    def run_once(self):
+        """Run ants and update the state from its result."""
+        self.running = True
+        self.log("ants daemon: Starting run")
+        # The output of the daemon must not be written twice by the worker
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            self.last_rc = self.run_worker()
+        except OSError as error:
+            self.log("ants daemon: Can not start run: %s" % error)
+            self.last_rc = -1
+        finally:
+            self.running = False
+        self.snapshot = status.read_status(self.status_file)
+        failed = self.last_rc != 0 or (self.snapshot or {}).get("status") == "failed"
+        self.failures = self.failures + 1 if failed else 0
+        self.log("ants daemon: Run finished with rc %s" % self.last_rc)
+
+    def bind(self):
+        """Bind the control socket, replacing a stale socket file.
+
+        Raise OSError if another daemon listens on the socket already."""
+        if os.path.exists(self.socket_path):
+            if query(self.socket_path, "status", timeout=1) is not None:
+                raise OSError("A daemon is listening on %s" % self.socket_path)
+            os.remove(self.socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            server = _Server(self.socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        server.daemon = self
+        return server
+
+    def stop(self, *args):
+        self.stopped = True
+        self.wakeup.set()
+
+    def serve_forever(self):
+        """Serve the control socket and run ants until stopped by a signal."""
+        server = self.bind()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.log("ants daemon: Listening on %s" % self.socket_path)
+
+        # Keep the backoff of the runs before the start of the daemon
+        retry_after = (self.snapshot or {}).get("retry_after", 0)
+        self.next_run = schedule.next_slot(
+            self.hostname, self.wait_interval, max(time.time(), retry_after)
+        )
+        try:
+            while not self.stopped:
+                self.wakeup.wait(max(0, self.next_run - time.time()))
+                if self.stopped:
+                    break
+                self.wakeup.clear()
+                self.run_once()
+                self.next_run = schedule.next_run(
+                    self.hostname,
+                    self.wait_interval,
+                    time.time(),
+                    self.failures,
+                    self.max_backoff,
+                )
+        finally:
+            server.shutdown()
+            server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            self.log("ants daemon: Stopped")
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,117 @@
+"""fingerprint
+==================
+
+Detect runs that would not change anything.
+
+The fingerprint of a run is a hash of everything that decides what a run
+does: the head commit of the remote branch, the inventory, the ants
+configuration and the playbook options. If it matches the fingerprint of
+the last successful run, ansible-pull can be skipped. A full run is
+forced once max_interval seconds passed since the last full run.
+"""
+
+
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+STATE_VERSION = 1
+
+
+def remote_head(git_repo, branch, env=None, timeout=30):
+    """Return the commit the remote branch points to or None."""
+    try:
+        proc = subprocess.run(
+            ["git", "ls-remote", git_repo, "refs/heads/%s" % branch],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=env,
+            timeout=timeout,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if proc.returncode != 0:
+        return None
+    output = proc.stdout.decode("utf-8").split()
+    return output[0] if output else None
+
+
+def file_hash(path):
+    """Return the SHA-256 hash of the content of path."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compute(parts):
+    """Return the fingerprint of a dict of JSON serializable parts.
+
+    Return None if any part is None, as the run can not be compared then.
+    """
+    if any(value is None for value in parts.values()):
+        return None
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def read_state(state_file):
+    """Return the state of the last successful run as dict or None."""
+    try:
+        with open(state_file, "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+
+def write_state(state_file, fingerprint, full_run=None):
+    """Record fingerprint as the one of the last successful run.
+
+    full_run is the time of the last full run and defaults to now.
+    """
+    state = {
+        "version": STATE_VERSION,
+        "fingerprint": fingerprint,
+        "full_run": time.time() if full_run is None else full_run,
+    }
+    fd, tmp_file = tempfile.mkstemp(
+        dir=os.path.dirname(state_file), prefix=".fingerprint."
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_file, state_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def decide(fingerprint, state, max_interval, now=None):
+    """Return (skip, reason) for a run with fingerprint.
+
+    The run is skipped if fingerprint matches state and the last full
+    run is less than max_interval seconds ago.
+    """
+    if fingerprint is None:
+        return False, "fingerprint not available"
+    if state is None:
+        return False, "no previous successful run"
+    if state.get("fingerprint") != fingerprint:
+        return False, "fingerprint changed"
+    now = time.time() if now is None else now
+    age = now - state.get("full_run", 0)
+    if age >= max_interval:
+        return False, "last full run %.0fs ago" % age
+    return True, "unchanged since run %.0fs ago" % age
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,580 @@
+"""ad
+==========
+
+Active Directory inventory used by ants and the ants_inventory_ad script.
+It takes the host name of a client, searches for it in MS Active Directory
+and returns it's groups. The groups are filtered by prefix and Active
+Directory Organizational Unit.
+
+The inventory maps groups to the hostname in the Ansible JSON format. An
+offline cache file is written for later use if the Active Directory query
+succeeds. This cache is returned if the Active Directory query
+fails.
+
+If cache_ttl is set, a cache younger than cache_ttl seconds is returned
+without querying Active Directory. An older cache is returned as well, and
+refreshed by a separate background process that runs for at most
+cache_refresh_budget seconds. If the refresh fails, the cache is kept
+for another cache_ttl seconds.
+
+It always returns the common group for common tasks. It also returns the group
+common-ad-bound if the result comes from an online query or from a fresh cache
+that was last checked online, rather than from an offline cache.
+"""
+from __future__ import print_function
+
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+from json import dumps, loads
+from os import path
+from socket import gethostname
+from ssl import CERT_REQUIRED
+
+import certifi
+from antslib import configer, logger
+from antslib.inventory import cache
+from ldap3 import BASE, SIMPLE, Connection, Server, Tls, core
+from ldap3.protocol.formatters.formatters import format_sid
+from ldap3.utils.conv import escape_bytes, escape_filter_chars
+
+__author__ = "Jan Welker"
+__email__ = "jan.welker@unibas.ch"
+__copyright__ = "Copyright 2017-2020, University of Basel"
+
+__credits__ = ["Balz Aschwanden", "Jan Welker"]
+__license__ = "GPL"
+
+# Active Directory matching rule that follows nested group memberships
+LDAP_MATCHING_RULE_IN_CHAIN = "1.2.840.113556.1.4.1941"
+
+
+def bind_to_dc(ldap_user, ldap_pw, ldap_host, connect_timeout, receive_timeout):
+    """Connect to a single domain controller and return the connection or None."""
+    tls = Tls(validate=CERT_REQUIRED, ca_certs_file=certifi.where())
+    server = Server(
+        ldap_host, port=636, use_ssl=True, tls=tls, connect_timeout=connect_timeout
+    )
+    logger.logfile_logger.info("ants_inventory_ad: Try connection with:")
+    logger.logfile_logger.info(f"\tServer: {server}")
+    logger.logfile_logger.info(f"\tUser: {ldap_user}")
+    connection = Connection(
+        server,
+        user=ldap_user,
+        password=ldap_pw,
+        authentication=SIMPLE,
+        raise_exceptions=True,
+        receive_timeout=receive_timeout,
+    )
+    logger.logfile_logger.info("ants_inventory_ad: Connection object created:")
+    logger.logfile_logger.info(f"\t{connection}")
+    try:
+        connection.bind()
+
+        result = connection.result["description"]
+        if result == "success":
+            return connection
+        else:
+            return None
+    except core.exceptions.LDAPSocketOpenError as e:
+        logger.logfile_logger.error(
+            "ants_inventory_ad: LDAPSocketOpenError while binding:"
+        )
+        logger.logfile_logger.error(f"\t{e}")
+        return None
+    except core.exceptions.LDAPInvalidCredentialsResult as e:
+        logger.logfile_logger.error(f"Invalid credentials for user: {ldap_user}")
+        for key, value in connection.result.items():
+            logger.logfile_logger.error(f"{key}: {value}")
+        logger.logfile_logger.error(
+            "ants_inventory_ad: LDAPInvalidCredentialsResult while binding:"
+        )
+        logger.logfile_logger.error(f"\t{e}")
+        return None
+    except core.exceptions.LDAPException as e:
+        logger.logfile_logger.error(
+            f"ants_inventory_ad: {e.__class__.__name__} while binding to {ldap_host}:"
+        )
+        logger.logfile_logger.error(f"\t{e}")
+        return None
+
+
+def read_last_dc(dc_file):
+    """Return the last domain controller that answered or None."""
+    try:
+        with open(dc_file, "r") as f:
+            return f.read().strip() or None
+    except IOError:
+        return None
+
+
+def write_last_dc(dc_file, ldap_host):
+    try:
+        cache.atomic_write(dc_file, ldap_host)
+    except (IOError, OSError) as error:
+        logger.logfile_logger.error(
+            f"ants_inventory_ad: Could not remember domain controller: {error}"
+        )
+
+
+def connect_to_ad(
+    ldap_user,
+    ldap_pw,
+    ldap_hosts,
+    connect_timeout=3,
+    bind_timeout=10,
+    search_timeout=10,
+    stagger=0.25,
+    dc_file=None,
+):
+    """Connect to Active Directory and return the connection or None.
+
+    ldap_hosts is a comma separated list of domain controllers. Connection
+    attempts race in parallel. The next domain controller is tried after
+    stagger seconds or as soon as an attempt fails, whatever happens first.
+    The first successful bind wins. After bind_timeout seconds, all
+    remaining attempts are given up.
+
+    The domain controller that answered is remembered in dc_file and
+    tried first next time."""
+    hosts = [host.strip() for host in ldap_hosts.split(",") if host.strip()]
+    last_dc = read_last_dc(dc_file) if dc_file else None
+    if last_dc in hosts:
+        hosts.remove(last_dc)
+        hosts.insert(0, last_dc)
+
+    results = queue.Queue()
+    lock = threading.Lock()
+    winner = []
+
+    def attempt(ldap_host):
+        connection = bind_to_dc(
+            ldap_user, ldap_pw, ldap_host, connect_timeout, search_timeout
+        )
+        with lock:
+            if connection and winner:
+                # Another domain controller was faster
+                connection.unbind()
+                connection = None
+            elif connection:
+                winner.append(ldap_host)
+        results.put(connection)
+
+    deadline = time.monotonic() + bind_timeout
+    next_start = time.monotonic()
+    running = 0
+    while hosts or running:
+        now = time.monotonic()
+        if now >= deadline:
+            logger.logfile_logger.error(
+                f"ants_inventory_ad: No domain controller answered within {bind_timeout}s"
+            )
+            return None
+        if hosts and now >= next_start:
+            threading.Thread(target=attempt, args=(hosts.pop(0),), daemon=True).start()
+            running += 1
+            next_start = now + stagger
+            continue
+        timeout = deadline - now
+        if hosts:
+            timeout = min(timeout, next_start - now)
+        try:
+            connection = results.get(timeout=max(0, timeout))
+        except queue.Empty:
+            continue
+        running -= 1
+        if connection:
+            if dc_file and winner[0] != last_dc:
+                write_last_dc(dc_file, winner[0])
+            return connection
+        # An attempt failed, try the next domain controller right away
+        next_start = time.monotonic()
+    return None
+
+
+def get_simple_host_name(fqdn):
+    """Convert FQDN to simple host name and return it."""
+    simple_hostname = fqdn.split(".")[0]
+    return simple_hostname
+
+
+def find_computer(connection, simple_hostname, ldap_ou):
+    """Search the computer object and return its distinguished name or None.
+
+    The host does not have to be bound to AD it just has to exist."""
+    connection.search(
+        ldap_ou,
+        f"(cn={escape_filter_chars(simple_hostname)})",
+        attributes=["distinguishedName"],
+    )
+    for entry in connection.response:
+        if entry.get("type") == "searchResEntry":
+            return entry["dn"]
+    logger.logfile_logger.info(
+        f"ants_inventory_ad: Host {simple_hostname} not found in {ldap_ou}"
+    )
+    return None
+
+
+def paged_search(connection, search_base, search_filter, attributes, page_size):
+    """Run a paged search and yield the entries of all pages."""
+    for entry in connection.extend.standard.paged_search(
+        search_base,
+        search_filter,
+        attributes=attributes,
+        paged_size=page_size,
+        generator=True,
+    ):
+        if entry.get("type") == "searchResEntry":
+            yield entry
+
+
+def get_computer_groups(
+    connection, search_base, computer_dn, group_prefix, page_size=500
+):
+    """Receive groups that the computer object is a member of.
+    member:1.2.840.113556.1.4.1941:=%s is a special Active Directory OID that
+    returns nested groups and not just the first level. The result is filtered
+    by group prefix and Organizational Unit on the server."""
+    search_filter = "(&(objectCategory=group)(cn=%s*)(member:%s:=%s))" % (
+        escape_filter_chars(group_prefix),
+        LDAP_MATCHING_RULE_IN_CHAIN,
+        escape_filter_chars(computer_dn),
+    )
+    result = set()
+    for group in paged_search(
+        connection, search_base, search_filter, ["cn"], page_size
+    ):
+        group_name = group["attributes"]["cn"]
+        if isinstance(group_name, list):
+            group_name = group_name[0]
+        group_name = group_name.lower()
+        # cn matching on the server is case insensitive, the prefix is not
+        if group_name.startswith(group_prefix):
+            result.add(group_name)
+    if not result:
+        logger.logfile_logger.info(
+            f"No groups found for {computer_dn} in {search_base} with preffix {group_prefix}"
+        )
+    return sorted(result)
+
+
+def read_sid_cache(sid_cache_file):
+    """Return the SID cache as a mapping of group SID to group name and a
+    mapping of SIDs without a matching group to the time of their lookup."""
+    try:
+        with open(sid_cache_file, "r") as f:
+            content = loads(f.read())
+    except (IOError, ValueError):
+        return {}, {}
+    if not isinstance(content, dict):
+        return {}, {}
+    if "groups" not in content:
+        # Written by older versions, SIDs without a group map to ""
+        return dict((sid, name) for sid, name in content.items() if name), {}
+    return content["groups"], content.get("missing", {})
+
+
+def write_sid_cache(sid_cache_file, groups, missing):
+    try:
+        cache.atomic_write(
+            sid_cache_file,
+            dumps({"groups": groups, "missing": missing}, sort_keys=True),
+        )
+    except (IOError, OSError) as error:
+        logger.logfile_logger.error(
+            f"ants_inventory_ad: Error while writing SID cache: {error}"
+        )
+
+
+def get_computer_token_groups(
+    connection,
+    search_base,
+    computer_dn,
+    group_prefix,
+    sid_cache_file,
+    page_size=500,
+    missing_ttl=86400,
+):
+    """Receive groups that the computer object is a member of using tokenGroups.
+
+    tokenGroups holds the SIDs of all nested security groups of an object.
+    SIDs are resolved to group names with a client side cache. Only SIDs
+    that are not in the cache are looked up, in a single search. SIDs of
+    groups outside search_base or without the prefix are cached as missing
+    for missing_ttl seconds, so new groups are found after that time."""
+    connection.search(
+        computer_dn, "(objectClass=*)", search_scope=BASE, attributes=["tokenGroups"]
+    )
+    # Binary SIDs by their string form
+    sids = {}
+    for entry in connection.response:
+        if entry.get("type") == "searchResEntry":
+            for raw_sid in entry["raw_attributes"].get("tokenGroups", []):
+                sids[format_sid(raw_sid)] = raw_sid
+
+    groups, missing = read_sid_cache(sid_cache_file)
+    now = time.time()
+    missing = dict(
+        (sid, checked)
+        for sid, checked in missing.items()
+        if now - checked < missing_ttl
+    )
+    unknown = set(sids).difference(groups, missing)
+    if unknown:
+        search_filter = "(&(objectCategory=group)(cn=%s*)(|%s))" % (
+            escape_filter_chars(group_prefix),
+            "".join(
+                f"(objectSid={escape_bytes(sids[sid])})" for sid in sorted(unknown)
+            ),
+        )
+        for group in paged_search(
+            connection, search_base, search_filter, ["cn", "objectSid"], page_size
+        ):
+            sid = format_sid(group["raw_attributes"]["objectSid"][0])
+            groups[sid] = group["raw_attributes"]["cn"][0].decode("utf-8").lower()
+        for sid in unknown.difference(groups):
+            missing[sid] = now
+        write_sid_cache(sid_cache_file, groups, missing)
+
+    return sorted(
+        set(
+            groups[sid]
+            for sid in sids
+            if sid in groups and groups[sid].startswith(group_prefix)
+        )
+    )
+
+
+def format_output(output):
+    """Return results in Ansible JSON syntax.
+
+    Ansible requirements are documented here:
+    http://docs.ansible.com/ansible/latest/dev_guide/developing_inventory.html
+    """
+    return dumps(output, sort_keys=True, indent=4, separators=(",", ": "))
+
+
+def write_cache(cache_file, output, **meta):
+    """Write inventory cache to file.
+
+    The inventory is stored along with meta data like the time it was
+    fetched from Active Directory (created) and its source."""
+    try:
+        cache.write_cache(cache_file, output, **meta)
+    except (IOError, OSError) as error:
+        logger.console_logger.error(f"Error while writing cache: {error}")
+        logger.console_logger.error(
+            f"Make sure the base process has the right permissions and path exists for {cache_file}"
+        )
+        raise
+
+
+def read_cache(cache_file):
+    """Read cache file and return its content as dict or False."""
+    try:
+        return cache.read_cache(cache_file) or False
+    except cache.CacheError as error:
+        logger.logfile_logger.error(f"ants_inventory_ad: Ignoring cache: {error}")
+        return False
+
+
+def query_ad(cfg, fqdn):
+    """Fetch groups of this host from AD.
+
+    Return the inventory and the domain controller it came from or
+    (None, None) if AD can not be reached."""
+    simple_host_name = get_simple_host_name(fqdn.lower())
+
+    # Connecting to Active Directory and check connection status
+    ad_connection = connect_to_ad(
+        cfg["ldap_user"],
+        cfg["ldap_pw"],
+        cfg["ldap_host"],
+        connect_timeout=float(cfg["ldap_connect_timeout"]),
+        bind_timeout=float(cfg["ldap_bind_timeout"]),
+        search_timeout=float(cfg["ldap_search_timeout"]),
+        stagger=float(cfg["ldap_stagger"]),
+        dc_file=path.splitext(cfg["cache_file"])[0] + "_dc",
+    )
+    if not ad_connection:
+        return None, None
+
+    # Initializing output
+    output = dict()
+    output[cfg["common_group"]] = [fqdn]
+
+    # Looking up computers distinguished name. The host may not exist in AD.
+    computer_dn = find_computer(
+        ad_connection, simple_host_name, cfg["ldap_ou_computers"]
+    )
+    if computer_dn:
+        # Looking up computers groups
+        if cfg["group_resolution"] == "token_groups":
+            computer_groups = get_computer_token_groups(
+                ad_connection,
+                cfg["ldap_ou_groups"],
+                computer_dn,
+                cfg["group_prefix"],
+                path.splitext(cfg["cache_file"])[0] + "_sids.json",
+                int(cfg["ldap_page_size"]),
+                int(cfg["sid_cache_missing_ttl"]),
+            )
+        else:
+            computer_groups = get_computer_groups(
+                ad_connection,
+                cfg["ldap_ou_groups"],
+                computer_dn,
+                cfg["group_prefix"],
+                int(cfg["ldap_page_size"]),
+            )
+        # Adding groups to output
+        for group in computer_groups:
+            output[group] = [fqdn]
+    return output, ad_connection.server.host
+
+
+class RefreshTimeout(Exception):
+    """Raised when a background refresh exceeds its time budget."""
+
+
+def _raise_refresh_timeout(signum, frame):
+    raise RefreshTimeout()
+
+
+def refresh_cache(cfg, fqdn, cached):
+    """Query AD and update the cache.
+
+    If AD can not be reached, the existing cache is kept and marked as
+    checked, which extends its life by cache_ttl."""
+    cache_file = cfg["cache_file"]
+    try:
+        output, source = query_ad(cfg, fqdn)
+    except RefreshTimeout:
+        logger.logfile_logger.error("ants_inventory_ad: Cache refresh timed out")
+        output = None
+    if output is not None:
+        write_cache(cache_file, output, online=True, source=source)
+    else:
+        write_cache(
+            cache_file,
+            cached["inventory"],
+            created=cached["created"],
+            online=False,
+            source=cached.get("source", ""),
+        )
+
+
+def refresh_cache_in_background():
+    """Refresh the cache in a new process and return immediately.
+
+    The process runs this module with --refresh-cache in its own session.
+    It does not inherit stdout, so Ansible does not wait for it."""
+    # Directory containing the antslib package
+    package_root = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [package_root, env.get("PYTHONPATH")])
+    )
+    try:
+        subprocess.Popen(
+            [sys.executable, "-m", "antslib.inventory.ad", "--refresh-cache"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=env,
+            start_new_session=True,
+        )
+    except OSError as error:
+        logger.logfile_logger.error(
+            f"ants_inventory_ad: Can not refresh cache: {error}"
+        )
+
+
+def refresh_cache_with_budget():
+    """Refresh the cache, stopping after cache_refresh_budget seconds.
+
+    This is the entry point of the process started by
+    refresh_cache_in_background."""
+    cfg = configer.read_config("ad")
+    cached = read_cache(cfg["cache_file"])
+    if not cached:
+        return
+    signal.signal(signal.SIGALRM, _raise_refresh_timeout)
+    signal.alarm(int(cfg["cache_refresh_budget"]))
+    try:
+        refresh_cache(cfg, gethostname(), cached)
+    except Exception as error:
+        logger.logfile_logger.error(f"ants_inventory_ad: Cache refresh failed: {error}")
+    finally:
+        signal.alarm(0)
+
+
+def get_inventory():
+    """Fetch groups from AD and return the inventory as dict."""
+    cfg = configer.read_config("ad")
+    cache_file = cfg["cache_file"]
+    cache_ttl = int(cfg["cache_ttl"])
+
+    # Reading fully qualified host name
+    fqdn = gethostname()
+
+    cached = read_cache(cache_file) if cache_ttl > 0 else False
+    if cached:
+        output = cached["inventory"]
+        age = time.time() - cached["checked"]
+        if age < cache_ttl:
+            logger.logfile_logger.info(
+                f"ants_inventory_ad: Using cached results from {cached.get('source')} checked {age:.0f}s ago"
+            )
+            if cached.get("online"):
+                output[cfg["common_ad_connected"]] = [fqdn]
+        else:
+            logger.logfile_logger.info(
+                f"ants_inventory_ad: Using stale cache checked {age:.0f}s ago. Refreshing in background"
+            )
+            refresh_cache_in_background()
+        return output
+
+    output, source = query_ad(cfg, fqdn)
+    online = output is not None
+    if online:
+        logger.logfile_logger.info("ants_inventory_ad: Using online results from AD")
+
+        # Writing output to cache file
+        try:
+            write_cache(cache_file, output, online=True, source=source)
+        except (IOError, OSError) as error:
+            logger.console_logger.error(f"Error while writing cache: {error}")
+
+        # Adding online Group after cache is written.
+        # We do not want to cache this group
+        output[cfg["common_ad_connected"]] = [fqdn]
+        return output
+
+    # We are not bound to AD we are offline
+    logger.logfile_logger.info("ants_inventory_ad: Using cached results from AD")
+    # Reading cache file
+    cached_output = read_cache(cache_file)
+    if cached_output:
+        return cached_output["inventory"]
+    # Default group
+    output = dict()
+    output[cfg["common_group"]] = [fqdn]
+    return output
+
+
+def main():
+    """Fetching groups from AD and printing them in JSON."""
+    if "--refresh-cache" in sys.argv[1:]:
+        refresh_cache_with_budget()
+        return
+    print(format_output(get_inventory()))
+
+
+if __name__ == "__main__":
+    main()
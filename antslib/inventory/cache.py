@@ -0,0 +1,144 @@
+"""cache
+=============
+
+Inventory cache shared by the inventory scripts.
+
+The cache is a compact JSON document holding a format version, the
+time the inventory was created, a SHA-256 hash of the inventory and
+the inventory itself. Additional metadata like the source of the
+inventory can be stored along with it.
+
+Files are written atomically. A crash or a full disk leaves either the
+old or the new cache, never a truncated one. The hash is verified on
+every read. If the inventory did not change, the file is not rewritten.
+Only its modification time is updated, which marks the time the cache
+was last checked.
+"""
+
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+CACHE_VERSION = 1
+
+
+class CacheError(Exception):
+    """Raised if a cache file exists but can not be used."""
+
+
+def inventory_hash(inventory):
+    """Return the SHA-256 hash of the canonical JSON form of inventory."""
+    canonical = json.dumps(inventory, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def atomic_write(path, data, mode=0o644):
+    """Write data to path using a temporary file and a rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=".%s." % os.path.basename(path)
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # Persist the rename itself
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def _convert_legacy(content, mtime):
+    """Return a cache dict for caches written by older versions.
+
+    Older versions either stored the bare inventory or wrapped it in an
+    "ants_cache" dict."""
+    if "ants_cache" in content and "inventory" in content:
+        meta = dict(content["ants_cache"])
+        meta.pop("checked", None)
+        inventory = content["inventory"]
+    else:
+        meta = {"created": mtime, "online": False, "source": ""}
+        inventory = content
+    return dict(meta, version=CACHE_VERSION, inventory=inventory)
+
+
+def _validate(cache):
+    if cache.get("version") != CACHE_VERSION:
+        raise CacheError("Unsupported cache version %r" % cache.get("version"))
+    inventory = cache.get("inventory")
+    if not isinstance(inventory, dict):
+        raise CacheError("Cache does not contain an inventory")
+    if "sha256" in cache and cache["sha256"] != inventory_hash(inventory):
+        raise CacheError("Cache content does not match its hash")
+
+
+def read_cache(cache_file):
+    """Read and validate cache_file and return its content as dict.
+
+    The key "checked" is set to the modification time of the file.
+    Return None if there is no cache. Raise CacheError if the cache
+    is corrupt."""
+    try:
+        with open(cache_file, "r") as f:
+            mtime = os.fstat(f.fileno()).st_mtime
+            content = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as error:
+        raise CacheError("Can not read %s: %s" % (cache_file, error))
+
+    if not isinstance(content, dict):
+        raise CacheError("Cache %s is not a JSON object" % cache_file)
+    if "version" not in content:
+        content = _convert_legacy(content, mtime)
+    _validate(content)
+    content["checked"] = mtime
+    return content
+
+
+def write_cache(cache_file, inventory, **meta):
+    """Write inventory and meta data to cache_file.
+
+    If the cache already holds the same inventory and meta data, only its
+    modification time is updated. Return True if the file was rewritten.
+    """
+    digest = inventory_hash(inventory)
+    try:
+        old = read_cache(cache_file)
+    except CacheError:
+        old = None
+    if (
+        old is not None
+        and old.get("sha256") == digest
+        and all(old.get(key) == value for key, value in meta.items())
+    ):
+        os.utime(cache_file)
+        return False
+
+    cache = dict(meta)
+    cache.setdefault("created", time.time())
+    cache.update(version=CACHE_VERSION, sha256=digest, inventory=inventory)
+    atomic_write(cache_file, json.dumps(cache, sort_keys=True, separators=(",", ":")))
+    return True
+
+
+if __name__ == "__main__":
+    pass
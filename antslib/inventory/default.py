@@ -0,0 +1,34 @@
+"""default
+===============
+
+Default inventory.
+
+This is a dummy inventory to bootstrap ants.
+It will return the fqdn as member of the ants-common group.
+"""
+
+from antslib.inventory import helper
+
+__author__ = "Balz Aschwanden"
+__email__ = "balz.aschwanden@unibas.ch"
+__copyright__ = "Copyright 2017, University of Basel"
+
+__credits__ = ["Balz Aschwanden"]
+__license__ = "GPL"
+
+
+def get_inventory():
+    """Return default inventory as dict."""
+    output = dict()
+    fqdn = helper.get_hostname()
+    output["ants-common"] = [fqdn]
+    return output
+
+
+def main():
+    """Print default inventory in JSON."""
+    print(helper.format_output(get_inventory()))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,10 @@
 =============
 
 Helper functions for inventory scripts.
+
+Inventories known to ants can be resolved in-process and written to a
+static inventory file. This spares ansible-pull the start of another
+Python interpreter running the inventory script.
 """
 
 __author__ = "Balz Aschwanden"
@@ -12,10 +16,20 @@ __credits__ = ["Balz Aschwanden"]
 __license__ = "GPL"
 
 
+import importlib
 import json
 import os
 import socket
 
+from antslib.inventory import cache
+
+
+# Inventory scripts that have an in-process implementation
+INVENTORY_MODULES = {
+    "ants_inventory_default": "antslib.inventory.default",
+    "ants_inventory_ad": "antslib.inventory.ad",
+}
+
 
 def get_hostname():
     """Return FQDN for this host."""
@@ -38,18 +52,71 @@ def format_output(output):
 
 
 def write_cache(cache_file, output):
-    """Format and write inventory cache to file."""
-    with open(cache_file, "w") as cache:
-        for line in format_output(output):
-            cache.write(line)
+    """Write inventory cache to file.
+
+    See antslib.inventory.cache for the file format."""
+    cache.write_cache(cache_file, output)
 
 
 def read_cache(cache_file):
-    """Read cache file and return content or False."""
-    if not os.path.isfile(cache_file):
+    """Read cache file and return the formatted inventory or False.
+
+    A missing or corrupt cache returns False."""
+    try:
+        content = cache.read_cache(cache_file)
+    except cache.CacheError:
+        return False
+    if content is None:
         return False
-    with open(cache_file, "r") as cache:
-        return cache.read()
+    return format_output(content["inventory"])
+
+
+def resolve_inventory(inventory_script):
+    """Return the inventory of inventory_script as dict.
+
+    Return None if the script has no in-process implementation. The
+    implementation is only imported when it is used."""
+    module_name = INVENTORY_MODULES.get(os.path.basename(inventory_script))
+    if module_name is None:
+        return None
+    return importlib.import_module(module_name).get_inventory()
+
+
+def to_static_inventory(inventory):
+    """Convert a dynamic inventory dict to the YAML inventory format.
+
+    Groups may either be a list of hosts or a dict with hosts, vars and
+    children. Host variables are taken from _meta.hostvars. The result
+    can be written as JSON, which the YAML inventory plugin reads.
+    """
+    hostvars = inventory.get("_meta", {}).get("hostvars", {})
+    static = dict()
+    for group, content in inventory.items():
+        if group == "_meta":
+            continue
+        if isinstance(content, dict):
+            hosts = content.get("hosts", [])
+            static_group = {
+                key: content[key] for key in ("vars", "children") if content.get(key)
+            }
+            if "children" in static_group:
+                static_group["children"] = {
+                    child: {} for child in static_group["children"]
+                }
+        else:
+            hosts = content
+            static_group = dict()
+        if hosts:
+            static_group["hosts"] = {host: hostvars.get(host) for host in hosts}
+        static[group] = static_group
+    return static
+
+
+def write_static_inventory(inventory_file, inventory):
+    """Write inventory to inventory_file in the static inventory format."""
+    cache.atomic_write(
+        inventory_file, format_output(to_static_inventory(inventory)), mode=0o600
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,187 @@
+"""known_hosts
+==================
+
+Look up host names in OpenSSH known_hosts files.
+
+Lines are parsed like OpenSSH does. Host patterns may be hashed
+(|1|salt|hash), contain wildcards or be negated with !. Hosts on a
+non-standard port are written as [host]:port. Lines marked @revoked are
+ignored, lines marked @cert-authority count as known.
+
+Files are read line by line. The result of every lookup is stored in an
+index file along with the modification time and size of each known_hosts
+file, so repeated lookups of the same host do not read the files again
+until one of them changes.
+"""
+
+
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import os
+import re
+import tempfile
+
+INDEX_VERSION = 1
+HASH_MAGIC = "|1|"
+
+
+def host_key_name(hostname, port=None):
+    """Return the name ssh uses for hostname and port in known_hosts."""
+    if port and int(port) != 22:
+        return "[%s]:%s" % (hostname, port)
+    return hostname
+
+
+def match_hashed(pattern, name):
+    """Return True if the hashed pattern |1|salt|hash matches name."""
+    try:
+        salt, digest = pattern[len(HASH_MAGIC) :].split("|", 1)
+        salt = base64.b64decode(salt)
+        digest = base64.b64decode(digest)
+    except (ValueError, TypeError):
+        return False
+    computed = hmac.new(salt, name.encode("utf-8"), hashlib.sha1).digest()
+    return hmac.compare_digest(computed, digest)
+
+
+@functools.lru_cache(maxsize=1024)
+def wildcard_regex(pattern):
+    """Compile a pattern where only * and ? are special, like in OpenSSH."""
+    regex = "".join(
+        ".*" if char == "*" else "." if char == "?" else re.escape(char)
+        for char in pattern
+    )
+    return re.compile(regex, re.DOTALL)
+
+
+def match_pattern(pattern, name):
+    if pattern.startswith(HASH_MAGIC):
+        return match_hashed(pattern, name)
+    pattern = pattern.lower()
+    if "*" in pattern or "?" in pattern:
+        return wildcard_regex(pattern).fullmatch(name) is not None
+    return pattern == name
+
+
+def parse_line(line):
+    """Return (marker, host_patterns) of a known_hosts line or None.
+
+    marker is None, "@cert-authority" or "@revoked". Empty lines and
+    comments return None.
+    """
+    fields = line.split()
+    if not fields or fields[0].startswith("#"):
+        return None
+    marker = None
+    if fields[0].startswith("@"):
+        marker = fields.pop(0)
+    # Host patterns, key type and key
+    if len(fields) < 3:
+        return None
+    return marker, fields[0].split(",")
+
+
+def match_line(patterns, name):
+    """Return True if patterns match name and no negated pattern does."""
+    matched = False
+    for pattern in patterns:
+        if pattern.startswith("!"):
+            if match_pattern(pattern[1:], name):
+                return False
+        elif not matched and match_pattern(pattern, name):
+            matched = True
+    return matched
+
+
+def file_contains(known_hosts_file, name):
+    """Return True if known_hosts_file has a valid key for name."""
+    name = name.lower()
+    with open(known_hosts_file, "r", errors="replace") as f:
+        for line in f:
+            # Cheap test first, hashed lines can not be tested this way
+            if HASH_MAGIC not in line and "*" not in line and "?" not in line:
+                if name not in line.lower():
+                    continue
+            parsed = parse_line(line)
+            if parsed is None:
+                continue
+            marker, patterns = parsed
+            if marker == "@revoked":
+                continue
+            if match_line(patterns, name):
+                return True
+    return False
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def read_index(index_file):
+    try:
+        with open(index_file, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(index, dict) or index.get("version") != INDEX_VERSION:
+        return {}
+    return index.get("files", {})
+
+
+def write_index(index_file, files):
+    index = {"version": INDEX_VERSION, "files": files}
+    try:
+        fd, tmp_file = tempfile.mkstemp(
+            dir=os.path.dirname(index_file), prefix=".known_hosts."
+        )
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_file, index_file)
+    except OSError:
+        os.remove(tmp_file)
+
+
+def find_host(hostname, known_hosts_files, port=None, index_file=None):
+    """Return the first of known_hosts_files that knows hostname or None.
+
+    Files that do not exist are skipped. If index_file is set, results are
+    taken from and stored in the index.
+    """
+    name = host_key_name(hostname.lower(), port)
+    index = read_index(index_file) if index_file else {}
+    changed = False
+    found = None
+    for path in known_hosts_files:
+        stat = _stat(path)
+        if stat is None:
+            continue
+        entry = index.get(path)
+        if entry is None or entry.get("stat") != stat:
+            entry = {"stat": stat, "hosts": {}}
+            index[path] = entry
+        if name not in entry["hosts"]:
+            try:
+                entry["hosts"][name] = file_contains(path, name)
+            except OSError:
+                continue
+            changed = True
+        if entry["hosts"][name]:
+            found = path
+            break
+    if index_file and changed:
+        write_index(index_file, index)
+    return found
+
+
+if __name__ == "__main__":
+    pass
@@ -2,30 +2,96 @@
 ================
 
 Handle logging.
+
+Loggers, the log dispatcher and the config they need are created on
+first access of the module attributes, e.g. logger.console_logger.
+Importing this module does not read the config or open any file.
+
+Rotated log files are compressed and pruned by antslib.logrotate.
 """
 
 
+import atexit
 import logging
-import logging.handlers
 import os
 import sys
+import time
+
+from antslib import configer, logrotate, status
+
+# Log file name, maxBytes and formatter of every logger.
+# The console logger has no log file.
+LOGGERS = {
+    "console_logger": (None, 0, "simple"),
+    "logfile_logger": ("ants.log", 5000000, "default"),
+    "ok_logger": ("ok.log", 0, "default"),
+    "changed_logger": ("changed.log", 0, "default"),
+    "failed_logger": ("failed.log", 0, "default"),
+    "recap_logger": ("recap.log", 0, "default"),
+}
+LOGFILES = {
+    "logfile_main": "ants.log",
+    "logfile_ok": "ok.log",
+    "logfile_changed": "changed.log",
+    "logfile_failed": "failed.log",
+    "logfile_recap": "recap.log",
+}
+
+# Lazily created module attributes
+_instances = {}
+
+
+def _config():
+    if "CFG" not in _instances:
+        _instances["CFG"] = configer.read_config("main")
+    return _instances["CFG"]
+
+
+def _logfile(file_name):
+    return os.path.join(_config()["log_dir"], file_name)
+
+
+def _logger(name):
+    """Return the logger name, creating it on first use."""
+    if name not in _instances:
+        file_name, max_bytes, formatter = LOGGERS[name]
+        logfile = _logfile(file_name) if file_name else False
+        _instances[name] = get_logger(name, logfile, max_bytes, formatter)
+    return _instances[name]
+
+
+def _dispatcher():
+    if "dispatcher" not in _instances:
+        _instances["dispatcher"] = LogDispatcher(
+            _config()["log_dir"],
+            _logger("console_logger"),
+            _logger("logfile_logger"),
+            {
+                "ok": _logger("ok_logger"),
+                "changed": _logger("changed_logger"),
+                "failed": _logger("failed_logger"),
+            },
+        )
+        atexit.register(_instances["dispatcher"].flush)
+    return _instances["dispatcher"]
 
-from antslib import configer
 
-CFG = configer.read_config("main")
-logfile_main = os.path.join(CFG["log_dir"], "ants.log")
-logfile_ok = os.path.join(CFG["log_dir"], "ok.log")
-logfile_changed = os.path.join(CFG["log_dir"], "changed.log")
-logfile_failed = os.path.join(CFG["log_dir"], "failed.log")
-logfile_recap = os.path.join(CFG["log_dir"], "recap.log")
+def __getattr__(name):
+    if name in LOGGERS:
+        return _logger(name)
+    if name in LOGFILES:
+        return _logfile(LOGFILES[name])
+    if name == "dispatcher":
+        return _dispatcher()
+    if name == "CFG":
+        return _config()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 def get_logger(name, logfile=False, maxBytes=0, formatter="default"):
     """Return logging object with handler and formatter."""
     if logfile:
-        handler = logging.handlers.RotatingFileHandler(
-            logfile, maxBytes=maxBytes, backupCount=5, delay=True
-        )
+        handler = logrotate.RotatingLogHandler(logfile, maxBytes=maxBytes, delay=True)
         handler.setLevel(logging.INFO)
     else:
         handler = logging.StreamHandler(sys.stdout)
@@ -58,67 +124,230 @@ def status_file_rollover():
     Code for rotation based on
     https://stackoverflow.com/questions/4654915/rotate-logfiles-each-time-the-application-is-started-python
     """
-    if os.path.isdir(CFG["log_dir"]):
-        status_files = [
-            [ok_logger, logfile_ok],
-            [changed_logger, logfile_changed],
-            [failed_logger, logfile_failed],
-        ]
-        for (logger, logfile) in status_files:
+    if os.path.isdir(_config()["log_dir"]):
+        status_files = ["ok_logger", "changed_logger", "failed_logger"]
+        for name in status_files:
+            logfile = _logfile(LOGGERS[name][0])
             if os.path.isfile(logfile):
-                console_logger.debug("Logfile rollover for file %s" % logfile)
-                logger.handlers[0].doRollover()
+                _logger("console_logger").debug(
+                    "Logfile rollover for file %s" % logfile
+                )
+                _logger(name).handlers[0].doRollover()
     return
 
 
-def log_recap(start_time, end_time, status_line, rc):
-    """Log play recap in a dedicated form.
+def start_log_maintenance():
+    """Compress and prune rotated log files in a background thread.
+
+    Call this once the run has finished. Return the thread.
+    """
+    cfg = _config()
+    return logrotate.start_maintenance(
+        [_logfile(file_name) for file_name, _, _ in LOGGERS.values() if file_name],
+        keep=int(cfg["log_history"]),
+        max_bytes=int(cfg["log_history_bytes"]),
+        max_age=int(cfg["log_history_age"]),
+    )
+
+
+def log_recap(start_time, end_time, run_recap, rc, decision=None):
+    """Log play recap in a dedicated form and return the logged lines.
+
+    See format_recap for the arguments.
 
     Rollover old logfiles befor writing.
     """
+    return log_recap_lines(format_recap(start_time, end_time, run_recap, rc, decision))
+
+
+def format_recap(start_time, end_time, run_recap, rc, decision=None):
+    """Return the lines of the play recap.
+
+    run_recap is the recap written by the ants_recap callback or None.
+
+    decision is a dict telling whether and why the run was skipped, or
+    None if skipping unchanged runs is disabled. A skipped run has the
+    client status ok, as nothing changed since the last successful run.
+    """
+    recap = [
+        "****PLAY TIME****",
+        "Start time: %s" % start_time,
+        "End time: %s" % end_time,
+        "Total: %s" % (end_time - start_time),
+        "****PLAY RECAP****",
+    ]
+    if decision is not None:
+        recap.append(
+            "Run %s: %s"
+            % ("skipped" if decision["skipped"] else "reason", decision["reason"])
+        )
+    if decision is not None and decision["skipped"]:
+        recap.append("Client status: ok")
+    elif rc != 0 or not run_recap:
+        recap.append("Ansible-pull return code: %s" % rc)
+        recap.append("Client status: failed")
+    else:
+        recap += status.recap_lines(run_recap)
+        recap.append("Client status: %s" % status.client_status(run_recap))
+    return recap
+
+
+def log_recap_lines(recap):
+    """Replace the recap log with the lines in recap and return them."""
+    recap_logger = _logger("recap_logger")
+    logfile_recap = _logfile(LOGGERS["recap_logger"][0])
     if os.path.isfile(logfile_recap):
-        console_logger.debug("Logfile rollover for file %s" % logfile_recap)
+        _logger("console_logger").debug(
+            "Logfile rollover for file %s" % logfile_recap
+        )
         recap_logger.handlers[0].doRollover()
+    for line in recap:
+        recap_logger.info(line)
+    return recap
+
+
+class BufferedLogFile(object):
+    """Collect lines for a RotatingFileHandler and write them at once.
+
+    Size based rotation of the handler is honoured when the buffer
+    is flushed.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.lines = []
+
+    def append(self, line):
+        self.lines.append(line)
+
+    def flush(self):
+        """Write all buffered lines with a single write call."""
+        if not self.lines:
+            return
+        data = "\n".join(self.lines) + "\n"
+        self.lines = []
+        handler = self.handler
+        handler.acquire()
+        try:
+            if handler.stream is None:
+                handler.stream = handler._open()
+            if handler.maxBytes > 0:
+                handler.stream.seek(0, 2)
+                position = handler.stream.tell()
+                if position and position + len(data) >= handler.maxBytes:
+                    handler.doRollover()
+                    if handler.stream is None:
+                        handler.stream = handler._open()
+            handler.stream.write(data)
+            handler.stream.flush()
+        finally:
+            handler.release()
 
-    recap_logger.info("****PLAY TIME****")
-    recap_logger.info("Start time: %s" % start_time)
-    recap_logger.info("End time: %s" % end_time)
-    recap_logger.info("Total: %s" % (end_time - start_time))
-    recap_logger.info("****PLAY RECAP****")
-    if rc != 0 or not status_line:
-        recap_logger.info("Ansible-pull return code: %s" % rc)
-        recap_logger.info("Client status: failed")
-    else:
-        recap_logger.info(status_line.rstrip())
-        recap_logger.info("Client status: %s" % parse_client_status(status_line))
-    return
 
+class LogDispatcher(object):
+    """Dispatch output lines of an Ansible run to stdout and log files.
 
-def parse_client_status(status_line):
-    """Read client status from recap log.
+    Lines are classified by their prefix with a single dict lookup.
+    File output is buffered and written on flush, which should be
+    called at task boundaries and at the end of a run. The buffers are
+    also flushed if they grow beyond max_lines.
+    """
+
+    # Maps line prefix to console color and status log
+    LINE_CLASSES = {
+        "ok": ("\033[0;32m%s\033[0;0m", "ok"),
+        "changed": ("\033[1;33m%s\033[0;0m", "changed"),
+        "failed": ("\033[0;31m%s\033[0;0m", "failed"),
+        "fatal": ("\033[0;31m%s\033[0;0m", "failed"),
+        "skipping": ("\033[1;36m%s\033[0;0m", None),
+    }
+    # Length of the longest prefix including the colon
+    PREFIX_LENGTH = max(len(prefix) for prefix in LINE_CLASSES) + 1
+
+    def __init__(self, log_dir, console, main_logger, status_loggers, max_lines=1000):
+        self.log_dir = log_dir
+        self.console = console
+        self.main = BufferedLogFile(main_logger.handlers[0])
+        self.status = dict(
+            (name, BufferedLogFile(status_logger.handlers[0]))
+            for name, status_logger in status_loggers.items()
+        )
+        self.max_lines = max_lines
+        self.pending = 0
+        self.log_dir_checked = False
+        self.second = None
+        self.stamp = None
+
+    def timestamp(self):
+        """Return the time formatted like the default log formatter."""
+        now = int(time.time())
+        if now != self.second:
+            self.second = now
+            self.stamp = time.strftime("%b %d %Y %H:%M:%S %Z", time.localtime(now))
+        return self.stamp
+
+    def console_enabled(self):
+        return not self.console.disabled and self.console.isEnabledFor(logging.INFO)
+
+    def write(self, line, task_line=None):
+        """Write a line to stdout and the log files.
 
-    Status can have one of the following forms:
-    * ok
-    * changed
-    * failed
+        Lines with a status are also written to the matching status log,
+        preceded by task_line.
+        """
+        if not self.log_dir_checked:
+            if not os.path.isdir(self.log_dir):
+                configer.create_dir(self.log_dir)
+            self.log_dir_checked = True
 
-    We expect IndexError because play recap will be
-    empty if no matching hosts were found.
-    Client status will be set to failed in that case.
+        line = line.rstrip()
+        stamp = self.timestamp()
+        colon = line.find(":", 0, self.PREFIX_LENGTH)
+        line_class = self.LINE_CLASSES.get(line[:colon]) if colon > 0 else None
 
-    Status will also be set to failed of no log file
-    could be found."""
+        if line_class is None:
+            if self.console_enabled():
+                self.console.info(line)
+        else:
+            color, status = line_class
+            if status is not None:
+                status_file = self.status[status]
+                if task_line is not None:
+                    status_file.append("%s\t%s" % (stamp, task_line.rstrip()))
+                status_file.append("%s\t%s" % (stamp, line))
+            if self.console_enabled():
+                self.console.info(color % line)
 
-    status = "failed"
-    try:
-        status_list = status_line.split(":")[1].split()
-        for f in status_list:
-            g = f.split("=")
-            if g[1] != "0" and g[0] != "skipped":
-                status = g[0]
-    except IndexError:
-        pass
-    return status
+        self.main.append("%s\t%s" % (stamp, line))
+        self.pending += 1
+        if self.pending >= self.max_lines:
+            self.flush()
+
+    def write_stderr(self, line):
+        """Write a line from stderr to stdout and the main log file.
+
+        Ansible writes warnings and errors to stderr. The level for the
+        console is derived from the prefix of the line."""
+        line = line.rstrip()
+        if line.startswith("[WARNING]") or line.startswith("[DEPRECATION WARNING]"):
+            level = logging.WARNING
+        elif line.startswith("ERROR!") or line.startswith("[ERROR]"):
+            level = logging.ERROR
+        else:
+            level = logging.INFO
+        if not self.console.disabled:
+            self.console.log(level, line)
+        self.main.append("%s\tstderr: %s" % (self.timestamp(), line))
+        self.pending += 1
+        if self.pending >= self.max_lines:
+            self.flush()
+
+    def flush(self):
+        """Write buffered lines to the log files."""
+        self.main.flush()
+        for status_file in self.status.values():
+            status_file.flush()
+        self.pending = 0
 
 
 def write_log(line, task_line=None, debug=False):
@@ -126,37 +355,15 @@ def write_log(line, task_line=None, debug=False):
 
 
     Highlight ansible run status in stdout."""
-    if not os.path.isdir(CFG["log_dir"]):
-        configer.create_dir(CFG["log_dir"])
-    if line.startswith("ok:"):
-        if task_line is not None:
-            ok_logger.info(task_line.rstrip())
-        console_logger.info("\033[0;32m%s\033[0;0m" % line.rstrip())
-        ok_logger.info(line.rstrip())
-    elif line.startswith("changed:"):
-        if task_line is not None:
-            changed_logger.info(task_line.rstrip())
-        console_logger.info("\033[1;33m%s\033[0;0m" % line.rstrip())
-        changed_logger.info(line.rstrip())
-    elif line.startswith("failed:") or line.startswith("fatal:"):
-        if task_line is not None:
-            failed_logger.info(task_line.rstrip())
-        console_logger.info("\033[0;31m%s\033[0;0m" % line.rstrip())
-        failed_logger.info(line.rstrip())
-    elif line.startswith("skipping:"):
-        console_logger.info("\033[1;36m%s\033[0;0m" % line.rstrip())
-    else:
-        console_logger.info(line.rstrip())
-    logfile_logger.info(line.rstrip())
+    _dispatcher().write(line, task_line)
     return
 
 
-console_logger = get_logger("console_logger", formatter="simple")
-logfile_logger = get_logger("logfile_logger", logfile_main, 5000000)
-ok_logger = get_logger("ok_logger", logfile_ok)
-changed_logger = get_logger("changed_logger", logfile_changed)
-failed_logger = get_logger("failed_logger", logfile_failed)
-recap_logger = get_logger("recap_logger", logfile_recap)
+def write_stderr_log(line):
+    """Write a line from stderr to stdout and the main log file."""
+    _dispatcher().write_stderr(line)
+    return
+
 
 if __name__ == "__main__":
     pass
@@ -0,0 +1,198 @@
+"""logrotate
+=================
+
+Rotate log files and keep their history small.
+
+Rotating a log file only renames it to <name>.<timestamp>. This is
+cheap, so rotating at the start of a run does not slow the run down.
+The rotated files are compressed with gzip later, in a background
+thread started once the run has finished. The history of every log
+file is then pruned to a number of files, and the history of all log
+files in a directory to a total size and age.
+
+Use history and open_log to read current and rotated log files alike.
+"""
+
+
+import datetime
+import gzip
+import logging.handlers
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+ROTATED_PATTERN = re.compile(r"\.\d{8}T\d{6}\.\d{6}(\.gz)?$")
+# Numbered backups written by RotatingFileHandler before, .1 is the newest
+LEGACY_PATTERN = re.compile(r"\.([1-9]\d*)(\.gz)?$")
+TIMESTAMP_FORMAT = "%Y%m%dT%H%M%S.%f"
+
+_lock = threading.Lock()
+
+
+def rotated_name(path, now=None):
+    """Return an unused name for path rotated at now."""
+    now = time.time() if now is None else now
+    while True:
+        stamp = datetime.datetime.fromtimestamp(now).strftime(TIMESTAMP_FORMAT)
+        name = "%s.%s" % (path, stamp)
+        if not os.path.exists(name) and not os.path.exists(name + ".gz"):
+            return name
+        now += 0.000001
+
+
+def rotated_files(path):
+    """Return the rotated files of the log file path, newest first."""
+    log_dir, base_name = os.path.split(path)
+    try:
+        names = [
+            entry.name
+            for entry in os.scandir(log_dir or ".")
+            if entry.name.startswith(base_name)
+        ]
+    except OSError:
+        return []
+    rotated = []
+    legacy = []
+    for name in names:
+        suffix = name[len(base_name) :]
+        if ROTATED_PATTERN.fullmatch(suffix):
+            rotated.append(name)
+        else:
+            match = LEGACY_PATTERN.fullmatch(suffix)
+            if match:
+                legacy.append((int(match.group(1)), name))
+    # The timestamp sorts like the time of rotation
+    rotated.sort(reverse=True)
+    rotated += [name for _, name in sorted(legacy)]
+    return [os.path.join(log_dir, name) for name in rotated]
+
+
+def history(path):
+    """Return the log file path, if it exists, and its rotated files."""
+    files = rotated_files(path)
+    if os.path.isfile(path):
+        files.insert(0, path)
+    return files
+
+
+def open_log(path):
+    """Open a current or rotated log file for reading as text."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", errors="replace")
+    return open(path, "r", errors="replace")
+
+
+class RotatingLogHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler renaming the log file to a timestamped name.
+
+    Older rotated files are neither renamed nor deleted. This is left to
+    maintain.
+    """
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename):
+            os.replace(self.baseFilename, rotated_name(self.baseFilename))
+        if not self.delay:
+            self.stream = self._open()
+
+
+def compress(path):
+    """Compress the rotated file path to path.gz and remove path."""
+    fd, tmp_file = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=".%s." % os.path.basename(path)
+    )
+    try:
+        with open(path, "rb") as source, os.fdopen(fd, "wb") as raw:
+            with gzip.GzipFile(
+                os.path.basename(path), "wb", fileobj=raw, mtime=0
+            ) as target:
+                shutil.copyfileobj(source, target)
+        shutil.copystat(path, tmp_file)
+        os.replace(tmp_file, path + ".gz")
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    os.remove(path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def prune(log_files, keep, max_bytes, max_age, now=None):
+    """Remove rotated files of log_files beyond the limits.
+
+    Every log file keeps at most keep rotated files. Rotated files older
+    than max_age seconds are removed. Then the oldest rotated files of
+    all log files are removed until they take at most max_bytes.
+    A limit of 0 is no limit. Return the list of removed files.
+    """
+    now = time.time() if now is None else now
+    removed = []
+    remaining = []
+    for log_file in log_files:
+        for i, path in enumerate(rotated_files(log_file)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if (keep and i >= keep) or (max_age and now - stat.st_mtime > max_age):
+                _remove(path)
+                removed.append(path)
+            else:
+                remaining.append((stat.st_mtime, stat.st_size, path))
+
+    if max_bytes:
+        remaining.sort(reverse=True)
+        total = 0
+        for _, size, path in remaining:
+            total += size
+            if total > max_bytes:
+                _remove(path)
+                removed.append(path)
+    return removed
+
+
+def maintain(log_files, keep=0, max_bytes=0, max_age=0):
+    """Compress the rotated files of log_files and prune their history."""
+    with _lock:
+        for log_file in log_files:
+            for path in rotated_files(log_file):
+                if path.endswith(".gz"):
+                    continue
+                try:
+                    compress(path)
+                except OSError:
+                    # Compressed by another ants process or not readable.
+                    # Left uncompressed until the next run.
+                    continue
+        prune(log_files, keep, max_bytes, max_age)
+
+
+def start_maintenance(log_files, keep=0, max_bytes=0, max_age=0):
+    """Run maintain in a background thread and return the thread.
+
+    The thread is not a daemon thread, so the interpreter waits for it
+    before exiting.
+    """
+    thread = threading.Thread(
+        target=maintain,
+        args=(log_files, keep, max_bytes, max_age),
+        name="ants-logrotate",
+    )
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    pass
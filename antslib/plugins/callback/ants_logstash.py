@@ -7,13 +7,20 @@
 from __future__ import absolute_import, division, print_function
 
 from builtins import str
-import copy
+import atexit
+import fnmatch
+import gzip
+import http.client
 import json
 import logging
 import os
+import queue
 import socket
+import threading
+import time
 import uuid
 from datetime import datetime
+from types import MappingProxyType
 
 from ansible.plugins.callback import CallbackBase
 
@@ -40,11 +47,116 @@ DOCUMENTATION = """
         env:
             - name: LOGSTASH_PORT
         default: 5000
+      transport:
+        description: Send events over TCP or post them in bulk over HTTP (tcp or http)
+        env:
+          - name: LOGSTASH_TRANSPORT
+        default: tcp
+      http_scheme:
+        description: Scheme of the HTTP endpoint (http or https)
+        env:
+          - name: LOGSTASH_HTTP_SCHEME
+        default: http
+      http_path:
+        description: Path of the HTTP endpoint, e.g. /_bulk for Elasticsearch
+        env:
+          - name: LOGSTASH_HTTP_PATH
+        default: /
+      http_timeout:
+        description: Timeout of HTTP requests in seconds
+        env:
+          - name: LOGSTASH_HTTP_TIMEOUT
+        default: 10
+      http_compress_level:
+        description: gzip level of HTTP request bodies. 0 disables compression.
+        env:
+          - name: LOGSTASH_HTTP_COMPRESS_LEVEL
+        default: 6
+      bulk_index:
+        description: Index for the Elasticsearch bulk API. Empty sends plain NDJSON.
+        env:
+          - name: LOGSTASH_BULK_INDEX
+        default: ""
       type:
         description: Message type
         env:
           - name: LOGSTASH_TYPE
         default: ants
+      batch_size:
+        description: Maximum number of events sent to Logstash in one write
+        env:
+          - name: LOGSTASH_BATCH_SIZE
+        default: 100
+      batch_bytes:
+        description: Maximum number of bytes sent to Logstash in one write
+        env:
+          - name: LOGSTASH_BATCH_BYTES
+        default: 1048576
+      flush_interval:
+        description: Maximum number of seconds an event waits in a partial batch
+        env:
+          - name: LOGSTASH_FLUSH_INTERVAL
+        default: 1.0
+      queue_size:
+        description: Maximum number of events buffered in memory
+        env:
+          - name: LOGSTASH_QUEUE_SIZE
+        default: 10000
+      queue_policy:
+        description: What to do with new events when the buffer is full (block or drop)
+        env:
+          - name: LOGSTASH_QUEUE_POLICY
+        default: block
+      flush_timeout:
+        description: Maximum number of seconds to wait for buffered events at the end of a playbook
+        env:
+          - name: LOGSTASH_FLUSH_TIMEOUT
+        default: 10
+      spool_dir:
+        description: Directory where events are kept while Logstash is unreachable. Empty disables the spool.
+        env:
+          - name: LOGSTASH_SPOOL_DIR
+        default: ""
+      spool_max_bytes:
+        description: Maximum size of the spool. The oldest events are removed first.
+        env:
+          - name: LOGSTASH_SPOOL_MAX_BYTES
+        default: 52428800
+      spool_segment_bytes:
+        description: Size at which a new spool segment file is started
+        env:
+          - name: LOGSTASH_SPOOL_SEGMENT_BYTES
+        default: 1048576
+      results:
+        description: Add the flattened results of tasks to task events
+        env:
+          - name: LOGSTASH_RESULTS
+        default: false
+      results_max_depth:
+        description: Maximum nesting depth of shipped result keys
+        env:
+          - name: LOGSTASH_RESULTS_MAX_DEPTH
+        default: 4
+      results_max_field_bytes:
+        description: Maximum size of a single shipped result field
+        env:
+          - name: LOGSTASH_RESULTS_MAX_FIELD_BYTES
+        default: 4096
+      results_max_event_bytes:
+        description: Maximum size of all shipped result fields of an event
+        env:
+          - name: LOGSTASH_RESULTS_MAX_EVENT_BYTES
+        default: 32768
+      results_include:
+        description: Comma separated patterns of result keys to ship, e.g. msg,rc,diff.*. Empty ships all keys.
+        env:
+          - name: LOGSTASH_RESULTS_INCLUDE
+        default: ""
+      results_exclude:
+        description: Comma separated patterns of result keys not to ship
+        env:
+          - name: LOGSTASH_RESULTS_EXCLUDE
+        default: _ansible*,invocation,ansible_facts,*stdout_lines,*stderr_lines
 """
 
 
@@ -56,6 +168,488 @@ except ImportError:
     HAS_LOGSTASH = False
 
 
+# Marks the end of the event stream for the sender thread
+_STOP = object()
+# Record attribute holding the pre-serialized static fields of an event
+STATIC_FIELDS = "ants_static_fields"
+
+RESULTS_EXCLUDE = "_ansible*,invocation,ansible_facts,*stdout_lines,*stderr_lines"
+# Replaces values nested deeper than the maximum depth
+DEPTH_MARKER = "[nested too deep]"
+# Appended to values cut at the maximum field size
+TRUNCATION_MARKER = "...[truncated]"
+# Maximum number of keys listed in ansible_result_truncated
+MAX_TRUNCATED_KEYS = 20
+# The walk over a result stops once less than this is left of the event size
+MIN_FIELD_BYTES = 64
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def split_patterns(patterns):
+    """Return the list of comma separated patterns."""
+    return [pattern.strip() for pattern in patterns.split(",") if pattern.strip()]
+
+
+def matches_any(key, patterns):
+    return any(fnmatch.fnmatchcase(key, pattern) for pattern in patterns)
+
+
+def nested_items(value):
+    """Return an iterator over the items of a dict or a list of containers.
+
+    Return None for scalars and lists of scalars.
+    """
+    if isinstance(value, dict):
+        return iter(value.items())
+    if isinstance(value, (list, tuple)) and any(
+        isinstance(element, (dict, list, tuple)) for element in value
+    ):
+        return enumerate(value)
+    return None
+
+
+def truncate_string(value, max_bytes):
+    """Return value cut to at most max_bytes UTF-8 bytes and if it was cut."""
+    if len(value) <= max_bytes // 4:
+        # Short enough even if every character takes 4 bytes
+        return value, False
+    encoded = value[:max_bytes].encode("utf-8", "replace")
+    if len(encoded) <= max_bytes and len(value) <= max_bytes:
+        return value, False
+    cut = max(0, max_bytes - len(TRUNCATION_MARKER))
+    return encoded[:cut].decode("utf-8", "ignore") + TRUNCATION_MARKER, True
+
+
+def serialize_fields(fields):
+    """Return fields as the members of a JSON object, without the braces."""
+    return json.dumps(dict(fields))[1:-1].encode("utf-8")
+
+
+class StaticFieldsFormatter(object):
+    """Splice pre-serialized static fields into the events of a formatter.
+
+    Fields that are the same for every event of a playbook, like the host
+    and the session, are serialized once with serialize_fields. Records
+    carry them in the attribute STATIC_FIELDS, which is taken off the
+    record and inserted into the JSON object returned by formatter. This
+    only works for version 1 formatters, which put the extra fields of a
+    record on the top level of the event.
+    """
+
+    def __init__(self, formatter):
+        self.formatter = formatter
+
+    def format(self, record):
+        static = record.__dict__.pop(STATIC_FIELDS, None)
+        event = self.formatter.format(record)
+        if not static:
+            return event
+        return event[:-1] + b", " + static + b"}"
+
+
+class Spool(object):
+    """Append-only, size-capped store for events that could not be sent.
+
+    Events are appended to segment files in spool_dir. File names start with
+    a timestamp so that sorting them by name returns them oldest first.
+    If the spool grows beyond max_bytes, the oldest segments are removed.
+    """
+
+    SUFFIX = ".ndjson"
+
+    def __init__(self, spool_dir, max_bytes=52428800, segment_bytes=1048576):
+        self.spool_dir = spool_dir
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.segment = None
+        if not os.path.isdir(spool_dir):
+            os.makedirs(spool_dir, 0o700)
+        self.recover()
+
+    def segments(self):
+        """Return paths of all segments, oldest first."""
+        return [
+            os.path.join(self.spool_dir, name)
+            for name in sorted(os.listdir(self.spool_dir))
+            if name.endswith(self.SUFFIX)
+        ]
+
+    def recover(self):
+        """Release segments claimed by runs that died while replaying them."""
+        for name in os.listdir(self.spool_dir):
+            segment, _, pid = name.rpartition(".")
+            if not segment.endswith(self.SUFFIX) or not pid.isdigit():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                os.rename(
+                    os.path.join(self.spool_dir, name),
+                    os.path.join(self.spool_dir, segment),
+                )
+            except OSError:
+                pass
+
+    def append(self, payload):
+        """Append newline terminated events to the current segment."""
+        if self.segment is None or os.path.getsize(self.segment) >= self.segment_bytes:
+            self.segment = os.path.join(
+                self.spool_dir,
+                "%017d-%d%s" % (int(time.time() * 1000000), os.getpid(), self.SUFFIX),
+            )
+        with open(self.segment, "ab") as f:
+            f.write(payload)
+        self.evict()
+
+    def evict(self):
+        """Remove the oldest segments until the spool fits into max_bytes."""
+        segments = [(path, os.path.getsize(path)) for path in self.segments()]
+        total = sum(size for path, size in segments)
+        for path, size in segments:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            if path == self.segment:
+                self.segment = None
+
+    def replay(self, send):
+        """Pass every segment to send, oldest first, and remove it on success.
+
+        Segments are renamed before they are read so that concurrent runs do
+        not replay the same events twice. Stop at the first failed send.
+        Return the number of replayed segments.
+        """
+        replayed = 0
+        for path in self.segments():
+            if path == self.segment:
+                continue
+            claimed = "%s.%d" % (path, os.getpid())
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            with open(claimed, "rb") as f:
+                payload = f.read()
+            if not send(payload):
+                os.rename(claimed, path)
+                break
+            os.remove(claimed)
+            replayed += 1
+        return replayed
+
+
+class TCPTarget(object):
+    """Send events over the socket of a logstash.TCPLogstashHandler."""
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def makePickle(self, record):
+        return self.handler.makePickle(record)
+
+    def send(self, payload):
+        """Send payload and return True on success."""
+        handler = self.handler
+        if handler.sock is None:
+            handler.createSocket()
+        if handler.sock is not None:
+            try:
+                handler.sock.sendall(payload)
+                return True
+            except OSError:
+                handler.sock.close()
+                handler.sock = None
+        return False
+
+    def close(self):
+        self.handler.close()
+
+
+class HTTPTarget(object):
+    """Post events as newline delimited JSON to an HTTP endpoint.
+
+    Every payload is sent with a single POST request on a connection that
+    is kept open for the next one. Request bodies are gzip compressed
+    unless compress_level is 0. With bulk_index, every event is preceded
+    by an index action as expected by the Elasticsearch bulk API.
+
+    Requests rejected with a client error other than 408 or 429 are
+    counted in rejected and not retried, as sending them again would not
+    help.
+    """
+
+    CONTENT_TYPE = "application/x-ndjson"
+
+    def __init__(
+        self,
+        formatter,
+        host,
+        port,
+        path="/",
+        scheme="http",
+        bulk_index="",
+        compress_level=6,
+        timeout=10,
+    ):
+        if scheme not in ("http", "https"):
+            raise ValueError("HTTP scheme must be http or https")
+        self.formatter = formatter
+        self.host = host
+        self.port = port
+        self.path = path
+        self.scheme = scheme
+        self.compress_level = compress_level
+        self.timeout = timeout
+        self.action = None
+        if bulk_index:
+            action = json.dumps({"index": {"_index": bulk_index}})
+            self.action = ("%s\n" % action).encode("utf-8")
+        self.connection = None
+        self.requests = 0
+        self.sent_bytes = 0
+        self.rejected = 0
+
+    def makePickle(self, record):
+        return self.formatter.format(record) + b"\n"
+
+    def body(self, payload):
+        """Return the request body for a payload of events."""
+        if self.action is not None:
+            events = payload.splitlines(True)
+            payload = b"".join(self.action + event for event in events)
+        if self.compress_level:
+            payload = gzip.compress(payload, self.compress_level)
+        return payload
+
+    def connect(self):
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def send(self, payload):
+        """Post payload and return True unless it should be sent again later."""
+        body = self.body(payload)
+        headers = {"Content-Type": self.CONTENT_TYPE}
+        if self.compress_level:
+            headers["Content-Encoding"] = "gzip"
+        # The server may have closed a kept-alive connection. Retry those
+        # once on a new connection.
+        for _ in range(2):
+            reused = self.connection is not None
+            if not reused:
+                self.connection = self.connect()
+            try:
+                self.connection.request("POST", self.path, body, headers)
+                response = self.connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                self.close()
+                if reused:
+                    continue
+                return False
+            if response.will_close:
+                self.close()
+            self.requests += 1
+            self.sent_bytes += len(body)
+            if 200 <= response.status < 300:
+                return True
+            if 400 <= response.status < 500 and response.status not in (408, 429):
+                self.rejected += 1
+                return True
+            return False
+        return False
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class BatchingHandler(logging.Handler):
+    """Queue log records and ship them to Logstash from a background thread.
+
+    Records are formatted by the target in the sender thread and written
+    in batches of up to batch_size events or batch_bytes bytes. A partial
+    batch is sent after flush_interval seconds. If the queue is full, new
+    records either block the caller or are dropped, depending on policy.
+
+    If a spool is given, events spooled by earlier runs are replayed first.
+    Once a send fails, the server is considered offline for the rest of the
+    run and all further events go straight to the spool.
+
+    close waits at most flush_timeout seconds for the sender thread. Records
+    it did not get to by then are written to the spool. close is also
+    called at exit, for runs that end without closing the handler.
+    """
+
+    def __init__(
+        self,
+        target,
+        batch_size=100,
+        flush_interval=1.0,
+        batch_bytes=1048576,
+        queue_size=10000,
+        policy="block",
+        spool=None,
+        flush_timeout=10,
+    ):
+        super(BatchingHandler, self).__init__()
+        if policy not in ("block", "drop"):
+            raise ValueError("Queue policy must be block or drop")
+        self.target = target
+        self.batch_size = max(1, batch_size)
+        self.batch_bytes = max(1, batch_bytes)
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.spool = spool
+        self.flush_timeout = flush_timeout
+        self.offline = False
+        # Set by close if the sender thread did not finish in time
+        self.abandoned = False
+        self.closed = False
+        self.spool_lock = threading.Lock()
+        self.dropped = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(
+            target=self._run, name="ants-logstash-sender", daemon=True
+        )
+        self.thread.start()
+        atexit.register(self.close)
+
+    def emit(self, record):
+        try:
+            if self.policy == "block":
+                self.queue.put(record)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        if self.spool is not None:
+            try:
+                self.replayed = self.spool.replay(self._write)
+            except OSError:
+                # Keep whatever is left for the next run
+                pass
+        batch = []
+        batch_bytes = 0
+        deadline = None
+        while True:
+            if self.abandoned:
+                self._spool(batch)
+                return
+            if batch:
+                timeout = max(0, deadline - time.monotonic())
+            else:
+                timeout = None
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+
+            if record is _STOP:
+                self._send(batch)
+                return
+            if record is not None:
+                try:
+                    event = self.target.makePickle(record)
+                except Exception:
+                    self.handleError(record)
+                    event = None
+                if event:
+                    if not batch:
+                        deadline = time.monotonic() + self.flush_interval
+                    batch.append(event)
+                    batch_bytes += len(event)
+            if batch and (
+                record is None
+                or len(batch) >= self.batch_size
+                or batch_bytes >= self.batch_bytes
+            ):
+                self._send(batch)
+                batch = []
+                batch_bytes = 0
+
+    def _send(self, batch):
+        """Write a list of formatted events with a single send."""
+        if not batch:
+            return
+        if not self._write(b"".join(batch)):
+            self._spool(batch)
+
+    def _spool(self, batch):
+        """Write a list of formatted events to the spool or drop them."""
+        if not batch:
+            return
+        if self.spool is not None:
+            payload = b"".join(batch)
+            try:
+                with self.spool_lock:
+                    self.spool.append(payload)
+                self.spooled += len(payload)
+                return
+            except OSError:
+                pass
+        self.dropped += len(batch)
+
+    def _write(self, payload):
+        """Send payload to Logstash and return True on success."""
+        if self.offline:
+            return False
+        if self.target.send(payload):
+            return True
+        self.offline = True
+        return False
+
+    def close(self, timeout=None):
+        """Send all buffered records, waiting at most timeout seconds.
+
+        timeout defaults to flush_timeout. If the sender thread does not
+        finish in time, the records left in the queue are spooled.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if timeout is None:
+            timeout = self.flush_timeout
+        deadline = time.monotonic() + timeout
+        if self.thread.is_alive():
+            try:
+                self.queue.put(_STOP, timeout=max(0, deadline - time.monotonic()))
+            except queue.Full:
+                pass
+            self.thread.join(max(0, deadline - time.monotonic()))
+        if self.thread.is_alive():
+            # The sender is stuck in a send. It spools its own batch once
+            # the send returns, take the rest from the queue.
+            self.abandoned = True
+            self._spool(self._drain())
+        else:
+            self.target.close()
+        super(BatchingHandler, self).close()
+
+    def _drain(self):
+        """Return the formatted events of all queued records."""
+        events = []
+        while True:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                return events
+            if record is _STOP:
+                continue
+            try:
+                events.append(self.target.makePickle(record))
+            except Exception:
+                self.handleError(record)
+
+
 class CallbackModule(CallbackBase):
     """
     ansible logstash callback plugin
@@ -72,6 +666,14 @@ class CallbackModule(CallbackBase):
             }
         }
 
+    logstash config for LOGSTASH_TRANSPORT=http:
+        input {
+            http {
+                port => 5000
+                additional_codecs => { "application/x-ndjson" => "json_lines" }
+            }
+        }
+
     Requires:
         python-logstash
 
@@ -79,6 +681,36 @@ class CallbackModule(CallbackBase):
         LOGSTASH_SERVER   (optional): defaults to localhost
         LOGSTASH_PORT     (optional): defaults to 5000
         LOGSTASH_TYPE     (optional): defaults to ants
+        LOGSTASH_TRANSPORT      (optional): defaults to tcp
+        LOGSTASH_HTTP_SCHEME    (optional): defaults to http
+        LOGSTASH_HTTP_PATH      (optional): defaults to /
+        LOGSTASH_HTTP_TIMEOUT   (optional): defaults to 10
+        LOGSTASH_HTTP_COMPRESS_LEVEL (optional): defaults to 6
+        LOGSTASH_BULK_INDEX     (optional): defaults to no index
+        LOGSTASH_BATCH_SIZE     (optional): defaults to 100
+        LOGSTASH_BATCH_BYTES    (optional): defaults to 1048576
+        LOGSTASH_FLUSH_INTERVAL (optional): defaults to 1.0
+        LOGSTASH_QUEUE_SIZE     (optional): defaults to 10000
+        LOGSTASH_QUEUE_POLICY   (optional): defaults to block
+        LOGSTASH_FLUSH_TIMEOUT  (optional): defaults to 10
+        LOGSTASH_SPOOL_DIR      (optional): defaults to no spool
+        LOGSTASH_SPOOL_MAX_BYTES     (optional): defaults to 52428800
+        LOGSTASH_SPOOL_SEGMENT_BYTES (optional): defaults to 1048576
+        LOGSTASH_RESULTS        (optional): defaults to false
+        LOGSTASH_RESULTS_MAX_DEPTH       (optional): defaults to 4
+        LOGSTASH_RESULTS_MAX_FIELD_BYTES (optional): defaults to 4096
+        LOGSTASH_RESULTS_MAX_EVENT_BYTES (optional): defaults to 32768
+        LOGSTASH_RESULTS_INCLUDE (optional): defaults to all keys
+        LOGSTASH_RESULTS_EXCLUDE (optional): defaults to RESULTS_EXCLUDE
+
+    Events are sent by a background thread so that a slow Logstash server
+    does not delay the playbook. Events that can not be sent are kept in
+    the spool and replayed at the start of the next run.
+
+    With LOGSTASH_TRANSPORT=http, each batch is posted as compressed
+    NDJSON over a kept-alive connection, to the http input of Logstash or,
+    with LOGSTASH_BULK_INDEX and LOGSTASH_HTTP_PATH=/_bulk, to the bulk
+    API of Elasticsearch.
     """
 
     CALLBACK_VERSION = 2.0
@@ -99,11 +731,33 @@ class CallbackModule(CallbackBase):
             self.logger = logging.getLogger("python-logstash-logger")
             self.logger.setLevel(logging.DEBUG)
 
-            self.handler = logstash.TCPLogstashHandler(
-                host=os.getenv("LOGSTASH_SERVER", "localhost"),
-                port=int(os.getenv("LOGSTASH_PORT", 5000)),
-                version=int(os.getenv("LOGSTASH_FORMATTER_VERSION", "1")),
-                message_type=os.getenv("LOGSTASH_TYPE", "ants"),
+            self.flush_timeout = float(os.getenv("LOGSTASH_FLUSH_TIMEOUT", 10))
+            self.formatter_version = int(os.getenv("LOGSTASH_FORMATTER_VERSION", "1"))
+            spool = None
+            spool_dir = os.getenv("LOGSTASH_SPOOL_DIR", "")
+            if spool_dir:
+                try:
+                    spool = Spool(
+                        spool_dir,
+                        max_bytes=int(os.getenv("LOGSTASH_SPOOL_MAX_BYTES", 52428800)),
+                        segment_bytes=int(
+                            os.getenv("LOGSTASH_SPOOL_SEGMENT_BYTES", 1048576)
+                        ),
+                    )
+                except OSError as err:
+                    self._display.warning(
+                        "Logstash Callback: Spool disabled. Could not create %s: %s"
+                        % (spool_dir, err)
+                    )
+            self.handler = BatchingHandler(
+                self.make_target(),
+                batch_size=int(os.getenv("LOGSTASH_BATCH_SIZE", 100)),
+                flush_interval=float(os.getenv("LOGSTASH_FLUSH_INTERVAL", 1.0)),
+                batch_bytes=int(os.getenv("LOGSTASH_BATCH_BYTES", 1048576)),
+                queue_size=int(os.getenv("LOGSTASH_QUEUE_SIZE", 10000)),
+                policy=os.getenv("LOGSTASH_QUEUE_POLICY", "block"),
+                spool=spool,
+                flush_timeout=self.flush_timeout,
             )
             self._display.v("Logstash Callback:\tLogger configuration:")
             self._display.v(
@@ -116,12 +770,27 @@ class CallbackModule(CallbackBase):
             )
             self._display.v(
                 "Logstash Callback:\t\tLogstash formatter version: %s"
-                % os.getenv("LOGSTASH_FORMATTER_VERSION", "1")
+                % self.formatter_version
             )
             self._display.v(
                 "Logstash Callback:\t\tLogstash message type: %s"
                 % os.getenv("LOGSTASH_TYPE", "ants")
             )
+            self._display.v(
+                "Logstash Callback:\t\tTransport: %s"
+                % type(self.handler.target).__name__
+            )
+            self._display.v(
+                "Logstash Callback:\t\tBatch size: %s events or %s bytes, flush interval: %ss, queue: %s (%s)"
+                % (
+                    self.handler.batch_size,
+                    self.handler.batch_bytes,
+                    self.handler.flush_interval,
+                    self.handler.queue.maxsize,
+                    self.handler.policy,
+                )
+            )
+            self._display.v("Logstash Callback:\t\tSpool directory: %s" % spool_dir)
 
             self.logger.addHandler(self.handler)
             self.fqdn = socket.getfqdn()
@@ -129,13 +798,77 @@ class CallbackModule(CallbackBase):
             self.session = str(uuid.uuid1())
             self.errors = 0
 
+            # Fields shared by all events of this process
+            self.base_data = MappingProxyType(
+                {
+                    "@host": self.fqdn,
+                    "@host_short": self.hostname,
+                    "@program": "ants",
+                    "session": self.session,
+                }
+            )
+            self.set_static_fields()
+            # String representation of each task, keyed by task uuid
+            self.task_fields = {}
+
+            self.ship_results = os.getenv("LOGSTASH_RESULTS", "false").lower() in (
+                "yes",
+                "true",
+                "1",
+            )
+            self.results_max_depth = int(os.getenv("LOGSTASH_RESULTS_MAX_DEPTH", 4))
+            self.results_max_field_bytes = int(
+                os.getenv("LOGSTASH_RESULTS_MAX_FIELD_BYTES", 4096)
+            )
+            self.results_max_event_bytes = int(
+                os.getenv("LOGSTASH_RESULTS_MAX_EVENT_BYTES", 32768)
+            )
+            self.results_include = split_patterns(
+                os.getenv("LOGSTASH_RESULTS_INCLUDE", "")
+            )
+            self.results_exclude = split_patterns(
+                os.getenv("LOGSTASH_RESULTS_EXCLUDE", RESULTS_EXCLUDE)
+            )
+            self._display.v(
+                "Logstash Callback:\t\tShip task results: %s" % self.ship_results
+            )
+
         self.start_time = datetime.utcnow()
-        self.base_data = {
-            "@host": self.fqdn,
-            "@host_short": self.hostname,
-            "@program": "ants",
-            "session": self.session,
-        }
+
+    def make_target(self):
+        """Return the target for the transport set in LOGSTASH_TRANSPORT."""
+        host = os.getenv("LOGSTASH_SERVER", "localhost")
+        port = int(os.getenv("LOGSTASH_PORT", 5000))
+        version = self.formatter_version
+        message_type = os.getenv("LOGSTASH_TYPE", "ants")
+        transport = os.getenv("LOGSTASH_TRANSPORT", "tcp")
+        if transport == "http":
+            if version == 0:
+                formatter = logstash.LogstashFormatterVersion0(message_type)
+            else:
+                formatter = StaticFieldsFormatter(
+                    logstash.LogstashFormatterVersion1(message_type)
+                )
+            return HTTPTarget(
+                formatter,
+                host,
+                port,
+                path=os.getenv("LOGSTASH_HTTP_PATH", "/"),
+                scheme=os.getenv("LOGSTASH_HTTP_SCHEME", "http"),
+                bulk_index=os.getenv("LOGSTASH_BULK_INDEX", ""),
+                compress_level=int(os.getenv("LOGSTASH_HTTP_COMPRESS_LEVEL", 6)),
+                timeout=float(os.getenv("LOGSTASH_HTTP_TIMEOUT", 10)),
+            )
+        if transport != "tcp":
+            self._display.warning(
+                "Logstash Callback: Unknown transport %s. Using tcp." % transport
+            )
+        handler = logstash.TCPLogstashHandler(
+            host=host, port=port, version=version, message_type=message_type
+        )
+        if version == 1:
+            handler.formatter = StaticFieldsFormatter(handler.formatter)
+        return TCPTarget(handler)
 
     def list_elements_have_same_type(self, key, data_list):
         """Take a list and return True if all elements are of the same type.
@@ -170,33 +903,171 @@ class CallbackModule(CallbackBase):
         )
         return new_list
 
-    def recurse_results(self, results_dict, data, task_name):
-        for key, value in results_dict.items():
-            if type(value) is dict:
-                data = self.recurse_results(value, data, task_name)
-            else:
-                new_key = "ansible_%s_%s" % (task_name, key)
-                if type(value) is list:
-                    if not self.list_elements_have_same_type(new_key, value):
-                        value = self.force_unicode(new_key, value)
-                data[new_key] = value
+    def bound_list(self, key, data_list):
+        """Return the leading elements of a list of scalars that fit in a field.
+
+        Lists with elements of different types are forced to unicode.
+        Return the list, its size in bytes and True if elements were cut.
+        """
+        elements = []
+        size = 0
+        for e in data_list:
+            # Including quotes and separator
+            element_size = len(str(e)) + 3
+            if size + element_size > self.results_max_field_bytes:
+                break
+            elements.append(e)
+            size += element_size
+        if not self.list_elements_have_same_type(key, elements):
+            elements = self.force_unicode(key, elements)
+        return elements, size, len(elements) < len(data_list)
+
+    def bound_value(self, key, value):
+        """Return value bounded by the maximum field size, its size in bytes
+        and True if it was cut.
+        """
+        if isinstance(value, (list, tuple)):
+            return self.bound_list(key, value)
+        if not isinstance(value, SCALAR_TYPES):
+            value = str(value)
+        if isinstance(value, str):
+            value, cut = truncate_string(value, self.results_max_field_bytes)
+            # Including quotes
+            return value, len(value.encode("utf-8", "replace")) + 2, cut
+        return value, len(str(value)), False
+
+    def recurse_results(self, results_dict, data):
+        """Add the fields of a task result to data and return data.
+
+        Nested keys are joined with _ and prefixed with ansible_result_.
+        Keys are matched against the include and exclude patterns in dotted
+        form, e.g. diff.before. Excluded dicts are not walked at all.
+
+        The result is walked with a stack of iterators instead of recursion,
+        so memory does not grow with the size of the result. Values nested
+        deeper than the maximum depth are replaced by DEPTH_MARKER and longer
+        values are cut at the maximum field size. Fields that do not fit
+        into the maximum event size are left out, and the walk stops once
+        it is used up. The dotted keys of cut or left out values are listed
+        in ansible_result_truncated, which ends with ... if the list is
+        incomplete.
+        """
+        truncated = []
+        budget = self.results_max_event_bytes
+        stack = [((), iter(results_dict.items()))]
+        while stack and budget >= MIN_FIELD_BYTES:
+            path, items = stack[-1]
+            item = next(items, None)
+            if item is None:
+                stack.pop()
+                continue
+            key, value = item
+            key_path = path + (str(key),)
+            dotted_key = ".".join(key_path)
+            if matches_any(dotted_key, self.results_exclude):
+                continue
+            children = nested_items(value)
+            if children is not None:
+                if len(key_path) < self.results_max_depth:
+                    stack.append((key_path, children))
+                    continue
+                value = DEPTH_MARKER
+                truncated.append(dotted_key)
+            if self.results_include and not matches_any(
+                dotted_key, self.results_include
+            ):
+                continue
+
+            new_key = "ansible_result_%s" % "_".join(key_path)
+            value, size, cut = self.bound_value(new_key, value)
+            if cut:
+                truncated.append(dotted_key)
+            # Including quotes, colon and separator
+            size += len(new_key) + 4
+            if size > budget:
+                if not cut:
+                    truncated.append(dotted_key)
+                continue
+            budget -= size
+            data[new_key] = value
+        if stack:
+            self._display.vv(
+                "Logstash Callback:\tResult exceeds %s bytes. Remaining keys left out."
+                % self.results_max_event_bytes
+            )
+            truncated.append("...")
+        if truncated:
+            if len(truncated) > MAX_TRUNCATED_KEYS:
+                truncated = truncated[: MAX_TRUNCATED_KEYS - 1] + ["..."]
+            data["ansible_result_truncated"] = truncated
+        return data
+
+    def set_static_fields(self, **fields):
+        """Set the fields shared by all following events to base_data and fields.
+
+        Events are built as a shallow copy of a read-only template with the
+        per-event fields laid on top. With a version 1 formatter, the
+        template only holds the static fields serialized once here, which
+        StaticFieldsFormatter splices into each event. The version 0
+        formatter nests the fields of an event, so the template holds the
+        static fields themselves.
+        """
+        self.static_data = MappingProxyType(dict(self.base_data, **fields))
+        if self.formatter_version == 1:
+            self.event_template = MappingProxyType(
+                {STATIC_FIELDS: serialize_fields(self.static_data)}
+            )
+        else:
+            self.event_template = self.static_data
+
+    def build_event(self, status, ansible_type, **fields):
+        """Return a new event from the template and the given fields."""
+        data = dict(self.event_template)
+        data["status"] = status
+        data["ansible_type"] = ansible_type
+        data.update(fields)
+        return data
+
+    def build_task_event(self, result, status):
+        """Return a new task event for an Ansible result."""
+        task = result._task
+        try:
+            task_type, task_name = self.task_fields[task._uuid]
+        except (AttributeError, KeyError):
+            # This object can be of type <class 'ansible.parsing.yaml.objects.AnsibleUnicode'> or <type 'unicode'>
+            #  Force casting to string
+            task_type, task_name = str(task.action), str(task)
+            task_uuid = getattr(task, "_uuid", None)
+            if task_uuid is not None:
+                self.task_fields[task_uuid] = (task_type, task_name)
+        data = self.build_event(
+            status,
+            "task",
+            ansible_task_type=task_type,
+            ansible_task=task_name,
+        )
+        if self.ship_results and isinstance(result._result, dict):
+            self.recurse_results(result._result, data)
         return data
 
     def display_data(self, data):
         """Print dataset to stdout."""
+        if self._display.verbosity < 2:
+            return
         self._display.vv(
             "Logstash Callback:\tPrinting dataset for ansible_type '%s'"
             % data["ansible_type"]
         )
-        for key, value in data.items():
+        fields = dict(data)
+        if fields.pop(STATIC_FIELDS, None) is not None:
+            fields = dict(self.static_data, **fields)
+        for key, value in fields.items():
             self._display.vv("Logstash Callback:\t\t%s: %s" % (key, value))
 
     def v2_playbook_on_start(self, playbook):
         self.playbook = playbook._file_name
-        data = copy.deepcopy(self.base_data)
-        data["status"] = "OK"
-        data["ansible_type"] = "start"
-        data["ansible_playbook"] = self.playbook
+        self.set_static_fields(ansible_playbook=self.playbook)
+        data = self.build_event("OK", "start")
         self.logger.info("ansible start", extra=data)
         self.display_data(data)
 
@@ -212,11 +1083,11 @@ class CallbackModule(CallbackBase):
         else:
             status = "FAILED"
 
-        data = copy.deepcopy(self.base_data)
-        data["status"] = status
-        data["ansible_type"] = "finish"
-        data["ansible_playbook_duration"] = runtime.total_seconds()
-        data["ansible_playbook"] = self.playbook
+        data = self.build_event(
+            status,
+            "finish",
+            ansible_playbook_duration=runtime.total_seconds(),
+        )
 
         try:
             data["ansible_result_skipped"] = summarize_stat[self.fqdn]["skipped"]
@@ -229,58 +1100,67 @@ class CallbackModule(CallbackBase):
         self.logger.info("ansible stats", extra=data)
         self.display_data(data)
 
-    def v2_runner_on_ok(self, result, **kwargs):
-        data = copy.deepcopy(self.base_data)
-        data["status"] = "OK"
-        data["ansible_type"] = "task"
-        # This object can be of type <class 'ansible.parsing.yaml.objects.AnsibleUnicode'> or <type 'unicode'>
-        #  Force casting to string
-        data["ansible_task_type"] = str(result._task.action)
-        data["ansible_task"] = str(result._task)
-        data["ansible_playbook"] = self.playbook
+        # Stats are the last event of a playbook. Ship what is left.
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+        if self.handler.thread.is_alive():
+            self._display.warning(
+                "Logstash Callback: Could not send all events within %ss"
+                % self.flush_timeout
+            )
+        if self.handler.dropped:
+            self._display.warning(
+                "Logstash Callback: Dropped %s events" % self.handler.dropped
+            )
+        if getattr(self.handler.target, "rejected", 0):
+            self._display.warning(
+                "Logstash Callback: %s requests were rejected by the server"
+                % self.handler.target.rejected
+            )
+        if getattr(self.handler.target, "requests", 0):
+            self._display.v(
+                "Logstash Callback:\tSent %s requests with %s bytes"
+                % (self.handler.target.requests, self.handler.target.sent_bytes)
+            )
+        if self.handler.replayed:
+            self._display.v(
+                "Logstash Callback:\tReplayed %s spool segments" % self.handler.replayed
+            )
+        if self.handler.spooled:
+            self._display.v(
+                "Logstash Callback:\tLogstash unreachable. Spooled %s bytes"
+                % self.handler.spooled
+            )
 
+    def v2_runner_on_ok(self, result, **kwargs):
+        data = self.build_task_event(result, "OK")
         self.logger.info("ansible ok", extra=data)
         self.display_data(data)
 
     def v2_runner_on_skipped(self, result, **kwargs):
-        data = copy.deepcopy(self.base_data)
-        data["status"] = "SKIPPED"
-        data["ansible_type"] = "task"
-        # This object can be of type <class 'ansible.parsing.yaml.objects.AnsibleUnicode'> or <type 'unicode'>
-        #  Force casting to string
-        data["ansible_task_type"] = str(result._task.action)
-        data["ansible_task"] = str(result._task)
-        data["ansible_playbook"] = self.playbook
-
+        data = self.build_task_event(result, "SKIPPED")
         self.logger.info("ansible skipped", extra=data)
         self.display_data(data)
 
     def v2_playbook_on_import_for_host(self, result, imported_file):
-        data = copy.deepcopy(self.base_data)
-        data["status"] = "IMPORTED"
-        data["ansible_type"] = "import"
-        data["imported_file"] = imported_file
-        data["ansible_playbook"] = self.playbook
+        data = self.build_event(
+            "IMPORTED",
+            "import",
+            imported_file=imported_file,
+        )
         self.logger.info("ansible import", extra=data)
 
     def v2_playbook_on_not_import_for_host(self, result, missing_file):
-        data = copy.deepcopy(self.base_data)
-        data["status"] = "NOT IMPORTED"
-        data["ansible_type"] = "import"
-        data["missing_file"] = missing_file
-        data["ansible_playbook"] = self.playbook
+        data = self.build_event(
+            "NOT IMPORTED",
+            "import",
+            missing_file=missing_file,
+        )
         self.logger.info("ansible import", extra=data)
         self.display_data(data)
 
     def v2_runner_on_failed(self, result, **kwargs):
-        data = copy.deepcopy(self.base_data)
-        data["status"] = "FAILED"
-        data["ansible_type"] = "task"
-        # This object can be of type <class 'ansible.parsing.yaml.objects.AnsibleUnicode'> or <type 'unicode'>
-        #  Force casting to string
-        data["ansible_task_type"] = str(result._task.action)
-        data["ansible_task"] = str(result._task)
-        data["ansible_playbook"] = self.playbook
+        data = self.build_task_event(result, "FAILED")
         self.errors += 1
 
         self.logger.error("ansible failed", extra=data)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# (C) 2023 University of Basel
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import tempfile
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+__metaclass__ = type
+
+DOCUMENTATION = """
+    callback: ants_recap
+    type: aggregate
+    short_description: Writes the recap of a run for ants
+    description:
+      - This callback writes the stats of every host and the result and
+        duration of every task to a JSON file, which ants reads at the end
+        of the run. It is enabled by ants for every run and does nothing
+        if ANTS_RECAP_FILE is not set.
+    options:
+      recap_file:
+        description: Path of the JSON file
+        env:
+          - name: ANTS_RECAP_FILE
+        default: ""
+"""
+
+RECAP_VERSION = 1
+
+# Keys of Ansible stats and the names used in the recap
+STATS_KEYS = (
+    ("ok", "ok"),
+    ("changed", "changed"),
+    ("unreachable", "unreachable"),
+    ("failures", "failed"),
+    ("skipped", "skipped"),
+    ("rescued", "rescued"),
+    ("ignored", "ignored"),
+)
+
+
+class CallbackModule(CallbackBase):
+    """
+    ants recap callback plugin
+
+    The recap file contains a single JSON object:
+        version: RECAP_VERSION
+        start_time, end_time: seconds since the epoch
+        plays: number of plays
+        hosts: stats of every host, e.g. {"ok": 5, "changed": 1, ...}
+        tasks: one entry per task and host with task, action, host,
+               status and duration in seconds
+
+    The file is replaced atomically once the playbook has finished, so
+    ants never reads a partial recap.
+    """
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = "aggregate"
+    CALLBACK_NAME = "ants_recap"
+    CALLBACK_NEEDS_WHITELIST = False
+    CALLBACK_NEEDS_ENABLED = False
+
+    def __init__(self):
+        super(CallbackModule, self).__init__()
+        self.recap_file = os.getenv("ANTS_RECAP_FILE", "")
+        self.disabled = not self.recap_file
+        self.start_time = time.time()
+        self.plays = 0
+        self.tasks = []
+        # Start time of the running tasks, keyed by task uuid
+        self.task_start = {}
+
+    def v2_playbook_on_play_start(self, play):
+        self.plays += 1
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self.task_start[task._uuid] = time.time()
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self.task_start[task._uuid] = time.time()
+
+    def add_result(self, result, status):
+        task = result._task
+        started = self.task_start.get(task._uuid)
+        self.tasks.append(
+            {
+                "task": str(task.get_name()),
+                "action": str(task.action),
+                "host": str(result._host.get_name()),
+                "status": status,
+                "duration": round(time.time() - started, 3) if started else None,
+            }
+        )
+
+    def v2_runner_on_ok(self, result, **kwargs):
+        self.add_result(result, "changed" if result.is_changed() else "ok")
+
+    def v2_runner_on_failed(self, result, ignore_errors=False, **kwargs):
+        self.add_result(result, "ignored" if ignore_errors else "failed")
+
+    def v2_runner_on_skipped(self, result, **kwargs):
+        self.add_result(result, "skipped")
+
+    def v2_runner_on_unreachable(self, result, **kwargs):
+        self.add_result(result, "unreachable")
+
+    def v2_playbook_on_stats(self, stats):
+        hosts = {}
+        for host in sorted(stats.processed):
+            summary = stats.summarize(host)
+            hosts[host] = dict((name, summary.get(key, 0)) for key, name in STATS_KEYS)
+        recap = {
+            "version": RECAP_VERSION,
+            "start_time": self.start_time,
+            "end_time": time.time(),
+            "plays": self.plays,
+            "hosts": hosts,
+            "tasks": self.tasks,
+        }
+        try:
+            self.write_recap(recap)
+        except OSError as err:
+            self._display.warning(
+                "ants recap: Could not write %s: %s" % (self.recap_file, err)
+            )
+
+    def write_recap(self, recap):
+        fd, tmp_file = tempfile.mkstemp(
+            dir=os.path.dirname(self.recap_file) or ".", prefix=".recap."
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(recap, f)
+            os.replace(tmp_file, self.recap_file)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
@@ -1,45 +1,76 @@
 """pre_run_checker
 ==================
 Check different requirements necessary for ants
+
+The checks run concurrently in daemon threads, each bounded by its own
+check_timeout. A check that hangs does not keep ants from exiting.
+Successful results of checks that do not change the system are cached
+for a configurable time, so repeated runs can skip them.
 """
 from __future__ import print_function
 
+import json
 import os
+import queue
+import shutil
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 import urllib.parse as up
-from distutils.spawn import find_executable
 
-from antslib import logger
+from antslib import configer, known_hosts, logger
+
+CHECK_CACHE_VERSION = 1
+
 
+class CheckFailed(Exception):
+    """Raised by a check that failed. The message is shown to the user."""
 
-def check_git_installed(subprocess_env):
+
+def check_git_installed(subprocess_env, timeout=30):
     """
     Checks if the git command can be run.
     """
     path = subprocess_env["PATH"]
+    git_path = shutil.which("git", path=path)
     try:
-        subprocess.Popen("git", stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except OSError:
-        sys.exit(
+        subprocess.run(
+            [git_path or "git", "--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=subprocess_env,
+            timeout=timeout,
+            check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        raise CheckFailed(
             "CHECK GIT:\t\tNo git executable found in the following path: {path}".format(
                 path=path
             )
         )
 
-    git_path = find_executable("git", path=path)
-    logger.console_logger.info(
-        "CHECK GIT:\t\tWorking git executable found at the following location: {path}.".format(
-            path=git_path
-        )
+    return "CHECK GIT:\t\tWorking git executable found at the following location: {path}.".format(
+        path=git_path
     )
 
 
-def check_known_host(args):
+def repo_host(git_repo):
+    """Return (hostname, port) of a git repository URL.
+
+    Besides URLs, the scp-like syntax user@host:path is supported.
     """
-    Reads the used git repository as well as the known hosts file used by ansible.
+    if "://" not in git_repo and ":" in git_repo.split("/", 1)[0]:
+        return git_repo.split(":", 1)[0].rsplit("@", 1)[-1], None
+    url = up.urlparse(git_repo)
+    return url.hostname, url.port
+
+
+def known_hosts_files():
+    """
+    Return the known hosts files used by ansible.
     The possible known hosts files come from https://github.com/ansible/ansible/blob/8ac0bbcbf60b2874ea1aaa4538389859c028b12c/lib/ansible/module_utils/known_hosts.py#L99-L109
-    Afterwards checks if the repository hostname is contained in the known_hosts_file.
     """
     if "USER" in os.environ:
         user_known_host_file = os.path.expandvars("~${USER}/.ssh/known_hosts")
@@ -48,112 +79,266 @@ def check_known_host(args):
 
     known_hosts_file = os.path.expanduser(user_known_host_file)
 
-    possible_files = [
+    return [
         known_hosts_file,
         "/etc/ssh/ssh_known_hosts",
         "/etc/ssh/ssh_known_hosts2",
         "/etc/openssh/ssh_known_hosts",
     ]
 
-    # Is the host key found in any of the known_host_files
-    found = False
-    # Does one of the possible known host files exist
-    exist = False
 
-    git_repo = args.git_repo
-    hostname = (up.urlparse(git_repo)).hostname
+def files_stamp(paths):
+    """Return a string that changes whenever one of the files changes."""
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stamp.append("-")
+            continue
+        stamp.append("%d:%d" % (stat.st_mtime_ns, stat.st_size))
+    return ",".join(stamp)
+
 
-    for file in possible_files:
-        if os.path.isfile(file):
-            exist = True
-            file_obj = open(file, "r")
+def check_known_host(args, index_file=None):
+    """
+    Reads the used git repository as well as the known hosts file used by ansible.
+    Afterwards checks if the repository hostname has a key in one of the known_hosts files.
+    Lookups are stored in index_file, see antslib.known_hosts.
+    """
+    possible_files = known_hosts_files()
 
-            if hostname in file_obj.read():
-                found = True
-                found_file = file
-                break
+    git_repo = args.git_repo
+    hostname, port = repo_host(git_repo)
 
-    if not exist:
-        sys.exit(
+    # Does one of the possible known host files exist
+    if not any(os.path.isfile(file) for file in possible_files):
+        raise CheckFailed(
             "CHECK KNOWN HOSTS:\tNo possible known hosts file {possible_files} does exist.".format(
                 possible_files=possible_files
             )
         )
 
-    if found:
-        logger.console_logger.info(
-            "CHECK KNOWN HOSTS:\tHostname {hostname} for git-repository {git_repo} is added in {known_hosts}".format(
-                hostname=hostname, git_repo=git_repo, known_hosts=found_file
-            )
+    # Is the host key found in any of the known_host_files
+    found_file = None
+    if hostname:
+        found_file = known_hosts.find_host(hostname, possible_files, port, index_file)
+
+    if found_file:
+        return "CHECK KNOWN HOSTS:\tHostname {hostname} for git-repository {git_repo} is added in {known_hosts}".format(
+            hostname=hostname, git_repo=git_repo, known_hosts=found_file
         )
-    else:
-        sys.exit(
-            "CHECK KNOWN HOSTS:\tHostname {hostname} could not be found in: {possible_files}".format(
-                hostname=hostname, possible_files=possible_files
-            )
+    raise CheckFailed(
+        "CHECK KNOWN HOSTS:\tHostname {hostname} could not be found in: {possible_files}".format(
+            hostname=hostname, possible_files=possible_files
         )
+    )
+
 
+def run_git(cmd, subprocess_env, timeout):
+    """Run a git command, wait for it and return True if it succeeded."""
+    try:
+        proc = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=subprocess_env,
+            timeout=timeout,
+        )
+    except (OSError, subprocess.TimeoutExpired) as error:
+        logger.console_logger.error(error)
+        return False
+    if proc.returncode != 0:
+        logger.console_logger.error(proc.stderr.decode("utf-8", "replace").strip())
+        return False
+    return True
 
-def check_ssh_key(args, subprocess_env):
+
+def check_ssh_key(args, subprocess_env, timeout=30):
     """
     Checks if a checkout of the playbook repository is possible to validate the ssh-key. If the repository is not
-    yet cloned, a clone will be attempted which serves the same purpose.
+    yet cloned, the branches of the repository are listed instead, which serves the same purpose without writing
+    to the destination.
     """
     if os.path.isdir(args.destination):
-        if os.path.isfile(args.ssh_key):
-            try:
-                checkout_statement = [
-                    "git",
-                    "-C",
-                    args.destination,
-                    "checkout",
-                    args.branch,
-                ]
-                proc = subprocess.Popen(
-                    checkout_statement,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    env=subprocess_env,
-                )
-            except OSError:
-                logger.console_logger.error(proc.stdout.read())
-                logger.console_logger.error(proc.stderr.read())
-                sys.exit(
-                    "CHECK SSH KEY:\t\tPermissions for git checkout of {repo} at {dest} not sufficient.".format(
-                        repo=args.git_repo, dest=args.destination
-                    )
-                )
-
-            logger.console_logger.info(
-                "CHECK SSH KEY:\t\tConnection to playbook repository {repo} at {dest} successful.".format(
+        if not os.path.isfile(args.ssh_key):
+            raise CheckFailed("CHECK SSH KEY:\t\tGiven ssh-key does not exist.")
+        checkout_statement = ["git", "-C", args.destination, "checkout", args.branch]
+        try:
+            proc = subprocess.run(
+                checkout_statement,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=subprocess_env,
+                timeout=timeout,
+            )
+        except OSError:
+            raise CheckFailed(
+                "CHECK SSH KEY:\t\tPermissions for git checkout of {repo} at {dest} not sufficient.".format(
                     repo=args.git_repo, dest=args.destination
                 )
             )
+        except subprocess.TimeoutExpired as error:
+            logger.console_logger.warning(error)
         else:
-            sys.exit("CHECK SSH KEY:\t\tGiven ssh-key does not exist.")
-    else:
+            # Like before, a failed checkout is left to ansible-pull, e.g.
+            # local changes or a branch that was not fetched yet
+            if proc.returncode != 0:
+                logger.console_logger.warning(
+                    proc.stderr.decode("utf-8", "replace").strip()
+                )
+        return "CHECK SSH KEY:\t\tConnection to playbook repository {repo} at {dest} successful.".format(
+            repo=args.git_repo, dest=args.destination
+        )
+
+    ls_remote_statement = ["git", "ls-remote", "--heads", args.git_repo, args.branch]
+    if not run_git(ls_remote_statement, subprocess_env, timeout):
+        raise CheckFailed(
+            "CHECK SSH KEY:\t\tCould not read the playbook repository {repo}, please check the "
+            "permissions.".format(repo=args.git_repo)
+        )
+    return "CHECK SSH KEY:\t\tConnection to playbook repository {repo} successful.".format(
+        repo=args.git_repo
+    )
+
+
+def read_check_cache(cache_file, ttl):
+    """Return the cached results younger than ttl seconds as dict."""
+    try:
+        with open(cache_file, "r") as f:
+            content = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(content, dict) or content.get("version") != CHECK_CACHE_VERSION:
+        return {}
+    now = time.time()
+    return dict(
+        (key, result)
+        for key, result in content.get("checks", {}).items()
+        if 0 <= now - result.get("time", 0) < ttl
+    )
+
+
+def write_check_cache(cache_file, results):
+    """Write the cached results to cache_file."""
+    content = {"version": CHECK_CACHE_VERSION, "checks": results}
+    try:
+        fd, tmp_file = tempfile.mkstemp(
+            dir=os.path.dirname(cache_file), prefix=".checks."
+        )
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(content, f)
+        os.replace(tmp_file, cache_file)
+    except OSError:
         try:
-            clone_statement = ["git", "clone", args.git_repo, args.destination]
-            subprocess.Popen(
-                clone_statement, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            )
+            os.remove(tmp_file)
         except OSError:
-            sys.exit(
-                "CHECK SSH KEY:\t\tCould not clone the playbook repository {repo} to {dest}, please check the "
-                "permissions.".format(repo=args.git_repo, dest=args.destination)
-            )
+            pass
+
+
+def _run_check(index, name, function, results):
+    """Run a check and put (index, message, failure) into results."""
+    try:
+        results.put((index, function(), None))
+    except CheckFailed as error:
+        results.put((index, None, str(error)))
+    except Exception as error:
+        results.put((index, None, "CHECK %s:\t\tFailed with %r" % (name, error)))
+
 
-        logger.console_logger.info(
-            "CHECK SSH KEY:\t\tClone of the playbook repository {repo} to {dest} successful.".format(
-                repo=args.git_repo, dest=args.destination
+def run_checks(checks, timeout, cache_file=None, cache_ttl=0):
+    """Run checks concurrently and return a list of failure messages.
+
+    checks is a list of (name, cache_key, function) tuples. A function
+    returns a message on success and raises CheckFailed otherwise. A check
+    with a cache_key is skipped if it succeeded within cache_ttl seconds.
+    Every check may take at most timeout seconds from its start. Checks run
+    in daemon threads, so checks that time out do not delay the exit.
+    """
+    cached = read_check_cache(cache_file, cache_ttl) if cache_file else {}
+    failures = []
+    results = queue.Queue()
+    pending = {}
+    start = time.monotonic()
+    for index, (name, cache_key, function) in enumerate(checks):
+        if cache_key is not None and cache_key in cached:
+            logger.console_logger.info("%s (cached)" % cached[cache_key]["message"])
+            continue
+        pending[index] = (name, cache_key, time.monotonic())
+        threading.Thread(
+            target=_run_check,
+            args=(index, name, function, results),
+            name="ants-check-%s" % name,
+            daemon=True,
+        ).start()
+
+    while pending:
+        deadline = min(started for _, _, started in pending.values()) + timeout
+        try:
+            index, message, failure = results.get(
+                timeout=max(0, deadline - time.monotonic())
             )
+        except queue.Empty:
+            now = time.monotonic()
+            for index, (name, cache_key, started) in list(pending.items()):
+                if now - started >= timeout:
+                    del pending[index]
+                    failures.append(
+                        "CHECK %s:\t\tTimed out after %.1fs" % (name, now - started)
+                    )
+            continue
+        name, cache_key, started = pending.pop(index)
+        if failure is not None:
+            failures.append(failure)
+        else:
+            logger.console_logger.info(message)
+            if cache_key is not None:
+                cached[cache_key] = {"time": time.time(), "message": message}
+        logger.console_logger.debug(
+            "CHECK %s took %.3fs" % (name, time.monotonic() - started)
         )
+    logger.console_logger.debug("All checks took %.3fs" % (time.monotonic() - start))
+
+    if cache_file:
+        write_check_cache(cache_file, cached)
+    return failures
 
 
 def check_run_requirements(args, subprocess_env):
     """
     Takes the ants arguments of the argparser and forwards it to 3 check functions which are then executed.
     """
-    check_git_installed(subprocess_env)
-    check_known_host(args)
-    check_ssh_key(args, subprocess_env)
+    cfg = configer.read_config("main")
+    timeout = int(cfg["check_timeout"])
+    hostname, port = repo_host(args.git_repo)
+    checks = [
+        (
+            "GIT",
+            "git:%s" % subprocess_env["PATH"],
+            lambda: check_git_installed(subprocess_env, timeout),
+        ),
+        (
+            "KNOWN HOSTS",
+            # Looked up again whenever a known_hosts file changes
+            "known_host:%s:%s"
+            % (
+                known_hosts.host_key_name(hostname, port),
+                files_stamp(known_hosts_files()),
+            ),
+            lambda: check_known_host(
+                args, os.path.join(cfg["log_dir"], "known_hosts_index.json")
+            ),
+        ),
+        ("SSH KEY", None, lambda: check_ssh_key(args, subprocess_env, timeout)),
+    ]
+    failures = run_checks(
+        checks,
+        timeout,
+        os.path.join(cfg["log_dir"], "checks.json"),
+        int(cfg["check_cache_ttl"]),
+    )
+    if failures:
+        sys.exit("\n".join(failures))
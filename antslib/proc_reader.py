@@ -0,0 +1,102 @@
+"""proc_reader
+==================
+
+Read the output of a subprocess.
+
+stdout and stderr are drained concurrently so that a process writing
+a lot to one of them can never block on a full pipe while we wait
+for the other one.
+"""
+
+
+import codecs
+import os
+import selectors
+
+TRUNCATED = " [...truncated]"
+
+
+class LineBuffer(object):
+    """Split a byte stream into lines of text.
+
+    Bytes are decoded incrementally, so multi-byte characters may be
+    split across reads. Invalid UTF-8 is replaced. Lines longer than
+    max_line_length are cut and marked, the rest of the line is dropped.
+    """
+
+    def __init__(self, max_line_length=65536):
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.max_line_length = max_line_length
+        self.pending = ""
+        self.truncated = False
+
+    def _cut(self, line):
+        if len(line) > self.max_line_length + 1:
+            return line[: self.max_line_length] + TRUNCATED + "\n"
+        return line
+
+    def feed(self, data, final=False):
+        """Take bytes and return a list of complete lines.
+
+        Lines keep their trailing newline. With final set, a pending
+        partial line is returned as well.
+        """
+        text = self.decoder.decode(data, final)
+        lines = []
+        start = 0
+        end = text.find("\n")
+        while end != -1:
+            if self.truncated:
+                self.truncated = False
+            else:
+                lines.append(self._cut(self.pending + text[start : end + 1]))
+            self.pending = ""
+            start = end + 1
+            end = text.find("\n", start)
+
+        if not self.truncated:
+            self.pending += text[start:]
+            if len(self.pending) > self.max_line_length:
+                lines.append(self._cut(self.pending + "\n"))
+                self.pending = ""
+                self.truncated = True
+        if final:
+            if self.pending:
+                lines.append(self.pending)
+            self.pending = ""
+            self.truncated = False
+        return lines
+
+
+def read_lines(proc, max_line_length=65536, chunk_size=65536):
+    """Read stdout and stderr of proc and yield (stream_name, line) tuples.
+
+    stream_name is either "stdout" or "stderr". Both pipes are closed
+    once the process has closed them.
+    """
+    selector = selectors.DefaultSelector()
+    for name in ("stdout", "stderr"):
+        pipe = getattr(proc, name)
+        if pipe is not None:
+            selector.register(
+                pipe, selectors.EVENT_READ, (name, LineBuffer(max_line_length))
+            )
+
+    try:
+        while selector.get_map():
+            for key, _ in selector.select():
+                name, buffer = key.data
+                data = os.read(key.fd, chunk_size)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                for line in buffer.feed(data, final=not data):
+                    yield name, line
+    finally:
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,172 @@
+"""profiler
+================
+
+Measure the wall time of tasks and roles of an Ansible run.
+
+Task boundaries are taken from the TASK and RUNNING HANDLER lines
+ansible-pull prints. A task lasts until the next boundary. Profiles
+are stored as JSON files, one per run.
+"""
+
+
+import json
+import os
+import re
+import time
+
+PROFILE_PREFIX = "profile-"
+
+_TASK_LINE = re.compile(
+    r"^(?:TASK|RUNNING HANDLER) \[(?:(?P<role>[^\]]+?) : )?(?P<name>.*)\]"
+)
+
+
+def parse_task_line(task_line):
+    """Return (role, name) of a TASK line or None for other lines.
+
+    Tasks that are not part of a role have the role None.
+    """
+    match = _TASK_LINE.match(task_line)
+    if not match:
+        return None
+    return match.group("role"), match.group("name")
+
+
+class TaskProfiler(object):
+    """Collect the duration of every task of a run."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.tasks = []
+        self.current = None
+        self.started = None
+
+    def task_started(self, task_line):
+        """Close the running task and start timing the task of task_line."""
+        self.task_finished()
+        task = parse_task_line(task_line)
+        if task is not None:
+            self.current = task
+            self.started = self.clock()
+
+    def task_finished(self):
+        """Close the running task, if any."""
+        if self.current is not None:
+            role, name = self.current
+            self.tasks.append(
+                {"role": role, "name": name, "duration": self.clock() - self.started}
+            )
+        self.current = None
+
+    def profile(self, start_time):
+        """Return the profile of this run as dict."""
+        self.task_finished()
+        roles = {}
+        for task in self.tasks:
+            role = task["role"] or ""
+            roles[role] = roles.get(role, 0) + task["duration"]
+        return {
+            "start_time": start_time.isoformat(),
+            "total": sum(task["duration"] for task in self.tasks),
+            "tasks": self.tasks,
+            "roles": roles,
+        }
+
+
+def write_profile(profile_dir, profile, keep=20):
+    """Write profile to profile_dir and remove all but the keep newest."""
+    if not os.path.isdir(profile_dir):
+        os.makedirs(profile_dir, 0o755)
+    name = "%s%s.json" % (PROFILE_PREFIX, time.strftime("%Y%m%d-%H%M%S"))
+    tmp_file = os.path.join(profile_dir, ".%s" % name)
+    with open(tmp_file, "w") as f:
+        json.dump(profile, f)
+    os.replace(tmp_file, os.path.join(profile_dir, name))
+    for old_profile in list_profiles(profile_dir)[keep:]:
+        os.remove(old_profile)
+
+
+def list_profiles(profile_dir):
+    """Return paths of all stored profiles, newest first."""
+    if not os.path.isdir(profile_dir):
+        return []
+    return [
+        os.path.join(profile_dir, name)
+        for name in sorted(os.listdir(profile_dir), reverse=True)
+        if name.startswith(PROFILE_PREFIX) and name.endswith(".json")
+    ]
+
+
+def read_profiles(profile_dir):
+    """Return all readable profiles, newest first."""
+    profiles = []
+    for path in list_profiles(profile_dir):
+        try:
+            with open(path, "r") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def task_key(task):
+    if task["role"]:
+        return "%s : %s" % (task["role"], task["name"])
+    return task["name"]
+
+
+def sum_by_task(profile):
+    """Return the total duration of each task of a profile.
+
+    Tasks that run several times, e.g. in different plays, are summed up.
+    """
+    durations = {}
+    for task in profile["tasks"]:
+        key = task_key(task)
+        durations[key] = durations.get(key, 0) + task["duration"]
+    return durations
+
+
+def format_change(duration, previous):
+    if not previous:
+        return "new"
+    mean = sum(previous) / len(previous)
+    return "%+.2fs" % (duration - mean)
+
+
+def report(profiles, top=10):
+    """Return a report of the slowest tasks and roles of the newest profile.
+
+    Durations are compared to the mean of all older profiles.
+    """
+    if not profiles:
+        return "No profile found."
+    latest, older = profiles[0], [sum_by_task(p) for p in profiles[1:]]
+    older_roles = [p["roles"] for p in profiles[1:]]
+
+    lines = [
+        "Run started %s, total task time %.2fs, compared to %s older runs"
+        % (latest["start_time"], latest["total"], len(older)),
+        "",
+        "%10s %10s  %s" % ("Duration", "Change", "Task"),
+    ]
+    tasks = sorted(sum_by_task(latest).items(), key=lambda t: t[1], reverse=True)
+    for key, duration in tasks[:top]:
+        previous = [p[key] for p in older if key in p]
+        lines.append(
+            "%9.2fs %10s  %s" % (duration, format_change(duration, previous), key)
+        )
+
+    lines += ["", "%10s %10s  %s" % ("Duration", "Change", "Role")]
+    roles = sorted(latest["roles"].items(), key=lambda r: r[1], reverse=True)
+    for role, duration in roles[:top]:
+        previous = [p[role] for p in older_roles if role in p]
+        lines.append(
+            "%9.2fs %10s  %s"
+            % (duration, format_change(duration, previous), role or "(no role)")
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    pass
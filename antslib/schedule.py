@@ -0,0 +1,93 @@
+"""schedule
+================
+
+Decide when a host runs.
+
+Every host gets a stable offset within the interval, derived from a hash
+of its host name. Runs start at that offset in every interval, counted
+from the epoch. Hosts that are started at the same time, e.g. after a
+maintenance window, are spread evenly over the interval instead of
+hitting the git server and the domain controllers in bursts.
+
+After consecutive failed runs the next run is delayed by
+interval * (2 ** failures - 1) seconds, up to a ceiling.
+"""
+
+
+import hashlib
+import random
+
+
+def host_offset(hostname, interval):
+    """Return the offset of hostname in seconds, between 0 and interval."""
+    digest = hashlib.sha256(hostname.lower().encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64 * interval
+
+
+def next_slot(hostname, interval, earliest):
+    """Return the first run time of hostname at or after earliest."""
+    if interval <= 0:
+        return earliest
+    return earliest + (host_offset(hostname, interval) - earliest) % interval
+
+
+def backoff(interval, failures, ceiling=None):
+    """Return the extra delay in seconds after failures failed runs."""
+    if failures <= 0:
+        return 0
+    delay = interval * (2 ** failures - 1)
+    if ceiling is not None:
+        delay = min(delay, ceiling)
+    return delay
+
+
+def next_run(hostname, interval, now, failures=0, ceiling=None):
+    """Return the time of the next run of hostname after now."""
+    return next_slot(hostname, interval, now + 1 + backoff(interval, failures, ceiling))
+
+
+def update_backoff(snapshot, previous, interval, ceiling, now):
+    """Add the failure count and the earliest retry time to snapshot.
+
+    previous is the snapshot of the run before or None.
+    """
+    failures = 0
+    if snapshot.get("status") == "failed":
+        failures = (previous or {}).get("consecutive_failures", 0) + 1
+    snapshot["consecutive_failures"] = failures
+    snapshot["retry_after"] = now + backoff(interval, failures, ceiling)
+    return snapshot
+
+
+def simulate(hostnames, interval, buckets=30, randomize=False):
+    """Return the number of runs starting in each part of the interval.
+
+    With randomize, a random splay is used instead of the host offset.
+    """
+    counts = [0] * buckets
+    for hostname in hostnames:
+        if randomize:
+            offset = random.uniform(0, interval)
+        else:
+            offset = host_offset(hostname, interval)
+        counts[min(int(offset / interval * buckets), buckets - 1)] += 1
+    return counts
+
+
+def histogram(counts, interval, width=50):
+    """Return counts as text, one bar per part of the interval."""
+    bucket_size = interval / len(counts)
+    highest = max(counts) or 1
+    lines = []
+    for i, count in enumerate(counts):
+        lines.append(
+            "%7.0fs %6d %s"
+            % (i * bucket_size, count, "#" * int(round(count / highest * width)))
+        )
+    mean = sum(counts) / len(counts)
+    lines.append("max/mean: %.2f" % (highest / mean if mean else 0))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    pass
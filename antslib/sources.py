@@ -0,0 +1,131 @@
+"""sources
+===============
+
+Run several playbook sources on the same host.
+
+A source is a config section named [source:<name>]. It sets its own
+git_repository, branch, destination, ansible_playbook, tags, skip_tags
+and ssh_key. Options that are not set are taken from [main], except
+the destination, which defaults to the one of [main] with _<name>
+appended. A source starts after all sources listed in its after option
+have finished.
+
+Every source has its own log directory below <log_dir>/sources.
+"""
+
+
+import concurrent.futures
+import os
+
+SECTION_PREFIX = "source:"
+SOURCE_OPTIONS = (
+    "git_repository",
+    "branch",
+    "destination",
+    "ansible_playbook",
+    "tags",
+    "skip_tags",
+    "ssh_key",
+)
+# Worst status first
+STATUS_ORDER = ("failed", "changed", "ok")
+
+
+class SourceError(Exception):
+    """Raised if the source configuration is invalid."""
+
+
+def get_sources(config):
+    """Return a dict of all sources in the config snapshot.
+
+    Each source is a dict of the options in SOURCE_OPTIONS and "after",
+    the list of sources it waits for.
+    """
+    main = config["main"]
+    sources = {}
+    for section_name, section in config.items():
+        if not section_name.startswith(SECTION_PREFIX):
+            continue
+        name = section_name[len(SECTION_PREFIX) :].strip()
+        if not name or os.sep in name or name.startswith("."):
+            raise SourceError("Invalid source name %r" % name)
+        source = dict((key, section.get(key, main[key])) for key in SOURCE_OPTIONS)
+        source["destination"] = section.get(
+            "destination", "%s_%s" % (main["destination"], name)
+        )
+        source["after"] = [
+            dependency.strip()
+            for dependency in section.get("after", "").split(",")
+            if dependency.strip()
+        ]
+        sources[name] = source
+    check_order(sources)
+    return sources
+
+
+def check_order(sources):
+    """Raise SourceError for unknown or circular dependencies."""
+    for name, source in sources.items():
+        for dependency in source["after"]:
+            if dependency not in sources:
+                raise SourceError(
+                    "Source %s runs after unknown source %s" % (name, dependency)
+                )
+    done = set()
+    pending = set(sources)
+    while pending:
+        ready = [n for n in pending if set(sources[n]["after"]) <= done]
+        if not ready:
+            raise SourceError(
+                "Circular order of sources: %s" % ", ".join(sorted(pending))
+            )
+        done.update(ready)
+        pending.difference_update(ready)
+
+
+def source_log_dir(log_dir, name):
+    return os.path.join(log_dir, "sources", name)
+
+
+def run_sources(sources, run, max_workers=2):
+    """Call run(name) for every source and return a dict of the results.
+
+    The result of a source is the return value of run or the exception it
+    raised. Up to max_workers sources run at the same time. A source is
+    started once all sources it runs after have finished, whatever their
+    result.
+    """
+    results = {}
+    pending = list(sources)
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name in list(pending):
+                if len(running) >= max_workers:
+                    break
+                if all(dependency in results for dependency in sources[name]["after"]):
+                    pending.remove(name)
+                    running[executor.submit(run, name)] = name
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as error:
+                    results[name] = error
+    return results
+
+
+def combine_status(snapshots):
+    """Return the status of all sources, the worst of their states."""
+    states = [snapshot.get("status", "failed") for snapshot in snapshots.values()]
+    for state in STATUS_ORDER:
+        if state in states:
+            return state
+    return "ok"
+
+
+if __name__ == "__main__":
+    pass
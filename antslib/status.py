@@ -0,0 +1,118 @@
+"""status
+================
+
+Machine readable status of the last ants run.
+
+The status is written to a small JSON file at the end of every run.
+The file is replaced atomically so readers never see a partial
+snapshot.
+
+The result of the Ansible run is taken from the recap written by the
+ants_recap callback plugin, not from the output of ansible-pull.
+"""
+
+
+import json
+import os
+import tempfile
+
+STATUS_VERSION = 1
+# Version of the recap written by antslib/plugins/callback/ants_recap.py
+RECAP_VERSION = 1
+RECAP_COUNTERS = (
+    "ok",
+    "changed",
+    "unreachable",
+    "failed",
+    "skipped",
+    "rescued",
+    "ignored",
+)
+
+
+def read_run_recap(recap_file):
+    """Read the recap written by the ants_recap callback or return None."""
+    try:
+        with open(recap_file, "r") as f:
+            recap = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(recap, dict) or recap.get("version") != RECAP_VERSION:
+        return None
+    return recap
+
+
+def recap_counters(run_recap):
+    """Return the stats of all hosts in run_recap added up."""
+    counters = dict((key, 0) for key in RECAP_COUNTERS)
+    for host_stats in run_recap["hosts"].values():
+        for key in RECAP_COUNTERS:
+            counters[key] += host_stats.get(key, 0)
+    return counters
+
+
+def client_status(run_recap):
+    """Return the client status of a run: ok, changed or failed.
+
+    A run fails if any host failed or was unreachable. A run without a
+    recap or without hosts, e.g. because no host matched, failed too.
+    Failed tasks with ignore_errors and rescued tasks do not count.
+    """
+    if not run_recap or not run_recap["hosts"]:
+        return "failed"
+    counters = recap_counters(run_recap)
+    if counters["failed"] or counters["unreachable"]:
+        return "failed"
+    if counters["changed"]:
+        return "changed"
+    return "ok"
+
+
+def recap_lines(run_recap):
+    """Return the stats of every host in the form of the Ansible recap.
+
+    Example line:
+    host.example.com : ok=5 changed=1 unreachable=0 failed=0 skipped=2 ...
+    """
+    return [
+        "%s : %s"
+        % (
+            host,
+            " ".join("%s=%s" % (key, stats.get(key, 0)) for key in RECAP_COUNTERS),
+        )
+        for host, stats in sorted(run_recap["hosts"].items())
+    ]
+
+
+def write_status(status_file, snapshot):
+    """Write snapshot as JSON to status_file using an atomic rename."""
+    snapshot = dict(snapshot, version=STATUS_VERSION)
+    status_dir = os.path.dirname(status_file)
+    fd, tmp_file = tempfile.mkstemp(dir=status_dir, prefix=".status.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_file, 0o644)
+        os.replace(tmp_file, status_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def read_status(status_file):
+    """Read status_file and return the snapshot as dict or None."""
+    try:
+        with open(status_file, "r") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != STATUS_VERSION:
+        return None
+    return snapshot
+
+
+if __name__ == "__main__":
+    pass
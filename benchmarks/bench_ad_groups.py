@@ -0,0 +1,146 @@
+"""bench_ad_groups
+===============
+
+Benchmark the group resolution of antslib.inventory.ad against an ldap3
+MOCK_SYNC directory with thousands of nested groups.
+
+Reports round trips and wall time of every lookup. A round trip is one
+search request, every page of a paged search counts as one. Use
+--latency to add a simulated network delay to every round trip.
+
+The mock directory can not follow LDAP_MATCHING_RULE_IN_CHAIN, so only
+group_resolution = token_groups is measured. tokenGroups is a computed
+attribute in Active Directory and is stored on the computer here. The
+mock evaluates filters in Python, so wall time grows with groups times
+members much faster than on a domain controller. Compare round trips
+across directory sizes and wall time within one run.
+
+Run it from the repository root:
+
+    python benchmarks/bench_ad_groups.py --groups 5000 --latency 2
+"""
+
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from antslib.inventory import ad  # noqa: E402
+from ldap3 import MOCK_SYNC, Connection, Server  # noqa: E402
+
+GROUPS_OU = "OU=Groups,DC=example,DC=com"
+COMPUTERS_OU = "OU=Computers,DC=example,DC=com"
+PREFIX = "ants-"
+
+
+def raw_sid(rid):
+    """Return a binary domain SID with the relative id rid."""
+    return b"\x01\x05\x00\x00\x00\x00\x00\x05\x15\x00\x00\x00" + struct.pack(
+        "<IIII", 21, 42, 84, rid
+    )
+
+
+def build_directory(groups, members):
+    """Return a bound mock connection with groups groups.
+
+    Every second group has the prefix. The computer is a nested member of
+    the first members groups, so half of its token groups match."""
+    connection = Connection(
+        Server("bench"),
+        user="CN=reader,DC=example,DC=com",
+        password="secret",
+        client_strategy=MOCK_SYNC,
+        raise_exceptions=True,
+    )
+    connection.strategy.add_entry(
+        "CN=reader,DC=example,DC=com", {"userPassword": "secret"}
+    )
+    for rid in range(groups):
+        name = "%sgroup%d" % (PREFIX if rid % 2 else "other-", rid)
+        connection.strategy.add_entry(
+            "CN=%s,%s" % (name, GROUPS_OU),
+            {
+                "objectClass": "group",
+                "objectCategory": "group",
+                "cn": name,
+                "objectSid": raw_sid(rid),
+            },
+        )
+    connection.strategy.add_entry(
+        "CN=client,%s" % COMPUTERS_OU,
+        {
+            "objectClass": "computer",
+            "cn": "client",
+            "tokenGroups": [raw_sid(rid) for rid in range(members)],
+        },
+    )
+    connection.bind()
+    return connection
+
+
+def count_round_trips(connection, latency):
+    """Wrap connection.search to count calls and add latency seconds."""
+    counter = {"round_trips": 0}
+    search = connection.search
+
+    def counting_search(*args, **kwargs):
+        counter["round_trips"] += 1
+        if latency:
+            time.sleep(latency)
+        return search(*args, **kwargs)
+
+    connection.search = counting_search
+    return counter
+
+
+def measure(label, counter, function):
+    counter["round_trips"] = 0
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(
+        "%-36s %6d round trips %9.3fs %6d groups"
+        % (label, counter["round_trips"], elapsed, len(result))
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    parser.add_argument("--groups", type=int, default=2000)
+    parser.add_argument("--members", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds")
+    args = parser.parse_args()
+
+    connection = build_directory(args.groups, args.members)
+    counter = count_round_trips(connection, args.latency / 1000.0)
+    sid_cache_file = os.path.join(tempfile.mkdtemp(), "sids.json")
+
+    def lookup(missing_ttl=86400):
+        computer_dn = ad.find_computer(connection, "client", COMPUTERS_OU)
+        return ad.get_computer_token_groups(
+            connection,
+            GROUPS_OU,
+            computer_dn,
+            PREFIX,
+            sid_cache_file,
+            args.page_size,
+            missing_ttl,
+        )
+
+    print(
+        "%d groups, computer in %d, page size %d, latency %gms"
+        % (args.groups, args.members, args.page_size, args.latency)
+    )
+    measure("token_groups, empty SID cache", counter, lookup)
+    measure("token_groups, warm SID cache", counter, lookup)
+    measure("token_groups, missing SIDs expired", counter, lambda: lookup(0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""bench_checkout
+==============
+
+Benchmark the clone time and disk usage of antslib.checkout.
+
+Creates a local bare repository with --commits commits, each changing
+--files files of --size bytes below --dirs directories. Then clones it
+with the full history, with clone_depth 1, with clone_depth 1 and
+sparse_paths, and with clone_depth 1 and a reference mirror, and reports
+the time of the clone and the disk usage of the objects and the working
+tree of the checkout. The repository is accessed with file://, so git
+uses its transport like for a remote repository instead of hardlinking
+the objects.
+
+Run it from the repository root:
+
+    python benchmarks/bench_checkout.py --commits 200 --files 50
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from antslib import checkout  # noqa: E402
+
+BRANCH = "main"
+
+
+def git(*args):
+    subprocess.run(
+        ["git", "-c", "user.name=ants", "-c", "user.email=ants@example.com"]
+        + list(args),
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def create_repository(directory, commits, files, dirs, size):
+    """Create a bare repository below directory and return its file:// url."""
+    work = os.path.join(directory, "work")
+    git("init", "-q", "-b", BRANCH, work)
+    for commit in range(commits):
+        for i in range(files):
+            path = os.path.join(work, "roles", "role%d" % (i % dirs), "file%d" % i)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(os.urandom(size // 2).hex().encode("ascii"))
+        with open(os.path.join(work, "site.yml"), "w") as f:
+            f.write("- hosts: all\n# commit %d\n" % commit)
+        git("-C", work, "add", "-A")
+        git("-C", work, "commit", "-q", "-m", "commit %d" % commit)
+    repository = os.path.join(directory, "repository.git")
+    git("clone", "-q", "--bare", work, repository)
+    # Like the usual git servers, allow the blob filter of sparse clones
+    git("-C", repository, "config", "uploadpack.allowFilter", "true")
+    shutil.rmtree(work)
+    return "file://" + repository
+
+
+def disk_usage(path, exclude=None):
+    """Return the MiB allocated below path, without the directory exclude."""
+    total = 0
+    for root, dirs, names in os.walk(path):
+        if exclude in dirs:
+            dirs.remove(exclude)
+        for name in names:
+            total += os.lstat(os.path.join(root, name)).st_blocks * 512
+    return total / 1048576.0
+
+
+def measure(label, directory, repository, repeat, depth, sparse_paths, mirror):
+    elapsed = []
+    for _ in range(repeat):
+        destination = os.path.join(directory, "checkout")
+        if os.path.exists(destination):
+            shutil.rmtree(destination)
+        start = time.perf_counter()
+        checkout.clone(destination, repository, BRANCH, depth, sparse_paths, mirror)
+        elapsed.append(time.perf_counter() - start)
+    print(
+        "%-32s %10.1fms %8.2fMiB .git %8.2fMiB worktree"
+        % (
+            label,
+            min(elapsed) * 1000,
+            disk_usage(os.path.join(destination, ".git")),
+            disk_usage(destination, exclude=".git"),
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    parser.add_argument("--commits", type=int, default=200)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--dirs", type=int, default=10)
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        repository = create_repository(
+            directory, args.commits, args.files, args.dirs, args.size
+        )
+        mirror = os.path.join(directory, "mirror.git")
+        checkout.update_mirror(mirror, repository)
+        print(
+            "%d commits, %d files, repository %.1fMiB, mirror %.1fMiB"
+            % (
+                args.commits,
+                args.files,
+                disk_usage(repository[len("file://") :]),
+                disk_usage(mirror),
+            )
+        )
+        sparse_paths = ["roles/role0"]
+        for label, depth, paths, reference in (
+            ("full history", 0, None, None),
+            ("clone_depth 1", 1, None, None),
+            ("clone_depth 1, sparse_paths", 1, sparse_paths, None),
+            ("clone_depth 1, reference_mirror", 1, None, mirror),
+        ):
+            measure(label, directory, repository, args.repeat, depth, paths, reference)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
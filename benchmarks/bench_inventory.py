@@ -0,0 +1,80 @@
+"""bench_inventory
+===============
+
+Benchmark prerendered inventories against running the inventory script.
+
+Without prerender_inventory, Ansible runs the inventory script with
+--list in a new interpreter for every run. With it, ants resolves the
+inventory in-process and writes a static inventory file, which Ansible
+only has to read. Reports the time of the script, of the first in-process
+resolution including the import of the inventory module, and of further
+in-process resolutions. The AD inventory needs ldap3 and a reachable
+domain controller, so the default inventory is used unless --script
+says otherwise.
+
+Run it from the repository root:
+
+    python benchmarks/bench_inventory.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from antslib.inventory import helper  # noqa: E402
+
+
+def run_script(script):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, script, "--list"],
+        env=env,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    json.loads(proc.stdout)
+    return time.perf_counter() - start
+
+
+def prerender(script, inventory_file):
+    start = time.perf_counter()
+    helper.write_static_inventory(inventory_file, helper.resolve_inventory(script))
+    with open(inventory_file) as f:
+        json.load(f)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--script", default=os.path.join(ROOT, "bin", "ants_inventory_default")
+    )
+    args = parser.parse_args()
+
+    inventory_file = os.path.join(tempfile.mkdtemp(), "inventory.json")
+    first = prerender(args.script, inventory_file)
+    prerendered = min(prerender(args.script, inventory_file) for _ in range(args.runs))
+    script = min(run_script(args.script) for _ in range(args.runs))
+
+    print(os.path.basename(args.script))
+    print("%-36s %9.1fms" % ("script", script * 1000))
+    print("%-36s %9.1fms" % ("prerendered, first run with import", first * 1000))
+    print("%-36s %9.1fms" % ("prerendered", prerendered * 1000))
+    print("%-36s %9.1fms" % ("saved per run", (script - first) * 1000))
+    os.remove(inventory_file)
+    os.rmdir(os.path.dirname(inventory_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""bench_known_hosts
+=================
+
+Benchmark the known_hosts lookup of antslib.known_hosts with large files.
+
+Writes a known_hosts file with --entries entries. A quarter of them is
+hashed, a quarter uses [host]:port and some contain wildcards. Then
+compares a linear scan of the file with find_host, once with an empty
+index and once with the index of the previous lookup, for a host near
+the end of the file and for an unknown host.
+
+Run it from the repository root:
+
+    python benchmarks/bench_known_hosts.py --entries 100000
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from antslib import known_hosts  # noqa: E402
+
+KEY = "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIOMqqnkVzrm0SdG6UOoqKLsabgH5C9okWi0dh2l9GKJl"
+
+
+def hashed(name, salt):
+    digest = hmac.new(salt, name.encode("utf-8"), hashlib.sha1).digest()
+    return "|1|%s|%s" % (
+        base64.b64encode(salt).decode("ascii"),
+        base64.b64encode(digest).decode("ascii"),
+    )
+
+
+def write_known_hosts(path, entries):
+    with open(path, "w") as f:
+        for i in range(entries):
+            name = "host%d.example.com" % i
+            if i % 4 == 0:
+                patterns = hashed(name, os.urandom(20))
+            elif i % 4 == 1:
+                patterns = "[%s]:2222" % name
+            elif i % 100 == 2:
+                patterns = "*.zone%d.example.com" % i
+            else:
+                patterns = "%s,10.%d.%d.%d" % (name, i >> 16, (i >> 8) & 255, i & 255)
+            f.write("%s %s\n" % (patterns, KEY))
+
+
+def measure(label, function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    elapsed = (time.perf_counter() - start) / repeat
+    print("%-40s %10.3fms %s" % (label, elapsed * 1000, bool(result)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "known_hosts")
+    index_file = os.path.join(directory, "known_hosts_index.json")
+    write_known_hosts(path, args.entries)
+    print("%d entries, %d bytes" % (args.entries, os.path.getsize(path)))
+
+    # The last entry with i % 4 == 3, which is never hashed or a wildcard
+    host = "host%d.example.com" % (args.entries // 4 * 4 - 1)
+    for label, name in (("known host", host), ("unknown host", "unknown.example.org")):
+
+        def empty_index():
+            if os.path.exists(index_file):
+                os.remove(index_file)
+            return known_hosts.find_host(name, [path], index_file=index_file)
+
+        measure(
+            "%s, linear scan" % label,
+            lambda: known_hosts.file_contains(path, name),
+            args.repeat,
+        )
+        measure("%s, empty index" % label, empty_index, args.repeat)
+        measure(
+            "%s, index" % label,
+            lambda: known_hosts.find_host(name, [path], index_file=index_file),
+            args.repeat,
+        )
+
+
+if __name__ == "__main__":
+    main()
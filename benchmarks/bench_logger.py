@@ -0,0 +1,160 @@
+"""bench_logger
+============
+
+Benchmark the output logging of an Ansible run in lines per second.
+
+Compares the LogDispatcher of antslib.logger with write_log as it was
+before, which checked the log directory for every line and wrote each
+line through up to three logging handlers. Both write --lines lines of
+synthetic ansible-pull output, with a task line and --hosts status lines
+per task, to log files in a temporary directory. The dispatcher is
+flushed at every task boundary like in a run. The console goes to
+/dev/null, or is disabled like with --quiet.
+
+Run it from the repository root:
+
+    python benchmarks/bench_logger.py --lines 200000
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from antslib import configer, logger  # noqa: E402
+
+STATUSES = ("ok", "changed", "skipping", "ok", "failed")
+
+
+def ansible_output(lines, hosts):
+    """Return a list of lines like the output of ansible-pull."""
+    output = []
+    task = 0
+    while len(output) < lines:
+        output.append("TASK [common : task %d] %s" % (task, "*" * 40))
+        for host in range(hosts):
+            status = STATUSES[(task + host) % len(STATUSES)]
+            output.append("%s: [host%d.example.com]" % (status, host))
+        output.append("")
+        task += 1
+    return output[:lines]
+
+
+class LegacyLogger(object):
+    """write_log before the LogDispatcher."""
+
+    def __init__(self, log_dir, loggers):
+        self.log_dir = log_dir
+        self.console = loggers["console"]
+        self.main = loggers["main"]
+        self.ok = loggers["ok"]
+        self.changed = loggers["changed"]
+        self.failed = loggers["failed"]
+
+    def write_log(self, line, task_line=None):
+        if not os.path.isdir(self.log_dir):
+            configer.create_dir(self.log_dir)
+        if line.startswith("ok:"):
+            if task_line is not None:
+                self.ok.info(task_line.rstrip())
+            self.console.info("\033[0;32m%s\033[0;0m" % line.rstrip())
+            self.ok.info(line.rstrip())
+        elif line.startswith("changed:"):
+            if task_line is not None:
+                self.changed.info(task_line.rstrip())
+            self.console.info("\033[1;33m%s\033[0;0m" % line.rstrip())
+            self.changed.info(line.rstrip())
+        elif line.startswith("failed:") or line.startswith("fatal:"):
+            if task_line is not None:
+                self.failed.info(task_line.rstrip())
+            self.console.info("\033[0;31m%s\033[0;0m" % line.rstrip())
+            self.failed.info(line.rstrip())
+        elif line.startswith("skipping:"):
+            self.console.info("\033[1;36m%s\033[0;0m" % line.rstrip())
+        else:
+            self.console.info(line.rstrip())
+        self.main.info(line.rstrip())
+
+
+def make_loggers(label, log_dir, devnull, quiet):
+    """Return a fresh set of loggers writing below log_dir."""
+    loggers = {
+        "console": logger.get_logger("bench-%s-console" % label, formatter="simple"),
+        "main": logger.get_logger(
+            "bench-%s-main" % label, os.path.join(log_dir, "ants.log"), 5000000
+        ),
+    }
+    for name in ("ok", "changed", "failed"):
+        loggers[name] = logger.get_logger(
+            "bench-%s-%s" % (label, name), os.path.join(log_dir, "%s.log" % name)
+        )
+    loggers["console"].handlers[0].setStream(devnull)
+    loggers["console"].disabled = quiet
+    return loggers
+
+
+def run(label, output, quiet, devnull):
+    """Write output and return lines per second."""
+    log_dir = tempfile.mkdtemp()
+    loggers = make_loggers(label, log_dir, devnull, quiet)
+    if label.startswith("dispatcher"):
+        dispatcher = logger.LogDispatcher(
+            log_dir,
+            loggers["console"],
+            loggers["main"],
+            dict((name, loggers[name]) for name in ("ok", "changed", "failed")),
+        )
+        write = dispatcher.write
+        flush = dispatcher.flush
+    else:
+        write = LegacyLogger(log_dir, loggers).write_log
+        flush = None
+
+    task_line = None
+    start = time.perf_counter()
+    for line in output:
+        if flush is not None and line.startswith("TASK"):
+            flush()
+        write(line, task_line)
+        if line.startswith("TASK"):
+            task_line = line
+    if flush is not None:
+        flush()
+    elapsed = time.perf_counter() - start
+
+    for name in loggers:
+        for handler in loggers[name].handlers:
+            if name != "console":
+                handler.close()
+    shutil.rmtree(log_dir)
+    return len(output) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--hosts", type=int, default=10)
+    args = parser.parse_args()
+
+    output = ansible_output(args.lines, args.hosts)
+    devnull = open(os.devnull, "w")
+    print("%d lines, %d hosts per task" % (args.lines, args.hosts))
+    for quiet in (False, True):
+        console = "quiet" if quiet else "console"
+        legacy = run("legacy-%s" % console, output, quiet, devnull)
+        dispatcher = run("dispatcher-%s" % console, output, quiet, devnull)
+        print("%-24s %12.0f lines/s" % ("write_log, %s" % console, legacy))
+        print(
+            "%-24s %12.0f lines/s  %.1fx"
+            % ("LogDispatcher, %s" % console, dispatcher, dispatcher / legacy)
+        )
+    logging.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""bench_logstash_events
+=====================
+
+Benchmark the ants_logstash callback with synthetic Ansible results.
+
+Drives the callback like Ansible does, with a playbook of --events task
+results, and sends the events to a local TCP server that discards them.
+Reports the events per second of the callback methods, the time until
+the sender thread has shipped all events, and the memory blocks and
+bytes a single task event keeps allocated. Needs ansible and
+python-logstash.
+
+Run it from the repository root:
+
+    python benchmarks/bench_logstash_events.py --events 20000 --results
+"""
+
+import argparse
+import importlib.util
+import os
+import socket
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN = os.path.join(ROOT, "antslib", "plugins", "callback", "ants_logstash.py")
+
+
+class Playbook(object):
+    _file_name = "site.yml"
+
+
+class Task(object):
+    def __init__(self, number):
+        self._uuid = "task-%d" % number
+        self.action = "ansible.builtin.copy"
+        self.name = "common : copy file %d" % number
+
+    def __str__(self):
+        return "TASK: %s" % self.name
+
+
+class Host(object):
+    def get_name(self):
+        return "client.example.com"
+
+
+class Result(object):
+    def __init__(self, task):
+        self._task = task
+        self._host = Host()
+        self._result = {
+            "changed": True,
+            "dest": "/etc/motd",
+            "checksum": "2aae6c35c94fcfb415dbe95f408b9ce91ee846ed",
+            "diff": {"before": "x" * 200, "after": "y" * 200},
+            "invocation": {"module_args": {"src": "motd", "dest": "/etc/motd"}},
+        }
+
+
+class Stats(object):
+    processed = {}
+
+
+def discard_server():
+    """Start a TCP server that reads and discards data. Return its port."""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+
+    def serve():
+        connection, _ = server.accept()
+        while connection.recv(1 << 20):
+            pass
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def load_plugin():
+    spec = importlib.util.spec_from_file_location("ants_logstash", PLUGIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--tasks", type=int, default=100)
+    parser.add_argument(
+        "--results", action="store_true", help="ship task results (LOGSTASH_RESULTS)"
+    )
+    args = parser.parse_args()
+
+    os.environ["LOGSTASH_SERVER"] = "127.0.0.1"
+    os.environ["LOGSTASH_PORT"] = str(discard_server())
+    os.environ["LOGSTASH_RESULTS"] = "true" if args.results else "false"
+    os.environ["LOGSTASH_QUEUE_SIZE"] = str(args.events + 10)
+    plugin = load_plugin()
+    callback = plugin.CallbackModule()
+    results = [Result(Task(i % args.tasks)) for i in range(args.events)]
+
+    callback.v2_playbook_on_start(Playbook())
+    start = time.perf_counter()
+    for result in results:
+        callback.v2_runner_on_ok(result)
+    emitted = time.perf_counter() - start
+    callback.v2_playbook_on_stats(Stats())
+    shipped = time.perf_counter() - start
+
+    # Memory kept by the events themselves, without queueing them
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    events = [callback.build_task_event(result, "OK") for result in results]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats) / float(len(events))
+    size = sum(stat.size_diff for stat in stats) / float(len(events))
+
+    print("%d events, %d tasks, results %s" % (args.events, args.tasks, args.results))
+    print("%-28s %12.0f events/s" % ("callback", args.events / emitted))
+    print("%-28s %12.0f events/s" % ("shipped", args.events / shipped))
+    print("%-28s %12.1f blocks %8.0f bytes" % ("allocated per event", blocks, size))
+    if callback.handler.dropped:
+        print("Dropped %d events" % callback.handler.dropped)
+
+
+if __name__ == "__main__":
+    main()
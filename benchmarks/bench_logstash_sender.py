@@ -0,0 +1,196 @@
+"""bench_logstash_sender
+=====================
+
+Benchmark the per-task latency of the ants_logstash callback against a
+Logstash server that gets slower.
+
+A local TCP server stands in for Logstash and reads at most --rates
+bytes per second, 0 reads as fast as it can. Small socket buffers stand
+in for the buffers of a slow network, so senders notice the slow server
+early. For every rate, a playbook of --tasks task results is sent twice:
+once through the batching sender thread of the callback and once with a
+synchronous TCPLogstashHandler, like the callback did before.
+
+Reports the latency of v2_runner_on_ok, the time of v2_playbook_on_stats,
+which waits at most LOGSTASH_FLUSH_TIMEOUT, and the bytes spooled and
+events dropped. A send on the socket of a Logstash handler times out
+after 1s. The callback then spools all further events, while the
+synchronous handler drops them. Needs ansible and python-logstash.
+
+Run it from the repository root:
+
+    python benchmarks/bench_logstash_sender.py --tasks 600 --rates 0,100000,20000
+"""
+
+import argparse
+import importlib.util
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN = os.path.join(ROOT, "antslib", "plugins", "callback", "ants_logstash.py")
+
+
+class Playbook(object):
+    _file_name = "site.yml"
+
+
+class Task(object):
+    def __init__(self, number):
+        self._uuid = "task-%d" % number
+        self.action = "ansible.builtin.copy"
+        self.name = "common : copy file %d" % number
+
+    def __str__(self):
+        return "TASK: %s" % self.name
+
+
+class Host(object):
+    def get_name(self):
+        return "client.example.com"
+
+
+class Result(object):
+    def __init__(self, task):
+        self._task = task
+        self._host = Host()
+        self._result = {
+            "changed": True,
+            "dest": "/etc/motd",
+            "diff": {"before": "x" * 500, "after": "y" * 500},
+        }
+
+
+class Stats(object):
+    processed = {}
+
+
+def slow_server(rate, buffer_size):
+    """Start a TCP server reading rate bytes per second. Return its port."""
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+    server.bind(("127.0.0.1", 0))
+    server.listen(4)
+
+    def read(connection):
+        while True:
+            data = connection.recv(4096)
+            if not data:
+                return
+            if rate:
+                time.sleep(len(data) / float(rate))
+
+    def serve():
+        while True:
+            connection, _ = server.accept()
+            threading.Thread(target=read, args=(connection,), daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def load_plugin():
+    spec = importlib.util.spec_from_file_location("ants_logstash", PLUGIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def connect(handler, buffer_size):
+    """Open the socket of a TCPLogstashHandler with a small send buffer."""
+    handler.createSocket()
+    handler.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_size)
+
+
+def run(plugin, rate, tasks, synchronous, buffer_size):
+    """Return latencies of the task events, stats time and callback."""
+    os.environ["LOGSTASH_PORT"] = str(slow_server(rate, buffer_size))
+    # Do not replay the events spooled by the previous run
+    os.environ["LOGSTASH_SPOOL_DIR"] = tempfile.mkdtemp()
+    callback = plugin.CallbackModule()
+    if synchronous:
+        import logstash
+
+        callback.logger.removeHandler(callback.handler)
+        callback.handler.close(0)
+        handler = logstash.TCPLogstashHandler(
+            "127.0.0.1", int(os.environ["LOGSTASH_PORT"]), version=1
+        )
+        handler.formatter = plugin.StaticFieldsFormatter(handler.formatter)
+        connect(handler, buffer_size)
+        callback.logger.addHandler(handler)
+    else:
+        connect(callback.handler.target.handler, buffer_size)
+
+    results = [Result(Task(i)) for i in range(tasks)]
+    callback.v2_playbook_on_start(Playbook())
+    latencies = []
+    for result in results:
+        start = time.perf_counter()
+        callback.v2_runner_on_ok(result)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    if synchronous:
+        data = callback.build_event("OK", "finish")
+        callback.logger.info("ansible stats", extra=data)
+        callback.logger.removeHandler(handler)
+        handler.close()
+    else:
+        callback.v2_playbook_on_stats(Stats())
+    return sorted(latencies), time.perf_counter() - start, callback
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    parser.add_argument("--tasks", type=int, default=600)
+    parser.add_argument(
+        "--rates",
+        default="0,1000000,100000,20000",
+        help="comma separated bytes per second of the server, 0 is unlimited",
+    )
+    parser.add_argument("--buffer-size", type=int, default=16384)
+    parser.add_argument("--flush-timeout", type=float, default=5)
+    args = parser.parse_args()
+
+    os.environ["LOGSTASH_SERVER"] = "127.0.0.1"
+    os.environ["LOGSTASH_RESULTS"] = "true"
+    os.environ["LOGSTASH_FLUSH_TIMEOUT"] = str(args.flush_timeout)
+    plugin = load_plugin()
+    # The synchronous handler logs failed sends, which is not of interest here
+    logging.raiseExceptions = False
+
+    print("%d tasks, flush timeout %.0fs" % (args.tasks, args.flush_timeout))
+    columns = ("p50 ms", "p99 ms", "max ms", "stats ms", "spooled", "dropped")
+    header = ("rate B/s", "sender") + columns
+    print("%-10s %-12s %10s %10s %10s %10s %9s %9s" % header)
+    for rate in [int(rate) for rate in args.rates.split(",")]:
+        for synchronous in (False, True):
+            latencies, stats, callback = run(
+                plugin, rate, args.tasks, synchronous, args.buffer_size
+            )
+            print(
+                "%-10s %-12s %10.3f %10.3f %10.3f %10.1f %9s %9s"
+                % (
+                    rate or "unlimited",
+                    "synchronous" if synchronous else "batching",
+                    percentile(latencies, 0.5) * 1000,
+                    percentile(latencies, 0.99) * 1000,
+                    latencies[-1] * 1000,
+                    stats * 1000,
+                    "-" if synchronous else callback.handler.spooled,
+                    "-" if synchronous else callback.handler.dropped,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
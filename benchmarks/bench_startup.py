@@ -0,0 +1,106 @@
+"""bench_startup
+=============
+
+Measure the startup time of the ants entry points and fail if it exceeds
+a budget.
+
+Every entry point is run with python -X importtime. The import time is
+the sum of the cumulative times of all top level imports, less the
+imports of the bare interpreter. The best of --runs runs is compared
+with the budget of the entry point, so a busy machine does not fail the
+benchmark. Wall time is reported for reference only.
+
+Run it from the repository root. It exits with 1 if an entry point is
+over its budget:
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Name, arguments and import time budget in milliseconds
+ENTRY_POINTS = (
+    ("ants --help", ["bin/ants", "--help"], 150),
+    ("ants --version", ["bin/ants", "--version"], 150),
+    ("ants_inventory_default", ["bin/ants_inventory_default"], 100),
+)
+
+
+def import_time(output):
+    """Return the import time in ms from the -X importtime output."""
+    total = 0
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line.split("|")
+        # Top level imports are not indented
+        if len(fields) == 3 and not fields[2].startswith("  "):
+            try:
+                total += int(fields[1])
+            except ValueError:
+                # Header line
+                continue
+    return total / 1000.0
+
+
+def run(arguments):
+    """Run python -X importtime with arguments. Return import and wall time."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime"] + arguments,
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    wall = (time.perf_counter() - start) * 1000.0
+    if proc.returncode != 0:
+        sys.exit(
+            "%s failed with rc %d:\n%s"
+            % (" ".join(arguments), proc.returncode, proc.stderr[-2000:])
+        )
+    return import_time(proc.stderr), wall
+
+
+def best_of(arguments, runs):
+    results = [run(arguments) for _ in range(runs)]
+    return min(r[0] for r in results), min(r[1] for r in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[3])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="multiply all budgets by this"
+    )
+    args = parser.parse_args()
+
+    baseline, baseline_wall = best_of(["-c", "pass"], args.runs)
+    print("%-24s %9.1fms imports %9.1fms wall" % ("python", baseline, baseline_wall))
+    over_budget = []
+    for name, arguments, budget in ENTRY_POINTS:
+        imports, wall = best_of(arguments, args.runs)
+        imports -= baseline
+        budget *= args.scale
+        result = "ok" if imports <= budget else "OVER BUDGET"
+        print(
+            "%-24s %9.1fms imports %9.1fms wall  budget %.0fms  %s"
+            % (name, imports, wall, budget, result)
+        )
+        if imports > budget:
+            over_budget.append(name)
+    if over_budget:
+        sys.exit("Startup over budget: %s" % ", ".join(over_budget))
+
+
+if __name__ == "__main__":
+    main()
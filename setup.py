@@ -49,7 +49,7 @@ setuptools.setup(
     install_requires=requirements,
     package_data={
         "antslib": ["etc/ants.cfg"],
-        "antslib.plugins": ["callback/ants_logstash.py"],
+        "antslib.plugins": ["callback/ants_logstash.py", "callback/ants_recap.py"],
     },
-    python_requires=">=3.6",
+    python_requires=">=3.7",
 )
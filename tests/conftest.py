@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Test the antslib of this checkout, not an installed one
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Loggers write below log_dir, keep them out of the log directory of the system
+os.environ["ANTS_MAIN_LOG_DIR"] = tempfile.mkdtemp(prefix="ants-tests-")
@@ -0,0 +1,180 @@
+"""Serve the AD inventory from its cache and refresh it in the background."""
+
+import importlib.util
+import os
+import socket
+import textwrap
+import time
+
+import pytest
+
+pytest.importorskip("ldap3")
+pytest.importorskip("certifi")
+
+from antslib import configer  # noqa: E402
+from antslib.inventory import ad, cache  # noqa: E402
+
+COMPUTERS_OU = "OU=Computers,DC=example,DC=com"
+GROUPS_OU = "OU=Groups,DC=example,DC=com"
+OLD_INVENTORY = {"ants-common": ["client"], "ants-old": ["client"]}
+
+# Replaces ldap3.Connection with a MOCK_SYNC directory holding this host
+# in the group ants-web. Installed in the processes of the background
+# refresh as sitecustomize.
+MOCK_DC = textwrap.dedent(
+    """
+    import os
+    import socket
+    import struct
+    import time
+
+    import ldap3
+
+    _Connection = ldap3.Connection
+
+
+    def raw_sid(rid):
+        authority = b"\\x01\\x05\\x00\\x00\\x00\\x00\\x00\\x05"
+        return authority + struct.pack("<IIIII", 21, 21, 42, 84, rid)
+
+
+    def Connection(server, user=None, password=None, **kwargs):
+        kwargs["client_strategy"] = ldap3.MOCK_SYNC
+        connection = _Connection(server, user=user, password=password, **kwargs)
+        connection.strategy.add_entry(
+            user, {"userPassword": os.environ["ANTS_TEST_DC_PASSWORD"]}
+        )
+        connection.strategy.add_entry(
+            "CN=ants-web,%(groups)s",
+            {
+                "objectClass": "group",
+                "objectCategory": "group",
+                "cn": "ants-web",
+                "objectSid": raw_sid(1),
+            },
+        )
+        name = socket.gethostname().lower().split(".")[0]
+        connection.strategy.add_entry(
+            "CN=%%s,%(computers)s" %% name,
+            {"objectClass": "computer", "cn": name, "tokenGroups": [raw_sid(1)]},
+        )
+        time.sleep(float(os.environ.get("ANTS_TEST_DC_DELAY", "0")))
+        return connection
+
+
+    if __name__ == "sitecustomize":
+        ldap3.Connection = Connection
+    """
+    % {"groups": GROUPS_OU, "computers": COMPUTERS_OU}
+)
+
+
+@pytest.fixture
+def mock_dc(tmp_path, monkeypatch):
+    """Point the ad config to a mock directory and return the cache file."""
+    mock_dir = tmp_path / "mock_dc"
+    mock_dir.mkdir()
+    (mock_dir / "sitecustomize.py").write_text(MOCK_DC)
+    spec = importlib.util.spec_from_file_location(
+        "mock_dc", str(mock_dir / "sitecustomize.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(ad, "Connection", module.Connection)
+
+    cache_file = str(tmp_path / "inventory_cache.json")
+    monkeypatch.setenv(
+        "PYTHONPATH",
+        os.pathsep.join(filter(None, [str(mock_dir), os.environ.get("PYTHONPATH")])),
+    )
+    for key, value in {
+        "LDAP_USER": "CN=reader,DC=example,DC=com",
+        "LDAP_PW": "secret",
+        "LDAP_HOST": "dc1.example.com",
+        "LDAP_OU_COMPUTERS": COMPUTERS_OU,
+        "LDAP_OU_GROUPS": GROUPS_OU,
+        "CACHE_FILE": cache_file,
+        "CACHE_TTL": "3600",
+        "GROUP_RESOLUTION": "token_groups",
+    }.items():
+        monkeypatch.setenv("ANTS_AD_%s" % key, value)
+    monkeypatch.setenv("ANTS_TEST_DC_PASSWORD", "secret")
+    configer.clear_config_cache()
+    yield cache_file
+    configer.clear_config_cache()
+
+
+def fqdn():
+    return socket.gethostname()
+
+
+def write_old_cache(cache_file, age):
+    cache.write_cache(cache_file, OLD_INVENTORY, online=True, source="dc0")
+    checked = time.time() - age
+    os.utime(cache_file, (checked, checked))
+    return cache.read_cache(cache_file)
+
+
+def wait_for_refresh(cache_file, checked, timeout=20):
+    """Return the cache once the background refresh has written it."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        content = cache.read_cache(cache_file)
+        if content["checked"] != checked:
+            return content
+        time.sleep(0.1)
+    pytest.fail("The cache was not refreshed within %ss" % timeout)
+
+
+def test_no_cache_queries_ad(mock_dc):
+    inventory = ad.get_inventory()
+    assert inventory == {
+        "ants-common": [fqdn()],
+        "ants-web": [fqdn()],
+        "ants-ad-connected": [fqdn()],
+    }
+    content = cache.read_cache(mock_dc)
+    assert content["online"] is True
+    assert content["source"] == "dc1.example.com"
+    # The connected group is never cached
+    assert "ants-ad-connected" not in content["inventory"]
+
+
+def test_fresh_cache_is_used(mock_dc, monkeypatch):
+    write_old_cache(mock_dc, age=60)
+    monkeypatch.setattr(ad, "connect_to_ad", lambda *args, **kwargs: pytest.fail())
+    monkeypatch.setattr(ad, "refresh_cache_in_background", lambda: pytest.fail())
+    inventory = ad.get_inventory()
+    assert inventory == dict(OLD_INVENTORY, **{"ants-ad-connected": [fqdn()]})
+
+
+def test_stale_cache_is_served_while_refreshing(mock_dc, monkeypatch):
+    old = write_old_cache(mock_dc, age=7200)
+    # The domain controller of the background refresh is slow to answer
+    monkeypatch.setenv("ANTS_TEST_DC_DELAY", "1")
+    start = time.monotonic()
+    inventory = ad.get_inventory()
+    assert time.monotonic() - start < 0.5
+    assert inventory == OLD_INVENTORY
+    assert cache.read_cache(mock_dc)["checked"] == old["checked"]
+
+    content = wait_for_refresh(mock_dc, old["checked"])
+    assert content["inventory"] == {"ants-common": [fqdn()], "ants-web": [fqdn()]}
+    assert content["online"] is True
+    assert content["source"] == "dc1.example.com"
+    assert content["created"] > old["created"]
+
+
+def test_failed_refresh_keeps_old_cache(mock_dc, monkeypatch):
+    old = write_old_cache(mock_dc, age=7200)
+    # The bind of the background refresh fails
+    monkeypatch.setenv("ANTS_TEST_DC_PASSWORD", "changed")
+    assert ad.get_inventory() == OLD_INVENTORY
+
+    content = wait_for_refresh(mock_dc, old["checked"])
+    assert content["inventory"] == OLD_INVENTORY
+    assert content["created"] == old["created"]
+    assert content["source"] == "dc0"
+    assert content["online"] is False
+    assert time.time() - content["checked"] < 60
+
@@ -0,0 +1,126 @@
+import socket
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("ldap3")
+pytest.importorskip("certifi")
+
+from antslib.inventory import ad  # noqa: E402
+
+
+class SilentDC(object):
+    """A domain controller that accepts connections but never answers."""
+
+    def __init__(self):
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(16)
+        self.address = "127.0.0.1:%d" % self.server.getsockname()[1]
+        self.connections = []
+        self.accepted = []
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections.append(connection)
+            self.accepted.append(time.monotonic())
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+        self.server.close()
+
+
+def refused_address():
+    """Return an address on which connections are refused."""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    address = "127.0.0.1:%d" % server.getsockname()[1]
+    server.close()
+    return address
+
+
+@pytest.fixture
+def silent_dcs():
+    dcs = [SilentDC() for _ in range(3)]
+    yield dcs
+    for dc in dcs:
+        dc.close()
+
+
+def test_silent_dcs_give_up_after_bind_timeout(silent_dcs):
+    start = time.monotonic()
+    connection = ad.connect_to_ad(
+        "user",
+        "password",
+        ",".join(dc.address for dc in silent_dcs),
+        connect_timeout=1,
+        bind_timeout=1.5,
+        search_timeout=30,
+        stagger=0.25,
+    )
+    elapsed = time.monotonic() - start
+    assert connection is None
+    assert 1.5 <= elapsed < 2.5
+    # The attempts were started one after another, not one per timeout
+    assert all(len(dc.accepted) == 1 for dc in silent_dcs)
+
+
+def test_next_dc_starts_when_an_attempt_fails(silent_dcs):
+    start = time.monotonic()
+    connection = ad.connect_to_ad(
+        "user",
+        "password",
+        ",".join([refused_address(), silent_dcs[0].address]),
+        connect_timeout=1,
+        bind_timeout=1,
+        search_timeout=30,
+        stagger=5,
+    )
+    assert connection is None
+    # Without the failure, the second attempt would wait for the stagger
+    assert silent_dcs[0].accepted[0] - start < 0.5
+
+
+def test_last_good_dc_is_remembered(silent_dcs, monkeypatch, tmp_path):
+    dc_file = str(tmp_path / "last_dc")
+    good_dc = "dc.example.com"
+    bind_to_dc = ad.bind_to_dc
+    tried = []
+
+    class FakeConnection(object):
+        def unbind(self):
+            pass
+
+    def fake_bind_to_dc(user, password, host, connect_timeout, receive_timeout):
+        tried.append(host)
+        if host == good_dc:
+            return FakeConnection()
+        return bind_to_dc(user, password, host, connect_timeout, receive_timeout)
+
+    monkeypatch.setattr(ad, "bind_to_dc", fake_bind_to_dc)
+    hosts = ",".join([silent_dcs[0].address, silent_dcs[1].address, good_dc])
+
+    connection = ad.connect_to_ad(
+        "user", "password", hosts, bind_timeout=5, stagger=0.1, dc_file=dc_file
+    )
+    assert isinstance(connection, FakeConnection)
+    assert tried == [silent_dcs[0].address, silent_dcs[1].address, good_dc]
+    with open(dc_file) as f:
+        assert f.read() == good_dc
+
+    # The last good domain controller is tried first
+    del tried[:]
+    start = time.monotonic()
+    connection = ad.connect_to_ad(
+        "user", "password", hosts, bind_timeout=5, stagger=0.1, dc_file=dc_file
+    )
+    assert isinstance(connection, FakeConnection)
+    assert tried == [good_dc]
+    assert time.monotonic() - start < 0.1
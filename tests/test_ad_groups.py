@@ -0,0 +1,153 @@
+"""Resolve the AD groups of a computer with tokenGroups and a SID cache."""
+
+import json
+import struct
+
+import pytest
+
+pytest.importorskip("ldap3")
+pytest.importorskip("certifi")
+
+from antslib.inventory import ad  # noqa: E402
+from ldap3 import MOCK_SYNC, Connection, Server  # noqa: E402
+
+GROUPS_OU = "OU=Groups,DC=example,DC=com"
+OTHER_OU = "OU=Other,DC=example,DC=com"
+COMPUTERS_OU = "OU=Computers,DC=example,DC=com"
+
+
+def raw_sid(rid):
+    return b"\x01\x05\x00\x00\x00\x00\x00\x05\x15\x00\x00\x00" + struct.pack(
+        "<IIII", 21, 42, 84, rid
+    )
+
+
+class Directory(object):
+    """A mock directory counting the searches sent to it."""
+
+    def __init__(self):
+        self.connection = Connection(
+            Server("dc1"),
+            user="CN=reader,DC=example,DC=com",
+            password="secret",
+            client_strategy=MOCK_SYNC,
+            raise_exceptions=True,
+        )
+        self.connection.strategy.add_entry(
+            "CN=reader,DC=example,DC=com", {"userPassword": "secret"}
+        )
+        self.add_group("ants-web", 1)
+        self.add_group("ANTS-Db", 2)
+        self.add_group("other", 3)
+        self.add_group("ants-elsewhere", 4, OTHER_OU)
+        # rid 5 is not a group yet, rid 6 is a group without the computer
+        self.add_group("ants-unrelated", 6)
+        self.connection.strategy.add_entry(
+            "CN=client,%s" % COMPUTERS_OU,
+            {
+                "objectClass": "computer",
+                "cn": "client",
+                "tokenGroups": [raw_sid(rid) for rid in range(1, 6)],
+            },
+        )
+        self.connection.bind()
+        self.searches = 0
+        search = self.connection.search
+
+        def counting_search(*args, **kwargs):
+            self.searches += 1
+            return search(*args, **kwargs)
+
+        self.connection.search = counting_search
+
+    def add_group(self, name, rid, ou=GROUPS_OU):
+        self.connection.strategy.add_entry(
+            "CN=%s,%s" % (name, ou),
+            {
+                "objectClass": "group",
+                "objectCategory": "group",
+                "cn": name,
+                "objectSid": raw_sid(rid),
+            },
+        )
+
+    def groups(self, sid_cache_file, missing_ttl=86400):
+        self.searches = 0
+        computer_dn = ad.find_computer(self.connection, "client", COMPUTERS_OU)
+        return ad.get_computer_token_groups(
+            self.connection,
+            GROUPS_OU,
+            computer_dn,
+            "ants-",
+            sid_cache_file,
+            missing_ttl=missing_ttl,
+        )
+
+
+@pytest.fixture
+def directory():
+    return Directory()
+
+
+@pytest.fixture
+def sid_cache_file(tmp_path):
+    return str(tmp_path / "sid_cache.json")
+
+
+def test_find_computer(directory):
+    assert (
+        ad.find_computer(directory.connection, "client", COMPUTERS_OU)
+        == "CN=client,%s" % COMPUTERS_OU
+    )
+    assert ad.find_computer(directory.connection, "missing", COMPUTERS_OU) is None
+    assert ad.find_computer(directory.connection, "cl*", COMPUTERS_OU) is None
+
+
+def test_groups_are_resolved_and_cached(directory, sid_cache_file):
+    assert directory.groups(sid_cache_file) == ["ants-db", "ants-web"]
+    # The computer, its token groups and one search for all SIDs
+    assert directory.searches == 3
+
+    groups, missing = ad.read_sid_cache(sid_cache_file)
+    assert sorted(groups.values()) == ["ants-db", "ants-web"]
+    # Without prefix, outside the groups OU or not a group
+    assert set(missing) == set(ad.format_sid(raw_sid(rid)) for rid in (3, 4, 5))
+
+    assert directory.groups(sid_cache_file) == ["ants-db", "ants-web"]
+    assert directory.searches == 2
+
+
+def test_missing_sids_expire(directory, sid_cache_file):
+    directory.groups(sid_cache_file)
+    directory.add_group("ants-new", 5)
+    assert directory.groups(sid_cache_file) == ["ants-db", "ants-web"]
+    assert directory.searches == 2
+
+    assert directory.groups(sid_cache_file, missing_ttl=0) == [
+        "ants-db",
+        "ants-new",
+        "ants-web",
+    ]
+    assert directory.searches == 3
+    groups, missing = ad.read_sid_cache(sid_cache_file)
+    assert ad.format_sid(raw_sid(5)) in groups
+    assert ad.format_sid(raw_sid(5)) not in missing
+
+
+def test_old_sid_cache_format(directory, sid_cache_file):
+    web = ad.format_sid(raw_sid(1))
+    new = ad.format_sid(raw_sid(5))
+    with open(sid_cache_file, "w") as f:
+        json.dump({web: "ants-web", new: ""}, f)
+    assert ad.read_sid_cache(sid_cache_file) == ({web: "ants-web"}, {})
+
+    # SIDs without a group in the old format are looked up again
+    directory.add_group("ants-new", 5)
+    assert "ants-new" in directory.groups(sid_cache_file)
+
+
+def test_broken_sid_cache(directory, sid_cache_file):
+    with open(sid_cache_file, "w") as f:
+        f.write('{"groups": ')
+    assert ad.read_sid_cache(sid_cache_file) == ({}, {})
+    assert directory.groups(sid_cache_file) == ["ants-db", "ants-web"]
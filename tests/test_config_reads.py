@@ -0,0 +1,159 @@
+"""Count how often every config file is read during one ants invocation."""
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGED_CONFIG = os.path.join(ROOT, "antslib", "etc", "ants.cfg")
+
+# Runs bin/ants with the config below config_dir and writes the number of
+# times every .cfg file was opened to counts_file
+DRIVER = textwrap.dedent(
+    """
+    import builtins
+    import collections
+    import json
+    import os
+    import runpy
+    import sys
+
+    config_dir, counts_file = sys.argv[1:3]
+    counts = collections.Counter()
+    _open = builtins.open
+
+    def counting_open(file, *args, **kwargs):
+        if isinstance(file, str) and file.endswith(".cfg"):
+            counts[os.path.abspath(file)] += 1
+        return _open(file, *args, **kwargs)
+
+    builtins.open = counting_open
+
+    from antslib import configer, pre_run_checker
+
+    configer.CONFIG_PATH = config_dir
+    configer.CONFIG_DROP_IN_PATH = os.path.join(config_dir, "conf.d")
+    configer.is_root = lambda: True
+    # The checks need ssh and a remote repository
+    pre_run_checker.check_run_requirements = lambda args, env: None
+
+    sys.argv = ["ants"] + sys.argv[3:]
+    try:
+        runpy.run_path(os.path.join("bin", "ants"), run_name="__main__")
+    finally:
+        with _open(counts_file, "w") as f:
+            json.dump(counts, f)
+    """
+)
+
+ANSIBLE_PULL = textwrap.dedent(
+    """\
+    #!{python}
+    import json, os
+    os.makedirs(os.path.dirname(os.environ["ANTS_RECAP_FILE"]), exist_ok=True)
+    with open(os.environ["ANTS_RECAP_FILE"], "w") as f:
+        json.dump({{"version": 1, "plays": 1, "hosts": {{}}, "tasks": []}}, f)
+    print("PLAY [all]")
+    """
+)
+
+
+def git(*args):
+    subprocess.run(
+        ["git", "-c", "user.name=ants", "-c", "user.email=ants@example.com"]
+        + list(args),
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+@pytest.fixture
+def setup(tmp_path):
+    """Return the config dir, its config files and the environment."""
+    config_dir = tmp_path / "etc"
+    (config_dir / "conf.d").mkdir(parents=True)
+    system_config = config_dir / "ants.cfg"
+    system_config.write_text("[main]\nwait_interval = 0\n")
+    drop_in = config_dir / "conf.d" / "10-site.cfg"
+    drop_in.write_text("[main]\nmax_backoff = 60\n")
+
+    work = tmp_path / "work"
+    git("init", "-q", str(work))
+    (work / "site.yml").write_text("- hosts: all\n")
+    git("-C", str(work), "add", "site.yml")
+    git("-C", str(work), "commit", "-q", "-m", "playbook")
+    repository = tmp_path / "repository.git"
+    git("clone", "-q", "--bare", str(work), str(repository))
+    branch = subprocess.run(
+        ["git", "-C", str(work), "symbolic-ref", "--short", "HEAD"],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout.strip()
+
+    ansible_pull = tmp_path / "ansible-pull"
+    ansible_pull.write_text(ANSIBLE_PULL.format(python=sys.executable))
+    ansible_pull.chmod(0o755)
+    inventory = tmp_path / "inventory.json"
+    inventory.write_text(json.dumps({"all": {"hosts": ["localhost"]}}))
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    for key in list(env):
+        if key.startswith("ANTS_"):
+            del env[key]
+    env.update(
+        ANTS_MAIN_LOG_DIR=str(tmp_path / "log"),
+        ANTS_MAIN_ANSIBLE_PULL_EXE=str(ansible_pull),
+        ANTS_MAIN_GIT_REPOSITORY=str(repository),
+        ANTS_MAIN_BRANCH=branch,
+        ANTS_MAIN_DESTINATION=str(tmp_path / "checkout"),
+        ANTS_MAIN_CONTROL_SOCKET=str(tmp_path / "ants.sock"),
+    )
+    config_files = [PACKAGED_CONFIG, str(system_config), str(drop_in)]
+    return tmp_path, config_dir, config_files, env, inventory
+
+
+def run_ants(tmp_path, config_dir, env, *args):
+    counts_file = tmp_path / "counts.json"
+    driver = tmp_path / "driver.py"
+    driver.write_text(DRIVER)
+    proc = subprocess.run(
+        [sys.executable, str(driver), str(config_dir), str(counts_file)] + list(args),
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    )
+    assert proc.returncode == 0, proc.stdout
+    with open(counts_file) as f:
+        return json.load(f), proc.stdout
+
+
+def test_run_reads_every_config_file_once(setup):
+    tmp_path, config_dir, config_files, env, inventory = setup
+    counts, output = run_ants(tmp_path, config_dir, env, "-i", str(inventory))
+    assert "PLAY [all]" in output
+    assert counts == dict((path, 1) for path in config_files)
+
+
+def test_show_config_reads_every_config_file_once(setup):
+    tmp_path, config_dir, config_files, env, inventory = setup
+    counts, output = run_ants(tmp_path, config_dir, env, "--show-config")
+    assert "max_backoff: 60" in output
+    assert counts == dict((path, 1) for path in config_files)
+
+
+def test_compiled_config_skips_config_files(setup):
+    tmp_path, config_dir, config_files, env, inventory = setup
+    env["ANTS_CONFIG_CACHE"] = str(tmp_path / "config_cache.json")
+    counts, output = run_ants(tmp_path, config_dir, env, "--show-config")
+    assert counts == dict((path, 1) for path in config_files)
+    counts, output = run_ants(tmp_path, config_dir, env, "--show-config")
+    assert counts == {}
+    assert "max_backoff: 60" in output
@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+
+import pytest
+from antslib.inventory import cache
+
+INVENTORY = {"ants-common": ["client.example.com"], "ants-web": ["client.example.com"]}
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    return str(tmp_path / "inventory_cache.json")
+
+
+def test_write_and_read(cache_file):
+    assert cache.write_cache(cache_file, INVENTORY, online=True, source="dc1")
+    content = cache.read_cache(cache_file)
+    assert content["inventory"] == INVENTORY
+    assert content["online"] is True
+    assert content["source"] == "dc1"
+    assert content["checked"] == os.stat(cache_file).st_mtime
+
+
+def test_unchanged_inventory_is_not_rewritten(cache_file):
+    cache.write_cache(cache_file, INVENTORY, source="dc1")
+    created = cache.read_cache(cache_file)["created"]
+    assert not cache.write_cache(cache_file, dict(INVENTORY), source="dc1")
+    assert cache.read_cache(cache_file)["created"] == created
+
+
+def test_missing_file(cache_file):
+    assert cache.read_cache(cache_file) is None
+
+
+def test_truncated_file(cache_file):
+    cache.write_cache(cache_file, INVENTORY)
+    with open(cache_file, "r+") as f:
+        f.truncate(os.path.getsize(cache_file) // 2)
+    with pytest.raises(cache.CacheError):
+        cache.read_cache(cache_file)
+
+
+def test_empty_file(cache_file):
+    open(cache_file, "w").close()
+    with pytest.raises(cache.CacheError):
+        cache.read_cache(cache_file)
+
+
+def test_wrong_version(cache_file):
+    cache.write_cache(cache_file, INVENTORY)
+    with open(cache_file) as f:
+        content = json.load(f)
+    content["version"] = cache.CACHE_VERSION + 1
+    with open(cache_file, "w") as f:
+        json.dump(content, f)
+    with pytest.raises(cache.CacheError, match="version"):
+        cache.read_cache(cache_file)
+
+
+def test_wrong_inventory_key(cache_file):
+    cache.write_cache(cache_file, INVENTORY)
+    with open(cache_file) as f:
+        content = json.load(f)
+    content["groups"] = content.pop("inventory")
+    with open(cache_file, "w") as f:
+        json.dump(content, f)
+    with pytest.raises(cache.CacheError, match="inventory"):
+        cache.read_cache(cache_file)
+
+
+def test_hash_mismatch(cache_file):
+    cache.write_cache(cache_file, INVENTORY)
+    with open(cache_file) as f:
+        content = json.load(f)
+    content["inventory"]["ants-admin"] = ["client.example.com"]
+    with open(cache_file, "w") as f:
+        json.dump(content, f)
+    with pytest.raises(cache.CacheError, match="hash"):
+        cache.read_cache(cache_file)
+
+
+def test_not_an_object(cache_file):
+    with open(cache_file, "w") as f:
+        json.dump([INVENTORY], f)
+    with pytest.raises(cache.CacheError):
+        cache.read_cache(cache_file)
+
+
+def test_legacy_cache(cache_file):
+    with open(cache_file, "w") as f:
+        json.dump(INVENTORY, f)
+    content = cache.read_cache(cache_file)
+    assert content["inventory"] == INVENTORY
+    assert content["version"] == cache.CACHE_VERSION
+    assert content["online"] is False
+
+
+def test_concurrent_writers(cache_file):
+    """Readers only ever see a complete cache of one of the writers."""
+    inventories = [
+        {"ants-common": ["client.example.com"], "ants-%d" % i: ["x" * 1000] * 50}
+        for i in range(4)
+    ]
+    cache.write_cache(cache_file, inventories[0])
+    stop = threading.Event()
+    errors = []
+
+    def write(inventory):
+        try:
+            while not stop.is_set():
+                cache.write_cache(cache_file, inventory)
+        except Exception as error:
+            errors.append(error)
+
+    writers = [threading.Thread(target=write, args=(i,)) for i in inventories]
+    for writer in writers:
+        writer.start()
+    try:
+        for _ in range(300):
+            assert cache.read_cache(cache_file)["inventory"] in inventories
+    finally:
+        stop.set()
+        for writer in writers:
+            writer.join()
+    assert not errors
+    assert cache.read_cache(cache_file)["inventory"] in inventories
+    # No temporary files are left behind
+    assert os.listdir(os.path.dirname(cache_file)) == ["inventory_cache.json"]
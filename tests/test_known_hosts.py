@@ -0,0 +1,128 @@
+"""Look up hosts in known_hosts files like OpenSSH does."""
+
+import base64
+import hashlib
+import hmac
+import os
+
+import pytest
+from antslib import known_hosts
+
+KEY = "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIDx1kS6zs1Y2Yl1ZJ3BG2vxcTs8nnvVKwBiBh2Wn3Ej0"
+
+
+def hashed(name, salt=b"0123456789abcdefghij"):
+    digest = hmac.new(salt, name.encode("utf-8"), hashlib.sha1).digest()
+    return "|1|%s|%s" % (
+        base64.b64encode(salt).decode("ascii"),
+        base64.b64encode(digest).decode("ascii"),
+    )
+
+
+@pytest.fixture
+def known_hosts_file(tmp_path):
+    """Return a function writing lines to a known_hosts file."""
+
+    def write(*host_patterns, path="known_hosts"):
+        path = str(tmp_path / path)
+        with open(path, "w") as f:
+            for patterns in host_patterns:
+                f.write("%s %s\n" % (patterns, KEY))
+        return path
+
+    return write
+
+
+@pytest.mark.parametrize(
+    "patterns, hostname, port, known",
+    [
+        ("git.example.com", "git.example.com", None, True),
+        ("git.example.com", "GIT.Example.com", None, True),
+        ("GIT.example.com,10.0.0.1", "git.example.com", None, True),
+        # No substring matches
+        ("mygit.example.com", "git.example.com", None, False),
+        ("git.example.com.evil", "git.example.com", None, False),
+        (hashed("git.example.com"), "git.example.com", None, True),
+        (hashed("git.example.com"), "other.example.com", None, False),
+        ("[git.example.com]:2222", "git.example.com", 2222, True),
+        ("[git.example.com]:2222", "git.example.com", None, False),
+        ("git.example.com", "git.example.com", 2222, False),
+        ("git.example.com", "git.example.com", 22, True),
+        (hashed("[git.example.com]:2222"), "git.example.com", 2222, True),
+        ("*.example.com", "git.example.com", None, True),
+        ("git?.example.com", "git1.example.com", None, True),
+        ("git?.example.com", "git.example.com", None, False),
+        ("[*.example.com]:2222", "git.example.com", 2222, True),
+        ("[*.example.com]:2222", "git.example.com", 2223, False),
+        ("*.example.com,!bad.example.com", "bad.example.com", None, False),
+        ("!bad.example.com,*.example.com", "bad.example.com", None, False),
+        ("*.example.com,!bad.example.com", "git.example.com", None, True),
+    ],
+)
+def test_find_host(known_hosts_file, patterns, hostname, port, known):
+    path = known_hosts_file(patterns)
+    assert known_hosts.find_host(hostname, [path], port) == (path if known else None)
+
+
+def test_markers_comments_and_short_lines(tmp_path):
+    path = str(tmp_path / "known_hosts")
+    with open(path, "w") as f:
+        f.write("# git.example.com %s\n" % KEY)
+        f.write("git.example.com ssh-ed25519\n")
+        f.write("@revoked git.example.com %s\n" % KEY)
+        f.write("\n")
+    assert known_hosts.find_host("git.example.com", [path]) is None
+    with open(path, "a") as f:
+        f.write("@cert-authority *.example.com %s\n" % KEY)
+    assert known_hosts.find_host("git.example.com", [path]) == path
+
+
+def test_first_file_knowing_the_host_wins(tmp_path, known_hosts_file):
+    other = known_hosts_file("other.example.com", path="other")
+    first = known_hosts_file("git.example.com", path="first")
+    second = known_hosts_file("git.example.com", path="second")
+    missing = str(tmp_path / "missing")
+    files = [missing, other, first, second]
+    assert known_hosts.find_host("git.example.com", files) == first
+
+
+def find(path, index_file):
+    return known_hosts.find_host("git.example.com", [path], index_file=index_file)
+
+
+def test_index_is_used_until_a_file_changes(tmp_path, known_hosts_file, monkeypatch):
+    index_file = str(tmp_path / "known_hosts.json")
+    path = known_hosts_file("other.example.com")
+    assert find(path, index_file) is None
+    index = known_hosts.read_index(index_file)
+    assert index[path]["hosts"] == {"git.example.com": False}
+
+    # Unchanged files are not read again
+    file_contains = known_hosts.file_contains
+    monkeypatch.setattr(
+        known_hosts, "file_contains", lambda *args: pytest.fail("File was read")
+    )
+    assert find(path, index_file) is None
+
+    with open(path, "a") as f:
+        f.write("git.example.com %s\n" % KEY)
+    monkeypatch.setattr(known_hosts, "file_contains", file_contains)
+    assert find(path, index_file) == path
+    index = known_hosts.read_index(index_file)
+    assert index[path]["hosts"] == {"git.example.com": True}
+
+
+def test_broken_index_is_ignored(tmp_path, known_hosts_file):
+    index_file = str(tmp_path / "known_hosts.json")
+    with open(index_file, "w") as f:
+        f.write('{"version": 1, "files": ')
+    path = known_hosts_file("git.example.com")
+    assert find(path, index_file) == path
+    assert known_hosts.read_index(index_file)[path]["hosts"]["git.example.com"]
+
+
+def test_unwritable_index(tmp_path, known_hosts_file):
+    index_file = str(tmp_path / "missing" / "known_hosts.json")
+    path = known_hosts_file("git.example.com")
+    assert find(path, index_file) == path
+    assert not os.path.exists(index_file)
@@ -0,0 +1,197 @@
+"""Rotate log files, compress them in the background and prune them."""
+
+import gzip
+import logging
+import os
+import time
+
+import pytest
+from antslib import logrotate
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    return str(tmp_path / "ok.log")
+
+
+def rotate(log_file, text, now):
+    """Write text to log_file and rotate it as if at now."""
+    with open(log_file, "w") as f:
+        f.write(text)
+    rotated = logrotate.rotated_name(log_file, now)
+    os.replace(log_file, rotated)
+    os.utime(rotated, (now, now))
+    return rotated
+
+
+def test_rollover_renames_to_timestamp(log_file):
+    handler = logrotate.RotatingLogHandler(log_file, maxBytes=0, delay=True)
+    log = logging.getLogger("test-logrotate-rollover")
+    log.propagate = False
+    log.addHandler(handler)
+    try:
+        for run in range(3):
+            log.warning("run %d", run)
+            handler.doRollover()
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+
+    rotated = logrotate.rotated_files(log_file)
+    assert len(rotated) == 3
+    assert all(logrotate.ROTATED_PATTERN.search(path) for path in rotated)
+    # Newest first
+    assert [open(path).read() for path in rotated] == ["run 2\n", "run 1\n", "run 0\n"]
+    assert not os.path.exists(log_file)
+
+
+def test_rotated_name_is_unique(log_file):
+    now = time.time()
+    first = rotate(log_file, "first", now)
+    assert logrotate.rotated_name(log_file, now) != first
+    with gzip.open(first + ".gz", "wt") as f:
+        f.write("first")
+    os.remove(first)
+    assert logrotate.rotated_name(log_file, now) != first
+
+
+def test_rotated_files_includes_legacy_backups_last(log_file):
+    now = time.time()
+    for number in (1, 2):
+        with open("%s.%d" % (log_file, number), "w") as f:
+            f.write("legacy %d" % number)
+    new = rotate(log_file, "new", now)
+    # Neither the log file itself nor files of other logs
+    open(log_file, "w").close()
+    open(log_file.replace("ok.log", "ok.log.bak"), "w").close()
+    open(log_file.replace("ok.log", "ok.logger.1"), "w").close()
+
+    assert logrotate.rotated_files(log_file) == [
+        new,
+        log_file + ".1",
+        log_file + ".2",
+    ]
+    assert logrotate.history(log_file)[0] == log_file
+
+
+def test_maintain_compresses_and_history_reads_them(log_file):
+    now = time.time()
+    for run in range(3):
+        rotate(log_file, "run %d\n" % run, now - 10 + run)
+    with open(log_file, "w") as f:
+        f.write("current\n")
+
+    logrotate.maintain([log_file])
+    history = logrotate.history(log_file)
+    assert history[0] == log_file
+    assert all(path.endswith(".gz") for path in history[1:])
+    # No temporary files are left behind
+    assert len(os.listdir(os.path.dirname(log_file))) == 4
+
+    lines = []
+    for path in history:
+        with logrotate.open_log(path) as f:
+            lines.append(f.read())
+    assert lines == ["current\n", "run 2\n", "run 1\n", "run 0\n"]
+
+
+def test_compress_keeps_mtime(log_file):
+    rotated = rotate(log_file, "x" * 1000, 1000000000)
+    logrotate.compress(rotated)
+    assert not os.path.exists(rotated)
+    assert os.stat(rotated + ".gz").st_mtime == 1000000000
+
+
+def test_prune_keep(log_file):
+    now = time.time()
+    rotated = [rotate(log_file, "run %d" % run, now - 10 + run) for run in range(5)]
+    removed = logrotate.prune([log_file], keep=2, max_bytes=0, max_age=0, now=now)
+    assert sorted(removed) == sorted(rotated[:3])
+    assert logrotate.rotated_files(log_file) == rotated[:2:-1]
+
+
+def test_prune_max_age(log_file):
+    now = time.time()
+    old = rotate(log_file, "old", now - 7200)
+    new = rotate(log_file, "new", now - 60)
+    removed = logrotate.prune([log_file], keep=0, max_bytes=0, max_age=3600, now=now)
+    assert removed == [old]
+    assert logrotate.rotated_files(log_file) == [new]
+
+
+def test_prune_max_bytes_over_all_logs(tmp_path):
+    now = time.time()
+    ok_log = str(tmp_path / "ok.log")
+    changed_log = str(tmp_path / "changed.log")
+    oldest = rotate(ok_log, "x" * 100, now - 30)
+    older = rotate(changed_log, "x" * 100, now - 20)
+    newer = rotate(ok_log, "x" * 100, now - 10)
+    newest = rotate(changed_log, "x" * 100, now)
+
+    removed = logrotate.prune(
+        [ok_log, changed_log], keep=0, max_bytes=250, max_age=0, now=now
+    )
+    assert sorted(removed) == sorted([oldest, older])
+    assert logrotate.rotated_files(ok_log) == [newer]
+    assert logrotate.rotated_files(changed_log) == [newest]
+
+
+def test_no_limits_keeps_everything(log_file):
+    now = time.time()
+    for run in range(5):
+        rotate(log_file, "run %d" % run, now - 100000000 + run)
+    assert logrotate.prune([log_file], 0, 0, 0, now=now) == []
+    assert len(logrotate.rotated_files(log_file)) == 5
+
+
+def test_start_maintenance_runs_in_background(log_file):
+    now = time.time()
+    for run in range(4):
+        rotate(log_file, "run %d\n" % run, now - 10 + run)
+    thread = logrotate.start_maintenance([log_file], keep=2)
+    assert not thread.daemon
+    thread.join(10)
+    rotated = logrotate.rotated_files(log_file)
+    assert len(rotated) == 2
+    with logrotate.open_log(rotated[0]) as f:
+        assert f.read() == "run 3\n"
+
+
+def test_missing_log_dir(tmp_path):
+    log_file = str(tmp_path / "missing" / "ok.log")
+    assert logrotate.rotated_files(log_file) == []
+    assert logrotate.history(log_file) == []
+    logrotate.maintain([log_file], keep=1, max_bytes=1, max_age=1)
+
+
+def test_status_reads_compressed_history(tmp_path):
+    from antslib import argparser
+
+    recap_log = str(tmp_path / "recap.log")
+    now = time.time()
+    for run, status in enumerate(("ok", "failed")):
+        rotate(
+            recap_log,
+            "2026-10-18 0%d:00:00\t*****\n"
+            "2026-10-18 0%d:00:00\tClient status: %s\n" % (run, run, status),
+            now - 10 + run,
+        )
+    logrotate.maintain([recap_log])
+    action = argparser.GetStatusAction(
+        ["-s"],
+        recap_log,
+        str(tmp_path / "status.json"),
+        str(tmp_path / "ants.sock"),
+        "status",
+    )
+
+    # Without a recap log, the latest rotated one is read
+    assert action.parse_recap_log(None) == "failed"
+    assert action.parse_recap_log("v") == "Last Run: \nClient status: failed\n"
+    history = action.read_recap_history().split("\n\n")
+    assert [run.splitlines()[1] for run in history if run] == [
+        "Client status: failed",
+        "Client status: ok",
+    ]
+    assert history[0].startswith("Run logged in recap.log.")
+    assert history[0].splitlines()[0].endswith(".gz:")
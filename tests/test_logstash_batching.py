@@ -0,0 +1,101 @@
+import importlib.util
+import json
+import logging
+import os
+import socket
+import time
+
+import pytest
+
+pytest.importorskip("ansible")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN = os.path.join(ROOT, "antslib", "plugins", "callback", "ants_logstash.py")
+
+
+def load_plugin():
+    spec = importlib.util.spec_from_file_location("ants_logstash", PLUGIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+ants_logstash = load_plugin()
+
+
+class EventFormatter(object):
+    def format(self, record):
+        return json.dumps({"message": record.getMessage()}).encode("utf-8")
+
+
+def record(message):
+    return logging.LogRecord("ants", logging.INFO, __file__, 0, message, (), None)
+
+
+@pytest.fixture
+def silent_server():
+    """A server that accepts connections but never answers. Return its port."""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(4)
+    yield server.getsockname()[1]
+    server.close()
+
+
+def spooled_messages(spool_dir):
+    messages = []
+    for name in sorted(os.listdir(spool_dir)):
+        with open(os.path.join(spool_dir, name), "rb") as f:
+            messages += [json.loads(line)["message"] for line in f]
+    return messages
+
+
+def test_close_waits_at_most_flush_timeout(silent_server, tmp_path):
+    spool_dir = str(tmp_path / "spool")
+    target = ants_logstash.HTTPTarget(
+        EventFormatter(), "127.0.0.1", silent_server, compress_level=0, timeout=2
+    )
+    handler = ants_logstash.BatchingHandler(
+        target,
+        batch_size=2,
+        flush_interval=1,
+        spool=ants_logstash.Spool(spool_dir),
+        flush_timeout=0.5,
+    )
+    messages = ["event %d" % i for i in range(10)]
+    for message in messages:
+        handler.emit(record(message))
+    # The sender is stuck in the first send now
+    time.sleep(0.2)
+
+    start = time.monotonic()
+    handler.close()
+    assert time.monotonic() - start < 0.7
+    assert handler.abandoned
+    # The queued events are spooled by close, the batch in flight is not yet
+    assert spooled_messages(spool_dir) == messages[2:]
+
+    # The stuck send times out and its batch is spooled as well
+    handler.thread.join(5)
+    assert not handler.thread.is_alive()
+    assert sorted(spooled_messages(spool_dir)) == sorted(messages)
+    assert handler.dropped == 0
+
+
+def test_close_without_spool_counts_dropped(silent_server):
+    target = ants_logstash.HTTPTarget(
+        EventFormatter(), "127.0.0.1", silent_server, compress_level=0, timeout=2
+    )
+    handler = ants_logstash.BatchingHandler(
+        target, batch_size=1, flush_interval=0.01, flush_timeout=0.3
+    )
+    for i in range(5):
+        handler.emit(record("event %d" % i))
+    time.sleep(0.2)
+
+    start = time.monotonic()
+    handler.close()
+    assert time.monotonic() - start < 0.5
+    assert handler.dropped == 4
+    handler.thread.join(5)
+    assert handler.dropped == 5
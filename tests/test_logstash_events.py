@@ -0,0 +1,143 @@
+"""Build ants_logstash events from a template with pre-serialized fields."""
+
+import importlib.util
+import json
+import logging
+import os
+
+import pytest
+
+pytest.importorskip("ansible")
+logstash = pytest.importorskip("logstash")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN = os.path.join(ROOT, "antslib", "plugins", "callback", "ants_logstash.py")
+
+
+def load_plugin():
+    spec = importlib.util.spec_from_file_location("ants_logstash", PLUGIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+ants_logstash = load_plugin()
+
+
+class Playbook(object):
+    _file_name = "site.yml"
+
+
+class Task(object):
+    _uuid = "task-1"
+    action = "ansible.builtin.copy"
+
+    def __str__(self):
+        return "TASK: copy motd"
+
+
+class Result(object):
+    _task = Task()
+    _result = {"changed": True}
+
+
+@pytest.fixture
+def make_callback(monkeypatch):
+    """Return a function creating a callback with a formatter version."""
+    callbacks = []
+
+    def make_callback(version=1):
+        monkeypatch.setenv("LOGSTASH_TRANSPORT", "http")
+        monkeypatch.setenv("LOGSTASH_SERVER", "127.0.0.1")
+        monkeypatch.setenv("LOGSTASH_PORT", "9")
+        monkeypatch.setenv("LOGSTASH_FORMATTER_VERSION", str(version))
+        callback = ants_logstash.CallbackModule()
+        callback.playbook = Playbook._file_name
+        callback.set_static_fields(ansible_playbook=callback.playbook)
+        callbacks.append(callback)
+        return callback
+
+    yield make_callback
+    for callback in callbacks:
+        callback.handler.close(0)
+
+
+def format_event(formatter, message, data):
+    """Return the event formatter makes of a record logged with extra=data."""
+    record = logging.getLogger("ants-test").makeRecord(
+        "ants-test", logging.INFO, __file__, 0, message, (), None, extra=data
+    )
+    return json.loads(formatter.format(record).decode("utf-8"))
+
+
+def test_static_fields_are_spliced_into_events(make_callback):
+    callback = make_callback()
+    data = callback.build_task_event(Result(), "OK")
+    assert set(data) == {
+        ants_logstash.STATIC_FIELDS,
+        "status",
+        "ansible_type",
+        "ansible_task_type",
+        "ansible_task",
+    }
+
+    formatter = ants_logstash.StaticFieldsFormatter(
+        logstash.LogstashFormatterVersion1("ants")
+    )
+    event = format_event(formatter, "ansible ok", data)
+    # The same event as with all fields on the record
+    inline = dict(callback.static_data, **data)
+    del inline[ants_logstash.STATIC_FIELDS]
+    expected = format_event(logstash.LogstashFormatterVersion1("ants"), "", inline)
+    for key in ("@timestamp", "message"):
+        del event[key], expected[key]
+    assert event == expected
+    assert event["@host"] == callback.fqdn
+    assert event["session"] == callback.session
+    assert event["ansible_playbook"] == "site.yml"
+    assert event["ansible_task"] == "TASK: copy motd"
+
+
+def test_records_without_static_fields():
+    formatter = ants_logstash.StaticFieldsFormatter(
+        logstash.LogstashFormatterVersion1("ants")
+    )
+    event = format_event(formatter, "plain", {"status": "OK"})
+    assert event["status"] == "OK"
+    assert "@host_short" not in event
+
+
+def test_version_0_events_hold_the_static_fields(make_callback):
+    callback = make_callback(version=0)
+    data = callback.build_event("OK", "start")
+    assert ants_logstash.STATIC_FIELDS not in data
+    assert data["ansible_playbook"] == "site.yml"
+    assert data["session"] == callback.session
+
+
+def test_events_do_not_share_state(make_callback):
+    callback = make_callback()
+    first = callback.build_event("OK", "task", ansible_task="first")
+    first["status"] = "FAILED"
+    second = callback.build_event("OK", "task")
+    assert second["status"] == "OK"
+    assert "ansible_task" not in second
+    with pytest.raises(TypeError):
+        callback.event_template["status"] = "FAILED"
+
+
+def test_display_data_only_formats_when_verbose(make_callback, monkeypatch):
+    callback = make_callback()
+    messages = []
+    monkeypatch.setattr(callback._display, "vv", messages.append)
+    data = callback.build_task_event(Result(), "OK")
+
+    monkeypatch.setattr(callback._display, "verbosity", 1)
+    callback.display_data(data)
+    assert messages == []
+
+    monkeypatch.setattr(callback._display, "verbosity", 2)
+    callback.display_data(data)
+    assert "Logstash Callback:\t\tsession: %s" % callback.session in messages
+    assert "Logstash Callback:\t\tstatus: OK" in messages
+    assert not any(ants_logstash.STATIC_FIELDS in message for message in messages)
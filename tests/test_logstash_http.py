@@ -0,0 +1,188 @@
+import gzip
+import http.server
+import importlib.util
+import json
+import logging
+import os
+import socket
+import threading
+
+import pytest
+
+pytest.importorskip("ansible")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN = os.path.join(ROOT, "antslib", "plugins", "callback", "ants_logstash.py")
+
+
+def load_plugin():
+    spec = importlib.util.spec_from_file_location("ants_logstash", PLUGIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+ants_logstash = load_plugin()
+
+
+class EventFormatter(object):
+    """Format records as JSON like the logstash formatters do."""
+
+    def format(self, record):
+        return json.dumps({"message": record.getMessage()}).encode("utf-8")
+
+
+class RecordingHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        server.requests.append(
+            {
+                "connection": self.client_address,
+                "path": self.path,
+                "headers": dict(self.headers),
+                "body": body,
+            }
+        )
+        status = server.statuses.pop(0) if server.statuses else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """A local HTTP endpoint that records requests and answers with statuses."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RecordingHandler)
+    server.daemon_threads = True
+    server.requests = []
+    server.statuses = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_target(server, **kwargs):
+    return ants_logstash.HTTPTarget(
+        EventFormatter(), "127.0.0.1", server.server_address[1], **kwargs
+    )
+
+
+def record(message):
+    return logging.LogRecord("ants", logging.INFO, __file__, 0, message, (), None)
+
+
+def events(*messages):
+    return b"".join(b'{"message": "%s"}\n' % m.encode("utf-8") for m in messages)
+
+
+def closed_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_connection_is_kept_alive(server):
+    target = make_target(server, compress_level=0)
+    for i in range(5):
+        assert target.send(events("event %d" % i))
+    target.close()
+    assert len(server.requests) == 5
+    assert len(set(request["connection"] for request in server.requests)) == 1
+    assert target.requests == 5
+
+
+def test_gzip_ndjson_with_bulk_actions(server):
+    target = make_target(server, path="/_bulk", bulk_index="ants")
+    payload = events("first", "second")
+    assert target.send(payload)
+    target.close()
+
+    request = server.requests[0]
+    assert request["path"] == "/_bulk"
+    assert request["headers"]["Content-Type"] == "application/x-ndjson"
+    assert request["headers"]["Content-Encoding"] == "gzip"
+    assert target.sent_bytes == len(request["body"])
+    lines = gzip.decompress(request["body"]).splitlines(True)
+    action = b'{"index": {"_index": "ants"}}\n'
+    assert lines == [action, events("first"), action, events("second")]
+
+
+def test_client_error_is_dropped(server, tmp_path):
+    server.statuses = [400]
+    spool = ants_logstash.Spool(str(tmp_path / "spool"))
+    handler = ants_logstash.BatchingHandler(make_target(server), spool=spool)
+    handler.emit(record("rejected"))
+    handler.close()
+    assert len(server.requests) == 1
+    assert handler.target.rejected == 1
+    assert handler.spooled == 0
+    assert spool.segments() == []
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_server_error_is_spooled_and_replayed(server, tmp_path, status):
+    server.statuses = [status]
+    spool_dir = str(tmp_path / "spool")
+    handler = ants_logstash.BatchingHandler(
+        make_target(server, compress_level=0), spool=ants_logstash.Spool(spool_dir)
+    )
+    handler.emit(record("first"))
+    handler.close()
+    assert len(server.requests) == 1
+    assert handler.spooled == len(events("first"))
+
+    # The next run replays the spool before its own events
+    handler = ants_logstash.BatchingHandler(
+        make_target(server, compress_level=0), spool=ants_logstash.Spool(spool_dir)
+    )
+    handler.emit(record("second"))
+    handler.close()
+    assert handler.replayed == 1
+    assert [request["body"] for request in server.requests[1:]] == [
+        events("first"),
+        events("second"),
+    ]
+    assert ants_logstash.Spool(spool_dir).segments() == []
+
+
+def test_connection_error_is_spooled_and_replayed(server, tmp_path):
+    spool_dir = str(tmp_path / "spool")
+    target = ants_logstash.HTTPTarget(
+        EventFormatter(), "127.0.0.1", closed_port(), compress_level=0
+    )
+    handler = ants_logstash.BatchingHandler(
+        target, spool=ants_logstash.Spool(spool_dir)
+    )
+    handler.emit(record("offline"))
+    handler.close()
+    assert handler.spooled == len(events("offline"))
+
+    handler = ants_logstash.BatchingHandler(
+        make_target(server, compress_level=0), spool=ants_logstash.Spool(spool_dir)
+    )
+    handler.close()
+    assert handler.replayed == 1
+    assert [request["body"] for request in server.requests] == [events("offline")]
+
+
+def test_connection_closed_by_server_is_reopened(server):
+    target = make_target(server, compress_level=0)
+    assert target.send(events("first"))
+    # Like a server closing an idle kept-alive connection
+    target.connection.sock.shutdown(socket.SHUT_RDWR)
+    assert target.send(events("second"))
+    target.close()
+    assert [request["body"] for request in server.requests] == [
+        events("first"),
+        events("second"),
+    ]
+    assert len(set(request["connection"] for request in server.requests)) == 2
@@ -0,0 +1,200 @@
+"""Ship task results to Logstash flattened and bounded."""
+
+import importlib.util
+import json
+import os
+
+import pytest
+
+pytest.importorskip("ansible")
+pytest.importorskip("logstash")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN = os.path.join(ROOT, "antslib", "plugins", "callback", "ants_logstash.py")
+
+
+def load_plugin():
+    spec = importlib.util.spec_from_file_location("ants_logstash", PLUGIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+ants_logstash = load_plugin()
+
+
+class Task(object):
+    _uuid = "task-1"
+    action = "ansible.builtin.command"
+
+    def __str__(self):
+        return "TASK: run command"
+
+
+class Result(object):
+    def __init__(self, result):
+        self._task = Task()
+        self._result = result
+
+
+class Unwalkable(dict):
+    """A dict that fails the test if it is walked."""
+
+    def items(self):
+        pytest.fail("An excluded dict was walked")
+
+
+@pytest.fixture
+def make_callback(monkeypatch):
+    """Return a function creating a callback with LOGSTASH_RESULTS_* set."""
+    callbacks = []
+
+    def make_callback(**settings):
+        monkeypatch.setenv("LOGSTASH_TRANSPORT", "http")
+        monkeypatch.setenv("LOGSTASH_SERVER", "127.0.0.1")
+        monkeypatch.setenv("LOGSTASH_PORT", "9")
+        monkeypatch.setenv("LOGSTASH_RESULTS", "true")
+        for key, value in settings.items():
+            monkeypatch.setenv("LOGSTASH_RESULTS_%s" % key.upper(), str(value))
+        callback = ants_logstash.CallbackModule()
+        callbacks.append(callback)
+        return callback
+
+    yield make_callback
+    for callback in callbacks:
+        callback.handler.close(0)
+
+
+def result_fields(callback, result):
+    data = callback.build_task_event(Result(result), "OK")
+    return dict(
+        (key, value) for key, value in data.items() if key.startswith("ansible_result_")
+    )
+
+
+def test_results_are_opt_in(make_callback, monkeypatch):
+    callback = make_callback()
+    monkeypatch.setattr(callback, "ship_results", False)
+    assert result_fields(callback, {"changed": True, "rc": 0}) == {}
+
+
+def test_nested_results_are_flattened(make_callback):
+    callback = make_callback()
+    fields = result_fields(
+        callback,
+        {
+            "changed": True,
+            "rc": 0,
+            "diff": {"before": "old\n", "after": "new\n"},
+            "results": [{"item": "a", "rc": 0}, {"item": "b", "rc": 1}],
+            "packages": ["vim", "git"],
+        },
+    )
+    assert fields == {
+        "ansible_result_changed": True,
+        "ansible_result_rc": 0,
+        "ansible_result_diff_before": "old\n",
+        "ansible_result_diff_after": "new\n",
+        "ansible_result_results_0_item": "a",
+        "ansible_result_results_0_rc": 0,
+        "ansible_result_results_1_item": "b",
+        "ansible_result_results_1_rc": 1,
+        "ansible_result_packages": ["vim", "git"],
+    }
+
+
+def test_default_exclude(make_callback):
+    callback = make_callback()
+    fields = result_fields(
+        callback,
+        {
+            "_ansible_no_log": False,
+            "invocation": Unwalkable(module_args={"password": "secret"}),
+            "ansible_facts": Unwalkable(),
+            "stdout": "a\nb",
+            "stdout_lines": ["a", "b"],
+            "stderr_lines": [],
+        },
+    )
+    assert fields == {"ansible_result_stdout": "a\nb"}
+
+
+def test_include_and_exclude_dotted_keys(make_callback):
+    callback = make_callback(include="diff.*,rc", exclude="diff.after")
+    fields = result_fields(
+        callback,
+        {"rc": 2, "stdout": "x", "diff": {"before": "old", "after": "new"}},
+    )
+    assert fields == {"ansible_result_rc": 2, "ansible_result_diff_before": "old"}
+
+
+def test_max_depth(make_callback):
+    callback = make_callback(max_depth=2)
+    deep = "leaf"
+    # Far deeper than the recursion limit
+    for _ in range(100000):
+        deep = {"nested": deep}
+    fields = result_fields(callback, {"a": {"b": 1, "c": {"d": 2}}, "deep": deep})
+    assert fields == {
+        "ansible_result_a_b": 1,
+        "ansible_result_a_c": ants_logstash.DEPTH_MARKER,
+        "ansible_result_deep_nested": ants_logstash.DEPTH_MARKER,
+        "ansible_result_truncated": ["a.c", "deep.nested"],
+    }
+
+
+def test_long_strings_are_cut(make_callback):
+    callback = make_callback(max_field_bytes=100)
+    fields = result_fields(
+        callback, {"stdout": "x" * 50000000, "msg": "é" * 100, "rc": 0}
+    )
+    stdout = fields["ansible_result_stdout"]
+    assert stdout.endswith(ants_logstash.TRUNCATION_MARKER)
+    assert len(stdout.encode("utf-8")) <= 100
+    # Cut on a character boundary
+    msg = fields["ansible_result_msg"]
+    assert len(msg.encode("utf-8")) <= 100
+    assert set(msg[: -len(ants_logstash.TRUNCATION_MARKER)]) == {"é"}
+    assert fields["ansible_result_truncated"] == ["stdout", "msg"]
+    assert fields["ansible_result_rc"] == 0
+
+
+def test_lists_of_scalars_are_cut(make_callback):
+    callback = make_callback(max_field_bytes=100)
+    fields = result_fields(
+        callback, {"numbers": list(range(2000000)), "mixed": [1, "two", 3.0, None]}
+    )
+    numbers = fields["ansible_result_numbers"]
+    assert numbers == list(range(len(numbers)))
+    assert 0 < len(json.dumps(numbers)) <= 100
+    assert fields["ansible_result_mixed"] == ["1", "two", "3.0", "None"]
+    assert fields["ansible_result_truncated"] == ["numbers"]
+
+
+def test_event_size_is_bounded(make_callback):
+    callback = make_callback(max_field_bytes=1000, max_event_bytes=5000)
+    result = dict(("key%06d" % i, "v" * 470) for i in range(500000))
+    fields = result_fields(callback, result)
+    truncated = fields.pop("ansible_result_truncated")
+    # Exactly 10 fields of 500 bytes, including the separator, fit
+    assert len(fields) == 10
+    assert len(json.dumps(fields, separators=(",", ":"))[1:-1]) == 5000 - 1
+    # The walk stopped with the budget used up
+    assert truncated == ["..."]
+
+
+def test_truncated_keys_are_capped(make_callback):
+    callback = make_callback(max_field_bytes=100, max_event_bytes=1000000)
+    result = dict(("key%d" % i, "x" * 1000) for i in range(100))
+    fields = result_fields(callback, result)
+    assert len(fields) == 101
+    truncated = fields["ansible_result_truncated"]
+    assert len(truncated) == ants_logstash.MAX_TRUNCATED_KEYS
+    assert truncated[:2] == ["key0", "key1"]
+    assert truncated[-1] == "..."
+
+
+def test_fields_that_do_not_fit_are_skipped(make_callback):
+    callback = make_callback(max_field_bytes=4000, max_event_bytes=1000)
+    fields = result_fields(callback, {"stdout": "x" * 3000, "rc": 1})
+    assert fields == {"ansible_result_rc": 1, "ansible_result_truncated": ["stdout"]}
@@ -0,0 +1,143 @@
+import subprocess
+import sys
+import textwrap
+import threading
+
+import pytest
+from antslib import proc_reader
+
+# A fake ansible-pull, writes what the test passes as Python code
+FAKE_ANSIBLE_PULL = textwrap.dedent(
+    """
+    import os, sys, time
+    out = sys.stdout.buffer
+    err = sys.stderr.buffer
+    def write(stream, data):
+        stream.write(data)
+        stream.flush()
+    """
+)
+
+
+def fake_ansible_pull(code):
+    return subprocess.Popen(
+        [sys.executable, "-c", FAKE_ANSIBLE_PULL + textwrap.dedent(code)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+
+def read_all(proc, timeout=30, **kwargs):
+    """Return the lines of proc, failing instead of hanging on a deadlock."""
+    lines = []
+
+    def read():
+        lines.extend(proc_reader.read_lines(proc, **kwargs))
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    reader.join(timeout)
+    if reader.is_alive():
+        proc.kill()
+        pytest.fail("Reading the output did not finish within %ss" % timeout)
+    assert proc.wait() == 0
+    return lines
+
+
+def stream(lines, name):
+    return [line for stream_name, line in lines if stream_name == name]
+
+
+def test_flooded_stderr_does_not_block_stdout():
+    # Far more than a pipe buffer on stderr before stdout is written
+    proc = fake_ansible_pull(
+        """
+        for i in range(50000):
+            err.write(b"[DEPRECATION WARNING]: line %d\\n" % i)
+        err.flush()
+        for i in range(1000):
+            out.write(b"TASK [task %d] ***\\n" % i)
+        """
+    )
+    lines = read_all(proc)
+    stderr = stream(lines, "stderr")
+    stdout = stream(lines, "stdout")
+    assert len(stderr) == 50000
+    assert stderr[-1] == "[DEPRECATION WARNING]: line 49999\n"
+    assert stdout == ["TASK [task %d] ***\n" % i for i in range(1000)]
+
+
+def test_high_output_rate_on_both_streams():
+    proc = fake_ansible_pull(
+        """
+        for i in range(100000):
+            out.write(b"ok: [localhost] %d\\n" % i)
+            err.write(b"warning %d\\n" % i)
+        """
+    )
+    lines = read_all(proc)
+    numbers = range(100000)
+    assert stream(lines, "stdout") == ["ok: [localhost] %d\n" % i for i in numbers]
+    assert stream(lines, "stderr") == ["warning %d\n" % i for i in numbers]
+
+
+def test_partial_lines_are_joined():
+    proc = fake_ansible_pull(
+        """
+        write(out, b"ok: [local")
+        time.sleep(0.2)
+        write(out, b"host]\\nchanged: ")
+        time.sleep(0.2)
+        write(out, b"[localhost]\\nno newline")
+        """
+    )
+    assert stream(read_all(proc), "stdout") == [
+        "ok: [localhost]\n",
+        "changed: [localhost]\n",
+        "no newline",
+    ]
+
+
+def test_invalid_and_split_utf8():
+    proc = fake_ansible_pull(
+        """
+        write(err, b"invalid \\xff\\xfe byte\\n")
+        # The two bytes of an umlaut in separate reads
+        write(out, "gr\\u00fc".encode("utf-8")[:-1])
+        time.sleep(0.2)
+        write(out, "\\u00fc".encode("utf-8")[-1:] + b"n\\n")
+        """
+    )
+    lines = read_all(proc)
+    assert stream(lines, "stderr") == ["invalid �� byte\n"]
+    assert stream(lines, "stdout") == ["grün\n"]
+
+
+def test_long_lines_are_truncated():
+    proc = fake_ansible_pull(
+        """
+        for _ in range(100):
+            out.write(b"x" * 10000)
+        out.write(b"\\nnext line\\n")
+        """
+    )
+    lines = read_all(proc, max_line_length=1000, chunk_size=4096)
+    assert stream(lines, "stdout") == [
+        "x" * 1000 + proc_reader.TRUNCATED + "\n",
+        "next line\n",
+    ]
+
+
+def test_line_buffer_keeps_memory_bounded():
+    buffer = proc_reader.LineBuffer(max_line_length=100)
+    assert buffer.feed(b"y" * 150) == ["y" * 100 + proc_reader.TRUNCATED + "\n"]
+    for _ in range(1000):
+        assert buffer.feed(b"y" * 1000) == []
+        assert buffer.pending == ""
+    assert buffer.feed(b"y\nz\n") == ["z\n"]
+
+
+def test_line_buffer_keeps_line_of_max_length():
+    buffer = proc_reader.LineBuffer(max_line_length=10)
+    assert buffer.feed(b"0123456789\n") == ["0123456789\n"]
+    assert buffer.feed(b"", final=True) == []
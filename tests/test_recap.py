@@ -0,0 +1,180 @@
+"""Take the result of a run from the recap of the ants_recap callback."""
+
+import importlib.util
+import json
+import os
+
+import pytest
+from antslib import status
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN = os.path.join(ROOT, "antslib", "plugins", "callback", "ants_recap.py")
+
+COUNTERS = dict((key, 0) for key in status.RECAP_COUNTERS)
+
+
+def host_stats(**stats):
+    return dict(COUNTERS, **stats)
+
+
+def run_recap(**hosts):
+    return {"version": status.RECAP_VERSION, "plays": 2, "hosts": hosts, "tasks": []}
+
+
+def load_plugin():
+    pytest.importorskip("ansible")
+    spec = importlib.util.spec_from_file_location("ants_recap", PLUGIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Task(object):
+    def __init__(self, name, action="ansible.builtin.copy"):
+        self._uuid = "uuid-%s" % name
+        self.name = name
+        self.action = action
+
+    def get_name(self):
+        return self.name
+
+
+class Host(object):
+    def __init__(self, name):
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+
+class Result(object):
+    def __init__(self, task, host, changed=False):
+        self._task = task
+        self._host = Host(host)
+        self.changed = changed
+
+    def is_changed(self):
+        return self.changed
+
+
+class Stats(object):
+    """AggregateStats of two hosts."""
+
+    processed = {"web1": 1, "db1": 1}
+    summaries = {
+        "web1": {"ok": 3, "changed": 1, "failures": 0, "skipped": 1, "ignored": 1},
+        "db1": {"ok": 1, "changed": 0, "failures": 1, "unreachable": 0},
+    }
+
+    def summarize(self, host):
+        return self.summaries[host]
+
+
+@pytest.mark.parametrize(
+    "hosts, client_status",
+    [
+        ({"web1": host_stats(ok=3), "db1": host_stats(ok=2)}, "ok"),
+        ({"web1": host_stats(ok=3), "db1": host_stats(changed=1)}, "changed"),
+        ({"web1": host_stats(changed=2), "db1": host_stats(failed=1)}, "failed"),
+        ({"web1": host_stats(ok=1), "db1": host_stats(unreachable=1)}, "failed"),
+        ({"web1": host_stats(ok=1, ignored=1, rescued=1)}, "ok"),
+        ({}, "failed"),
+    ],
+)
+def test_client_status(hosts, client_status):
+    assert status.client_status(run_recap(**hosts)) == client_status
+
+
+def test_missing_recap_failed():
+    assert status.client_status(None) == "failed"
+
+
+def test_counters_and_lines_of_all_hosts():
+    recap = run_recap(
+        web1=host_stats(ok=3, changed=1, skipped=2), db1=host_stats(ok=1, failed=1)
+    )
+    counters = status.recap_counters(recap)
+    assert counters == dict(COUNTERS, ok=4, changed=1, skipped=2, failed=1)
+    assert status.recap_lines(recap) == [
+        "db1 : ok=1 changed=0 unreachable=0 failed=1 skipped=0 rescued=0 ignored=0",
+        "web1 : ok=3 changed=1 unreachable=0 failed=0 skipped=2 rescued=0 ignored=0",
+    ]
+
+
+def test_read_run_recap(tmp_path):
+    recap_file = str(tmp_path / "run_recap.json")
+    assert status.read_run_recap(recap_file) is None
+
+    with open(recap_file, "w") as f:
+        f.write('{"version": 1, "hosts"')
+    assert status.read_run_recap(recap_file) is None
+
+    for content in ([], dict(run_recap(), version=status.RECAP_VERSION + 1)):
+        with open(recap_file, "w") as f:
+            json.dump(content, f)
+        assert status.read_run_recap(recap_file) is None
+
+    with open(recap_file, "w") as f:
+        json.dump(run_recap(web1=host_stats(ok=1)), f)
+    assert status.read_run_recap(recap_file)["hosts"]["web1"]["ok"] == 1
+
+
+def test_callback_writes_recap(tmp_path, monkeypatch):
+    recap_file = str(tmp_path / "run_recap.json")
+    monkeypatch.setenv("ANTS_RECAP_FILE", recap_file)
+    plugin = load_plugin()
+    callback = plugin.CallbackModule()
+    assert not callback.disabled
+
+    copy = Task("copy motd")
+    service = Task("restart web", "ansible.builtin.service")
+    for _ in range(2):
+        callback.v2_playbook_on_play_start(None)
+    callback.v2_playbook_on_task_start(copy, False)
+    callback.v2_runner_on_ok(Result(copy, "web1", changed=True))
+    callback.v2_runner_on_failed(Result(copy, "db1"))
+    callback.v2_runner_on_skipped(Result(copy, "db2"))
+    callback.v2_runner_on_unreachable(Result(copy, "db3"))
+    callback.v2_playbook_on_handler_task_start(service)
+    callback.v2_runner_on_failed(Result(service, "web1"), ignore_errors=True)
+    callback.v2_runner_on_ok(Result(service, "web2"))
+    callback.v2_playbook_on_stats(Stats())
+
+    recap = status.read_run_recap(recap_file)
+    assert recap["plays"] == 2
+    assert recap["end_time"] >= recap["start_time"]
+    assert recap["hosts"] == {
+        "web1": host_stats(ok=3, changed=1, skipped=1, ignored=1),
+        "db1": host_stats(ok=1, failed=1),
+    }
+    results = [(task["task"], task["host"], task["status"]) for task in recap["tasks"]]
+    assert results == [
+        ("copy motd", "web1", "changed"),
+        ("copy motd", "db1", "failed"),
+        ("copy motd", "db2", "skipped"),
+        ("copy motd", "db3", "unreachable"),
+        ("restart web", "web1", "ignored"),
+        ("restart web", "web2", "ok"),
+    ]
+    assert recap["tasks"][4]["action"] == "ansible.builtin.service"
+    assert all(task["duration"] >= 0 for task in recap["tasks"])
+    assert status.client_status(recap) == "failed"
+    # Only the recap is left, no temporary file
+    assert os.listdir(str(tmp_path)) == ["run_recap.json"]
+
+
+def test_callback_without_recap_file_is_disabled(monkeypatch):
+    monkeypatch.delenv("ANTS_RECAP_FILE", raising=False)
+    assert load_plugin().CallbackModule().disabled
+
+
+def test_callback_warns_if_recap_cannot_be_written(tmp_path, monkeypatch):
+    recap_file = str(tmp_path / "missing" / "run_recap.json")
+    monkeypatch.setenv("ANTS_RECAP_FILE", recap_file)
+    callback = load_plugin().CallbackModule()
+    warnings = []
+    monkeypatch.setattr(callback._display, "warning", warnings.append)
+    callback.v2_playbook_on_stats(Stats())
+    assert not os.path.exists(recap_file)
+    assert len(warnings) == 1
+    assert recap_file in warnings[0]
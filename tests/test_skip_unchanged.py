@@ -0,0 +1,213 @@
+"""Skip ansible-pull if the fingerprint of a run did not change."""
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs bin/ants with the config below config_dir
+DRIVER = textwrap.dedent(
+    """
+    import os
+    import runpy
+    import sys
+
+    from antslib import configer, pre_run_checker
+
+    config_dir = sys.argv[1]
+    configer.CONFIG_PATH = config_dir
+    configer.CONFIG_DROP_IN_PATH = os.path.join(config_dir, "conf.d")
+    configer.is_root = lambda: True
+    # The checks need ssh and a remote repository
+    pre_run_checker.check_run_requirements = lambda args, env: None
+
+    sys.argv = ["ants"] + sys.argv[2:]
+    runpy.run_path(os.path.join("bin", "ants"), run_name="__main__")
+    """
+)
+
+# Counts its runs and fails the hosts if the file "fail" exists
+ANSIBLE_PULL = textwrap.dedent(
+    """\
+    #!{python}
+    import json, os, sys
+    directory = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(directory, "runs"), "a") as f:
+        f.write("run\\n")
+    failed = int(os.path.exists(os.path.join(directory, "fail")))
+    recap = {{
+        "version": 1,
+        "plays": 1,
+        "hosts": {{"localhost": {{"ok": 3, "changed": 0, "failed": failed}}}},
+        "tasks": [],
+    }}
+    with open(os.environ["ANTS_RECAP_FILE"], "w") as f:
+        json.dump(recap, f)
+    print("PLAY [all]")
+    sys.exit(2 if failed else 0)
+    """
+)
+
+
+def git(*args):
+    subprocess.run(
+        ["git", "-c", "user.name=ants", "-c", "user.email=ants@example.com"]
+        + list(args),
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+class Ants(object):
+    """Run ants against a local bare repository."""
+
+    def __init__(self, tmp_path):
+        self.tmp_path = tmp_path
+        self.config_dir = tmp_path / "etc"
+        (self.config_dir / "conf.d").mkdir(parents=True)
+        (self.config_dir / "ants.cfg").write_text("[main]\nskip_unchanged = True\n")
+
+        self.work = tmp_path / "work"
+        git("init", "-q", str(self.work))
+        self.commit("- hosts: all\n")
+        self.repository = tmp_path / "repository.git"
+        git("clone", "-q", "--bare", str(self.work), str(self.repository))
+        git("-C", str(self.work), "remote", "add", "origin", str(self.repository))
+        self.branch = subprocess.run(
+            ["git", "-C", str(self.work), "symbolic-ref", "--short", "HEAD"],
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout.strip()
+
+        ansible_pull = tmp_path / "ansible-pull"
+        ansible_pull.write_text(ANSIBLE_PULL.format(python=sys.executable))
+        ansible_pull.chmod(0o755)
+        self.inventory = tmp_path / "inventory.json"
+        self.inventory.write_text(json.dumps({"all": {"hosts": ["localhost"]}}))
+        (tmp_path / "driver.py").write_text(DRIVER)
+
+        self.log_dir = tmp_path / "log"
+        self.env = dict(os.environ)
+        self.env["PYTHONPATH"] = os.pathsep.join(
+            filter(None, [ROOT, self.env.get("PYTHONPATH")])
+        )
+        for key in list(self.env):
+            if key.startswith("ANTS_"):
+                del self.env[key]
+        self.env.update(
+            ANTS_MAIN_LOG_DIR=str(self.log_dir),
+            ANTS_MAIN_ANSIBLE_PULL_EXE=str(ansible_pull),
+            ANTS_MAIN_GIT_REPOSITORY=str(self.repository),
+            ANTS_MAIN_BRANCH=self.branch,
+            ANTS_MAIN_DESTINATION=str(tmp_path / "checkout"),
+            ANTS_MAIN_CONTROL_SOCKET=str(tmp_path / "ants.sock"),
+        )
+
+    def commit(self, playbook):
+        (self.work / "site.yml").write_text(playbook)
+        git("-C", str(self.work), "add", "site.yml")
+        git("-C", str(self.work), "commit", "-q", "-m", "playbook")
+
+    def push(self, playbook):
+        self.commit(playbook)
+        git("-C", str(self.work), "push", "-q", "origin", self.branch)
+
+    def runs(self):
+        try:
+            return len((self.tmp_path / "runs").read_text().splitlines())
+        except OSError:
+            return 0
+
+    def run(self):
+        """Run ants and return the status snapshot and whether it ran."""
+        runs = self.runs()
+        proc = subprocess.run(
+            [
+                sys.executable,
+                str(self.tmp_path / "driver.py"),
+                str(self.config_dir),
+                "-i",
+                str(self.inventory),
+            ],
+            cwd=ROOT,
+            env=self.env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+        assert proc.returncode == 0, proc.stdout
+        with open(self.log_dir / "status.json") as f:
+            snapshot = json.load(f)
+        return snapshot, self.runs() > runs
+
+
+@pytest.fixture
+def ants(tmp_path):
+    return Ants(tmp_path)
+
+
+def test_unchanged_run_is_skipped(ants):
+    snapshot, ran = ants.run()
+    assert ran
+    assert snapshot["skipped"] is False
+    assert snapshot["run_reason"] == "no previous successful run"
+
+    snapshot, ran = ants.run()
+    assert not ran
+    assert snapshot["skipped"] is True
+    assert snapshot["status"] == "ok"
+    assert snapshot["run_reason"].startswith("unchanged since run")
+    assert any("unchanged since run" in line for line in snapshot["recap"])
+
+
+def test_new_commit_runs(ants):
+    ants.run()
+    ants.push("- hosts: all\n  tasks: []\n")
+    snapshot, ran = ants.run()
+    assert ran
+    assert snapshot["run_reason"] == "fingerprint changed"
+
+
+def test_config_change_runs(ants):
+    ants.run()
+    (ants.config_dir / "conf.d" / "10-site.cfg").write_text("[main]\nclone_depth = 2\n")
+    snapshot, ran = ants.run()
+    assert ran
+    assert snapshot["run_reason"] == "fingerprint changed"
+
+
+def test_failed_run_is_not_skipped(ants):
+    (ants.tmp_path / "fail").touch()
+    snapshot, ran = ants.run()
+    assert ran
+    assert snapshot["status"] == "failed"
+
+    (ants.tmp_path / "fail").unlink()
+    snapshot, ran = ants.run()
+    assert ran
+    assert snapshot["run_reason"] == "no previous successful run"
+
+    # A failed run after a change does not record the new fingerprint
+    ants.push("- hosts: all\n  tasks: []\n")
+    (ants.tmp_path / "fail").touch()
+    ants.run()
+    (ants.tmp_path / "fail").unlink()
+    snapshot, ran = ants.run()
+    assert ran
+    assert snapshot["run_reason"] == "fingerprint changed"
+
+
+def test_expired_max_skip_interval_runs(ants):
+    (ants.config_dir / "conf.d" / "10-site.cfg").write_text(
+        "[main]\nmax_skip_interval = 0\n"
+    )
+    ants.run()
+    snapshot, ran = ants.run()
+    assert ran
+    assert snapshot["run_reason"].startswith("last full run")